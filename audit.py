@@ -0,0 +1,161 @@
+'''
+登录审计模块
+记录登录、login_token 签发和修改用户名事件，用于数据分析和异常排查：
+1. 请求路径只把事件追加到进程内队列，不做任何 I/O；队列满时直接丢弃并计数，不会拖慢请求
+2. 后台任务每 AUDIT_FLUSH_INTERVAL 秒或攒够 AUDIT_BATCH_SIZE 条时批量写出：
+   - AUDIT_SINK=redis：一次流水线把整批事件 XADD 到 Redis Stream AUDIT_STREAM（近似裁剪到 AUDIT_STREAM_MAXLEN）
+   - AUDIT_SINK=file：在线程中以 NDJSON 追加写入 AUDIT_FILE_PATH，超过 AUDIT_FILE_MAX_BYTES 时轮转
+3. audit_consumer.py 从 Stream 或文件读取事件，批量写入审计表 tb_login_audit，
+   登录请求本身不写审计表
+
+每个事件带有进程内唯一的 event_id，消费者按 event_id 去重，重复投递不会产生重复行。
+'''
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from config import settings, WORKERS_ENV
+from log_config import get_log_context
+from metrics import AUDIT_WRITTEN, AUDIT_DROPPED
+from memprof import register_cache
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 审计事件类型
+LOGIN = "login"
+TOKEN_ISSUE = "token_issue"
+NAME_CHANGE = "name_change"
+
+# 写入 Stream / 文件的字段，与 tb_login_audit 的列一一对应
+FIELDS = ("event_id", "event", "user_id", "phone", "ip", "code", "request_id", "detail", "created_at")
+
+
+class AuditLog:
+    """审计事件的内存队列与批量写出"""
+
+    def __init__(self):
+        self._queue: Deque[Dict[str, str]] = deque()
+        self._prefix = os.urandom(6).hex()  # event_id 前缀，每个进程不同
+        self._seq = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._path = ""
+
+    @property
+    def enabled(self) -> bool:
+        # 内存替身不支持 Stream，压测时和未配置 Redis 时只支持写文件
+        if settings.audit_sink == "redis":
+            return not settings.stand_in_backends and redis_client.client is not None
+        return settings.audit_sink == "file"
+
+    def record(self, event: str, user_id: str = "", phone: str = "", ip: Optional[str] = None,
+               code: int = 200, detail: Optional[Dict[str, Any]] = None):
+        """
+        记录一个审计事件，只在内存中入队
+
+        Args:
+            event: 事件类型（LOGIN / TOKEN_ISSUE / NAME_CHANGE）
+            user_id: 用户ID
+            phone: 手机号
+            ip: 客户端 IP
+            code: 返回码
+            detail: 附加信息
+        """
+        if self._task is None:
+            return
+        if len(self._queue) >= settings.audit_queue_size:
+            AUDIT_DROPPED.inc("queue_full")
+            return
+        self._queue.append({
+            "event_id": f"{self._prefix}{next(self._seq):x}",
+            "event": event,
+            "user_id": user_id or "",
+            "phone": phone or "",
+            "ip": ip or "",
+            "code": str(code),
+            "request_id": get_log_context().get("request_id", ""),
+            "detail": json.dumps(detail, ensure_ascii=False, separators=(",", ":")) if detail else "",
+            "created_at": str(int(time.time() * 1000)),
+        })
+        if len(self._queue) >= settings.audit_batch_size:
+            self._wakeup.set()
+
+    async def _write_redis(self, batch: List[Dict[str, str]]):
+        async with redis_client.client.pipeline(transaction=False) as pipe:
+            for event in batch:
+                pipe.xadd(settings.audit_stream, event, maxlen=settings.audit_stream_maxlen, approximate=True)
+            await pipe.execute()
+
+    def _write_file(self, batch: List[Dict[str, str]]):
+        """在线程中执行：追加写入，必要时先轮转"""
+        data = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in batch)
+        data = data.encode("utf-8")
+        try:
+            size = os.path.getsize(self._path)
+        except OSError:
+            size = 0
+        if size and size + len(data) > settings.audit_file_max_bytes:
+            # audit.ndjson -> audit.ndjson.1 -> ... -> audit.ndjson.<AUDIT_FILE_BACKUPS>，最旧的被覆盖
+            for index in range(settings.audit_file_backups - 1, 0, -1):
+                source = f"{self._path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self._path}.{index + 1}")
+            if settings.audit_file_backups > 0:
+                os.replace(self._path, f"{self._path}.1")
+            else:
+                os.remove(self._path)
+        with open(self._path, "ab") as f:
+            f.write(data)
+
+    async def flush(self):
+        """写出队列中的全部事件，写出失败的批次丢弃并计数"""
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), settings.audit_batch_size))]
+            try:
+                if settings.audit_sink == "redis":
+                    await self._write_redis(batch)
+                else:
+                    await asyncio.to_thread(self._write_file, batch)
+                AUDIT_WRITTEN.inc(value=len(batch))
+            except Exception as e:
+                AUDIT_DROPPED.inc("write_error", value=len(batch))
+                logger.warning("Failed to write %s audit events: %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.audit_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is not None or not self.enabled:
+            return
+        self._path = settings.audit_file_path
+        # 多 worker 时每个进程写入独立的文件，避免并发追加和轮转互相干扰
+        if int(os.environ.get(WORKERS_ENV, "1")) > 1:
+            self._path = f"{self._path}.{os.getpid()}"
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务并写出剩余的事件"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+
+
+# 全局审计实例
+audit_log = AuditLog()
+register_cache("audit.queue", lambda: len(audit_log._queue))
@@ -0,0 +1,135 @@
+'''
+审计事件入库工具
+把 audit.py 写出的审计事件批量写入 tb_login_audit：
+
+    python audit_consumer.py stream                 # 持续消费 Redis Stream（消费组 AUDIT_CONSUMER_GROUP）
+    python audit_consumer.py stream --once          # 消费到没有新事件后退出
+    python audit_consumer.py file audit.ndjson.3 audit.ndjson.2   # 导入轮转后的审计文件
+
+Stream 模式按 至少一次 语义处理：一批事件写入数据库后才 XACK，
+启动时先认领其他消费者超过 --claim-idle 毫秒未确认的事件；重复写入按 event_id 去重。
+审计表可以放在独立的 MySQL 实例上，运行消费者时把 DB_HOST 等配置指向该实例即可。
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import Dict, List, Tuple
+from config import settings
+from mysql_client import init_db, close_db, insert_audit_events
+from redis_client import init_redis, close_redis, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+async def _ensure_group():
+    try:
+        await redis_client.client.xgroup_create(settings.audit_stream, settings.audit_consumer_group, id="0", mkstream=True)
+    except Exception as e:
+        # 消费组已存在
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _load(entries: List[Tuple[str, Dict[str, str]]]) -> int:
+    """写入一批 Stream 条目并确认"""
+    if not entries:
+        return 0
+    inserted = await insert_audit_events([fields for _, fields in entries])
+    await redis_client.client.xack(settings.audit_stream, settings.audit_consumer_group, *[entry_id for entry_id, _ in entries])
+    return inserted
+
+
+async def consume_stream(batch_size: int, claim_idle: int, once: bool) -> int:
+    """消费 Stream 中的审计事件，返回写入的行数"""
+    await _ensure_group()
+    client = redis_client.client
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    inserted = 0
+
+    # 先处理其他消费者（例如崩溃的进程）领取后一直未确认的事件
+    cursor = "0-0"
+    while True:
+        result = await client.xautoclaim(
+            settings.audit_stream, settings.audit_consumer_group, consumer,
+            min_idle_time=claim_idle, start_id=cursor, count=batch_size
+        )
+        cursor, entries = result[0], result[1]
+        inserted += await _load(entries)
+        if cursor == "0-0":
+            break
+
+    while True:
+        result = await client.xreadgroup(
+            settings.audit_consumer_group, consumer, {settings.audit_stream: ">"},
+            count=batch_size, block=None if once else 5000
+        )
+        entries = result[0][1] if result else []
+        if not entries:
+            if once:
+                break
+            continue
+        inserted += await _load(entries)
+        logger.info("Audit events loaded: batch=%s, total=%s", len(entries), inserted)
+    return inserted
+
+
+async def load_files(paths: List[str], batch_size: int) -> int:
+    """导入审计文件，返回写入的行数"""
+    inserted = 0
+    for path in paths:
+        batch = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    inserted += await insert_audit_events(batch)
+                    batch = []
+        inserted += await insert_audit_events(batch)
+        logger.info("Audit file loaded: %s, total=%s", path, inserted)
+    return inserted
+
+
+async def main(args: argparse.Namespace):
+    await init_db(minsize=1, maxsize=1)
+    start_time = time.time()
+    try:
+        if args.command == "stream":
+            await init_redis()
+            try:
+                count = await consume_stream(args.batch_size, args.claim_idle, args.once)
+            finally:
+                await close_redis()
+        else:
+            count = await load_files(args.files, args.batch_size)
+        logger.info("入库完成: %s 条审计事件, 耗时: %.2fs", count, time.time() - start_time)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="审计事件入库工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stream_parser = subparsers.add_parser("stream", help="消费 Redis Stream")
+    stream_parser.add_argument("--once", action="store_true", help="没有新事件时退出")
+    stream_parser.add_argument("--claim-idle", type=int, default=60000, help="认领超过该时间（毫秒）未确认的事件")
+
+    file_parser = subparsers.add_parser("file", help="导入审计文件")
+    file_parser.add_argument("files", nargs="+", help="审计文件路径（按时间从旧到新）")
+
+    for sub_parser in (stream_parser, file_parser):
+        sub_parser.add_argument("--batch-size", type=int, default=1000, help="每条多行 INSERT 语句包含的事件数")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr
+    )
+    asyncio.run(main(parser.parse_args()))
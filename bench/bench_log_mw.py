@@ -0,0 +1,161 @@
+'''
+请求日志中间件性能对比：无中间件 / 旧版 BaseHTTPMiddleware / 纯 ASGI 实现
+
+直接在进程内调用 ASGI 应用（不经过网络），衡量中间件自身带来的开销：
+1. JSON 接口的吞吐量（requests/sec）
+2. 流式响应的首字节时间，用于验证新中间件不会缓冲整个响应
+
+用法：python bench/bench_log_mw.py [--requests 5000] [--concurrency 50]
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 配置中的必填项，未设置时用占位值，保证不依赖 .env 也能运行
+for key, value in {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from models import RequestModel, ResponseModel
+from log_config import setup_logging
+from log_mw import RequestLoggingMiddleware
+from legacy_log_mw import LegacyRequestLoggingMiddleware
+
+
+def build_app(middleware) -> FastAPI:
+    """构建与登录接口形态相同的测试应用"""
+    app = FastAPI()
+
+    @app.post("/api/v1/login")
+    async def login(request: RequestModel):
+        return ResponseModel(message=request.content)
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(5):
+                yield f"chunk-{i}\n"
+                await asyncio.sleep(0.01)
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def call(app, method: str, path: str, body: bytes = b"", on_first_chunk=None) -> int:
+    """以 ASGI 方式发起一次请求，返回状态码"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    first_chunk_seen = False
+
+    async def send(message):
+        nonlocal status, first_chunk_seen
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if on_first_chunk is not None and message.get("body") and not first_chunk_seen:
+                first_chunk_seen = True
+                on_first_chunk()
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def bench_throughput(app, total: int, concurrency: int) -> float:
+    """并发发起 total 次登录请求，返回 requests/sec"""
+    body = json.dumps({
+        "event_name": "setAppInfo",
+        "content": json.dumps({"login_token": "x" * 32, "app_id": "app", "app_key": "key",
+                               "volc_ak": "ak", "volc_sk": "sk"}),
+    }).encode()
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await call(app, "POST", "/api/v1/login", body)
+
+    # 预热
+    await call(app, "POST", "/api/v1/login", body)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def bench_first_byte(app) -> float:
+    """返回流式响应的首字节时间（毫秒）"""
+    start = time.perf_counter()
+    first_byte = []
+    await call(app, "GET", "/stream", on_first_chunk=lambda: first_byte.append(time.perf_counter()))
+    return (first_byte[0] - start) * 1000
+
+
+async def main(args):
+    results = {}
+    for name, middleware in [
+        ("none", None),
+        ("legacy", LegacyRequestLoggingMiddleware),
+        ("asgi", RequestLoggingMiddleware),
+    ]:
+        app = build_app(middleware)
+        rps = await bench_throughput(app, args.requests, args.concurrency)
+        ttfb = await bench_first_byte(app)
+        results[name] = {"requests_per_sec": round(rps, 1), "stream_first_byte_ms": round(ttfb, 2)}
+        print(f"{name:8s} {rps:10.1f} req/s   stream first byte: {ttfb:6.2f} ms", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="请求日志中间件性能对比")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+
+    # 开启 INFO 日志并输出到空设备，使日志格式化开销计入测试结果
+    setup_logging(logging.INFO, stream=open(os.devnull, "w"))
+    asyncio.run(main(parser.parse_args()))
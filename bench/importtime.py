@@ -0,0 +1,147 @@
+'''
+启动导入耗时基准
+
+使用 python -X importtime 在子进程中导入服务入口模块，把各模块的自身耗时按顶层包汇总，
+并与 bench/importtime_baseline.json 中记录的基线对比：
+1. 总导入耗时超过基线的 (1 + tolerance) 倍
+2. 出现基线中没有、且耗时超过 --min-ms 的新顶层包
+3. 导入了基线中标记为禁止在启动时导入的包（如延迟加载的火山引擎 SDK）
+以上任一情况视为回归，进程以状态码 1 退出。
+
+用法：
+    python bench/importtime.py [--runs 5] [--top 15]
+    python bench/importtime.py --update-baseline   # 确认改动后刷新基线
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "importtime_baseline.json")
+
+# 配置中的必填项，未设置时用占位值，保证不依赖 .env 也能导入
+PLACEHOLDER_ENV = {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    在子进程中导入 module 一次
+
+    Returns:
+        Tuple[float, Dict[str, float]]: (总耗时 ms, 按顶层包汇总的自身耗时 ms)
+    """
+    env = dict(os.environ)
+    for key, value in PLACEHOLDER_ENV.items():
+        env.setdefault(key, value)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    total = 0.0
+    packages: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        # 格式：import time:   self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, packages
+
+
+def profile(module: str, runs: int) -> dict:
+    """多次测量取中位数，降低磁盘缓存和调度抖动的影响"""
+    totals = []
+    samples: Dict[str, list] = defaultdict(list)
+    for _ in range(runs):
+        total, packages = measure(module)
+        totals.append(total)
+        for name, ms in packages.items():
+            samples[name].append(ms)
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "total_ms": round(statistics.median(totals), 1),
+        "packages": {
+            name: round(statistics.median(values), 1)
+            for name, values in sorted(samples.items(), key=lambda item: -statistics.median(item[1]))
+        },
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_ms: float) -> list:
+    """返回回归问题列表"""
+    problems = []
+    limit = baseline["total_ms"] * (1 + tolerance)
+    if result["total_ms"] > limit:
+        problems.append(f"total {result['total_ms']}ms > baseline {baseline['total_ms']}ms (+{tolerance:.0%})")
+    for name in baseline.get("forbidden", []):
+        if name in result["packages"]:
+            problems.append(f"{name} is imported at startup")
+    for name, ms in result["packages"].items():
+        if name not in baseline["packages"] and ms >= min_ms:
+            problems.append(f"new package {name} costs {ms}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时基准")
+    parser.add_argument("--module", default="main", help="被测模块")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="输出耗时最多的前 N 个顶层包")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="总耗时允许超出基线的比例")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="新增顶层包的告警阈值（毫秒）")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    args = parser.parse_args()
+
+    result = profile(args.module, args.runs)
+    print(f"import {result['module']}: {result['total_ms']:.1f} ms (median of {args.runs})")
+    for name, ms in list(result["packages"].items())[:args.top]:
+        print(f"  {name:<24}{ms:>8.1f} ms")
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        # 保留基线中手工维护的禁止列表
+        result["forbidden"] = baseline.get("forbidden", []) if baseline else []
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if baseline is None:
+        print("no baseline, skip comparison")
+        return
+    problems = compare(result, baseline, args.tolerance, args.min_ms)
+    if problems:
+        print("REGRESSION:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"OK (baseline {baseline['total_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
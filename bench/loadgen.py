@@ -0,0 +1,340 @@
+'''
+登录接口端到端压测工具
+
+按目标速率（开环，不因服务变慢而降低发送速率）向 /api/v1/login 发送
+sendSmsCode / smsCodeLogin / setAppInfo / changeUserName 混合请求，
+按 EventName 统计吞吐量、延迟分位数和错误率，结果输出为 JSON，便于多次运行之间对比。
+
+延迟从请求计划发出的时刻开始计算，客户端排队的时间也计入延迟，避免协调遗漏（coordinated omission）。
+
+被测服务需使用假短信服务（SMS_PROVIDER=fake），验证码与 --sms-code 一致；
+--spawn 会在本机启动一个使用假短信服务和内存替身（STAND_IN_BACKENDS=True）的单 worker 服务，
+也可以不加 --spawn，对接本地真实的 MySQL / Redis 部署。
+--faults 为 --spawn 启动的服务开启依赖故障注入（规则格式见 faults.py），用于测量依赖变慢或失败时的尾延迟和错误率。
+
+用法：
+    python bench/loadgen.py --spawn --rate 500 --duration 30 --output run.json
+    python bench/loadgen.py --url http://127.0.0.1:8000 --rate 200 --mix setAppInfo=1
+    python bench/loadgen.py --spawn --compare run.json
+    python bench/loadgen.py --spawn --faults '{"mysql_pool.acquire": {"latency_ms": 5, "latency_p99_ms": 200}}'
+'''
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "sendSmsCode=1,smsCodeLogin=1,setAppInfo=6,changeUserName=2"
+
+# 配置中的必填项，未设置时用占位值
+PLACEHOLDER_ENV = {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}
+
+
+class HttpClient:
+    """最小化的 HTTP/1.1 keep-alive 客户端，只支持带 Content-Length 的响应"""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> Tuple[int, bytes]:
+        if self._idle:
+            reader, writer = self._idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("connection closed")
+            status = int(status_line.split()[1])
+            length, keep_alive = 0, True
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                name = name.strip().lower()
+                if name == "content-length":
+                    length = int(value)
+                elif name == "connection" and value.strip().lower() == "close":
+                    keep_alive = False
+            payload = await reader.readexactly(length)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, payload
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class Scenario:
+    """生成各类请求，并维护压测过程中登录得到的 login_token"""
+
+    def __init__(self, users: int, sms_code: str, api_path: str):
+        self.phones = [f"139{i:08d}" for i in random.sample(range(10 ** 8), users)]
+        self.sms_code = sms_code
+        self.api_path = api_path
+        self.tokens: List[str] = []
+
+    @staticmethod
+    def _body(event_name: str, content: dict) -> bytes:
+        return json.dumps({"event_name": event_name, "content": json.dumps(content)}).encode()
+
+    def build(self, event_name: str) -> bytes:
+        phone = random.choice(self.phones)
+        if event_name == "sendSmsCode":
+            return self._body(event_name, {"phone": phone})
+        if event_name == "smsCodeLogin":
+            return self._body(event_name, {"phone": phone, "code": self.sms_code})
+        token = random.choice(self.tokens) if self.tokens else "missing"
+        if event_name == "setAppInfo":
+            return self._body(event_name, {
+                "login_token": token, "app_id": "loadgen", "app_key": "", "volc_ak": "", "volc_sk": "",
+            })
+        return self._body(event_name, {"login_token": token, "user_name": f"u{random.randrange(10 ** 6)}"})
+
+    def on_response(self, event_name: str, data: dict):
+        if event_name == "smsCodeLogin" and data.get("code") == 200:
+            self.tokens.append(data["response"]["login_token"])
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法计算分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def summarize(latencies: List[float], codes: Dict[str, int], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    count = sum(codes.values())
+    errors = count - codes.get("200", 0)
+    ms = lambda value: round(value * 1000, 3)
+    return {
+        "count": count,
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "codes": dict(sorted(codes.items())),
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            "p50": ms(percentile(latencies, 0.50)),
+            "p90": ms(percentile(latencies, 0.90)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "p999": ms(percentile(latencies, 0.999)),
+            "max": ms(latencies[-1]) if latencies else 0.0,
+        },
+    }
+
+
+async def run_load(client: HttpClient, scenario: Scenario, args) -> dict:
+    weights = parse_mix(args.mix)
+    names, mix_weights = list(weights), list(weights.values())
+
+    # 预先登录一批用户，保证 setAppInfo / changeUserName 一开始就有可用的 login_token
+    for phone in scenario.phones[:args.sessions]:
+        body = json.dumps({"event_name": "smsCodeLogin",
+                           "content": json.dumps({"phone": phone, "code": scenario.sms_code})}).encode()
+        status, payload = await client.request("POST", scenario.api_path, body)
+        if status == 200:
+            scenario.on_response("smsCodeLogin", json.loads(payload))
+    if args.sessions and not scenario.tokens:
+        raise RuntimeError("warm-up logins failed, is the server using SMS_PROVIDER=fake?")
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    codes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    in_flight = 0
+    skipped = 0
+
+    async def one(event_name: str, scheduled: float):
+        nonlocal in_flight
+        in_flight += 1
+        try:
+            status, payload = await client.request("POST", scenario.api_path, scenario.build(event_name))
+            data = json.loads(payload) if status == 200 else {}
+            code = str(data.get("code", f"http_{status}"))
+            scenario.on_response(event_name, data)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            code = "transport_error"
+        finally:
+            in_flight -= 1
+        latencies[event_name].append(time.perf_counter() - scheduled)
+        codes[event_name][code] += 1
+
+    total = int(args.rate * args.duration)
+    tasks = []
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i / args.rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if in_flight >= args.concurrency:
+            # 客户端并发已满，说明服务已跟不上目标速率
+            skipped += 1
+            continue
+        event_name = random.choices(names, mix_weights)[0]
+        tasks.append(asyncio.create_task(one(event_name, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    all_codes: Dict[str, int] = defaultdict(int)
+    for event_codes in codes.values():
+        for code, count in event_codes.items():
+            all_codes[code] += count
+    return {
+        "config": {
+            "url": args.url, "rate": args.rate, "duration": args.duration, "mix": weights,
+            "concurrency": args.concurrency, "users": args.users, "spawned": args.spawn,
+            "faults": json.loads(args.faults) if args.faults else {},
+        },
+        "elapsed_s": round(elapsed, 3),
+        "scheduled": total,
+        "skipped": skipped,
+        "overall": summarize([v for values in latencies.values() for v in values], all_codes, elapsed),
+        "events": {
+            name: summarize(latencies[name], codes[name], elapsed)
+            for name in sorted(latencies)
+        },
+    }
+
+
+def spawn_server(url: str, sms_code: str, faults: str = "") -> subprocess.Popen:
+    """启动使用内存替身和假短信服务的单 worker 服务"""
+    parts = urlsplit(url)
+    env = dict(os.environ)
+    for key, value in PLACEHOLDER_ENV.items():
+        env.setdefault(key, value)
+    # 压测流量集中在少量手机号和同一个 IP 上，默认关闭限流，可通过环境变量 RATE_LIMIT_ENABLED=True 保留
+    env.setdefault("RATE_LIMIT_ENABLED", "False")
+    env.update({
+        "STAND_IN_BACKENDS": "True",
+        "SMS_PROVIDER": "fake",
+        "SMS_FAKE_CODE": sms_code,
+        "DEBUG": "False",
+        "WORKERS": "1",  # 内存替身不在进程间共享
+        "BIND_ADDR": parts.hostname or "127.0.0.1",
+        "BIND_PORT": str(parts.port or 80),
+        "DRAIN_DELAY_SECONDS": "0",
+    })
+    if faults:
+        env.update({"FAULT_INJECTION_ENABLED": "True", "FAULT_RULES": faults})
+    return subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env)
+
+
+async def wait_ready(client: HttpClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = await client.request("GET", "/health/ready")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def print_comparison(old: dict, new: dict):
+    """对比两次运行的吞吐量、p50/p99 延迟和错误率"""
+    print(f"{'event':<16}{'rps':>18}{'p50 ms':>20}{'p99 ms':>20}{'errors':>18}")
+    rows = [("overall", old["overall"], new["overall"])]
+    rows += [(name, old["events"].get(name), stats) for name, stats in new["events"].items()]
+    for name, before, after in rows:
+        if before is None:
+            continue
+        print(
+            f"{name:<16}"
+            f"{before['throughput_rps']:>8} -> {after['throughput_rps']:<7}"
+            f"{before['latency_ms']['p50']:>9} -> {after['latency_ms']['p50']:<8}"
+            f"{before['latency_ms']['p99']:>9} -> {after['latency_ms']['p99']:<8}"
+            f"{before['error_rate']:>7} -> {after['error_rate']}"
+        )
+
+
+async def main_async(args) -> dict:
+    client = HttpClient(args.url)
+    server: Optional[subprocess.Popen] = None
+    try:
+        if args.spawn:
+            server = spawn_server(args.url, args.sms_code, args.faults)
+            await wait_ready(client)
+        scenario = Scenario(args.users, args.sms_code, args.path)
+        return await run_load(client, scenario, args)
+    finally:
+        client.close()
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录接口端到端压测")
+    parser.add_argument("--url", default="http://127.0.0.1:18000", help="被测服务地址")
+    parser.add_argument("--path", default="/api/v1/login", help="登录接口路径")
+    parser.add_argument("--spawn", action="store_true", help="启动本地替身服务后再压测")
+    parser.add_argument("--rate", type=float, default=200, help="目标速率（请求/秒）")
+    parser.add_argument("--duration", type=float, default=10, help="压测时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=256, help="客户端最大并发请求数")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="各 EventName 的权重")
+    parser.add_argument("--users", type=int, default=1000, help="模拟的手机号数量")
+    parser.add_argument("--sessions", type=int, default=100, help="压测前预先登录的用户数")
+    parser.add_argument("--sms-code", default="123456", help="假短信服务的验证码")
+    parser.add_argument("--faults", default="", help="--spawn 时注入的依赖故障规则（JSON，格式同 FAULT_RULES）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(main_async(args))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
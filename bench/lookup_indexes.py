@@ -0,0 +1,217 @@
+'''
+登录查询覆盖索引基准
+
+对比迁移 0002_covering_lookup_indexes 前后按手机号和 user_id 查询用户的延迟：
+- before：按 0001_baseline 建表，使用迁移前的语句（经 uk_phone / uk_user_id 查找后回表）
+- after_unhinted：执行 0002 后仍使用迁移前的语句（优化器按唯一索引 const 访问，仍然回表）
+- after：执行 0002 后使用 mysql_client.py 迁移后的语句（FORCE INDEX 覆盖索引，不回表）
+两张表写入相同的 --rows 行数据（约 2% 为停用用户），每种查询先串行测量单次延迟分位数，
+再以 --concurrency 个连接并发测量吞吐，并输出 EXPLAIN 中使用的索引。
+
+连接 DB_HOST / DB_PORT / DB_NAME 等配置指定的 MySQL，只创建和删除临时表 bench_lookup_before / bench_lookup_after，
+不读写 tb_user。
+
+用法：
+    python bench/lookup_indexes.py [--rows 1000000] [--ops 20000] [--output lookup_indexes.json]
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 配置中的必填项，未设置时用占位值，保证不依赖 .env 也能运行
+for key, value in {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+import aiomysql
+from loadgen import percentile
+from migrate import load_migrations
+from mysql_client import Database, COVERING_LOOKUP_VERSION, _user_lookup_sql
+from sharding import ShardConfig
+
+TABLES = {"before": "bench_lookup_before", "after": "bench_lookup_after"}
+
+# 变体 -> (表, 是否为迁移后的语句)
+VARIANTS = {
+    "before": ("before", False),
+    "after_unhinted": ("after", False),
+    "after": ("after", True),
+}
+
+# 查询 -> (列, 覆盖索引)
+QUERIES = {
+    "by_phone": ("phone", "idx_phone_lookup"),
+    "by_user_id": ("user_id", "idx_user_id_lookup"),
+}
+
+BATCH_SIZE = 5000
+
+
+def latency_stats(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50_us": round(percentile(values, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(values, 0.99) * 1e6, 1),
+        "mean_us": round(statistics.fmean(values) * 1e6, 1),
+    }
+
+
+def table_statements(table: str, versions: List[int]) -> List[str]:
+    """迁移脚本中作用于 tb_user 的语句，表名替换为 table"""
+    statements = []
+    for migration in load_migrations():
+        if migration.version in versions:
+            statements += [
+                re.sub(r"\btb_user\b", table, statement)
+                for statement in migration.statements if re.search(r"\btb_user\b", statement)
+            ]
+    return statements
+
+
+def generate_rows(count: int) -> List[tuple]:
+    now = int(time.time())
+    phones = random.sample(range(10 ** 10), count)
+    return [
+        (uuid.uuid4().hex, f"user{i}", f"1{phone:010d}", now - i, now - i, now, 0 if random.random() < 0.02 else 1)
+        for i, phone in enumerate(phones)
+    ]
+
+
+async def create_tables(pool, rows: List[tuple]):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            for name, table in TABLES.items():
+                await cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                for statement in table_statements(table, [1] if name == "before" else [1, 2]):
+                    await cursor.execute(statement)
+                start = time.perf_counter()
+                for i in range(0, len(rows), BATCH_SIZE):
+                    await cursor.executemany(
+                        f"INSERT INTO {table} (user_id, user_name, phone, created_at, updated_at, last_login_at, "
+                        f"is_active) VALUES (%s, %s, %s, %s, %s, %s, %s)", rows[i:i + BATCH_SIZE]
+                    )
+                await cursor.execute(f"ANALYZE TABLE {table}")
+                await cursor.fetchall()
+                print(f"seeded {table}: {len(rows)} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+async def explain(pool, sql: str, key: str) -> dict:
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("EXPLAIN " + sql, (key,))
+            plan = await cursor.fetchone()
+    return {"key": plan["key"], "extra": plan["Extra"]}
+
+
+async def bench_query(pool, sql: str, keys: List[str], concurrency: int) -> dict:
+    async def run(cursor, key: str):
+        await cursor.execute(sql, (key,))
+        await cursor.fetchall()
+
+    # 预热，使两张表的索引页都在缓冲池中
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            for key in keys:
+                await run(cursor, key)
+
+            # 串行：单次延迟
+            latencies = []
+            for key in keys:
+                start = time.perf_counter()
+                await run(cursor, key)
+                latencies.append(time.perf_counter() - start)
+
+    # 并发：吞吐
+    async def worker(offset: int):
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for i in range(offset, len(keys), concurrency):
+                    await run(cursor, keys[i])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {**latency_stats(latencies), "throughput_qps": round(len(keys) / elapsed)}
+
+
+async def main(args: argparse.Namespace) -> dict:
+    shard = ShardConfig()
+    pool = await aiomysql.create_pool(
+        host=shard.host, port=shard.port, user=shard.user, password=shard.password, db=shard.db,
+        charset="utf8mb4", autocommit=True, minsize=1, maxsize=args.concurrency
+    )
+    result: Dict[str, dict] = {"config": {"rows": args.rows, "ops": args.ops, "concurrency": args.concurrency}}
+    try:
+        rows = generate_rows(args.rows)
+        await create_tables(pool, rows)
+        samples = random.choices(rows, k=args.ops)
+        keys = {"by_phone": [row[2] for row in samples], "by_user_id": [row[0] for row in samples]}
+        for name, (table, migrated) in VARIANTS.items():
+            # 使用 mysql_client.py 生成的语句，表名替换为临时表
+            database = Database()
+            database.schema_version = COVERING_LOOKUP_VERSION if migrated else 0
+            result[name] = {}
+            for query, (column, index) in QUERIES.items():
+                sql = re.sub(r"\btb_user\b", TABLES[table], _user_lookup_sql(database, column, index))
+                sql = " ".join(sql.split())
+                result[name][query] = {
+                    **await bench_query(pool, sql, keys[query], args.concurrency),
+                    "plan": await explain(pool, sql, keys[query][0]),
+                }
+    finally:
+        if not args.keep:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    for table in TABLES.values():
+                        await cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        pool.close()
+        await pool.wait_closed()
+    return result
+
+
+def print_table(result: dict):
+    print(f"{'query':<12}{'variant':<16}{'p50 us':>10}{'p99 us':>10}{'qps':>10}  plan")
+    for query in QUERIES:
+        for variant in VARIANTS:
+            stats = result[variant][query]
+            print(
+                f"{query:<12}{variant:<16}{stats['p50_us']:>10}{stats['p99_us']:>10}{stats['throughput_qps']:>10}"
+                f"  {stats['plan']['key']} ({stats['plan']['extra'] or '-'})"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="登录查询覆盖索引基准")
+    parser.add_argument("--rows", type=int, default=1000000, help="每张表写入的用户数")
+    parser.add_argument("--ops", type=int, default=20000, help="每种查询的次数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发测量吞吐时的连接数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留临时表")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    result = asyncio.run(main(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    print_table(result)
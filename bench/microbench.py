@@ -0,0 +1,254 @@
+'''
+热点函数微基准
+
+覆盖每个请求都会执行的 CPU 热点：RTS 令牌的生成/序列化/解析、请求内容解析、
+各请求模型的校验、数据库行构造 UserInfo，以及请求日志中请求体/响应体的旁路复制、解码脱敏和 JSON 格式化。
+
+每个用例先预热，再自动确定单轮循环次数（单轮不少于 --min-time 秒），重复 --repeat 轮取最小值
+（与 timeit 的建议一致，最小值受调度和其他进程干扰最少）；
+分配情况在 tracemalloc 下单独测量（避免影响计时）：
+- alloc_bytes：单次调用期间的内存峰值增量
+- retained_blocks：每次调用后仍未释放的内存块数，持续大于 0 通常意味着泄漏或缓存增长
+
+结果与 bench/microbench_baseline.json 对比，耗时或分配超出基线 (1 + tolerance) 倍时以状态码 1 退出。
+不同机器的绝对耗时不可比，耗时按相对值比较：每轮都会运行与项目代码无关的参照用例 REFERENCE_CASE，
+各用例记录 relative = 本用例耗时 / 同一次运行中参照用例的耗时，与基线的 relative 对比；分配按绝对值比较。
+
+用法：
+    python bench/microbench.py [--filter models] [--repeat 7]
+    python bench/microbench.py --update-baseline
+'''
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "microbench_baseline.json")
+
+# 配置中的必填项，未设置时用占位值，保证不依赖 .env 也能运行
+for key, value in {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+import access_token
+from access_token import AccessToken, PrivPublishStream, PrivSubscribeStream
+from config import settings
+from log_config import JsonFormatter, decode_body
+from log_mw import BoundedBuffer
+from models import (
+    RequestModel,
+    SendSmsVerifyCodeRequest,
+    SmsVerifyCodeLoginRequest,
+    SetAppInfoRequest,
+    ChangeUserNameRequest,
+    UserInfo,
+    LoginReturn
+)
+from utils import generate_wildcard_token, parse_content
+
+# 参照用例：纯 Python 的固定计算量，用于抵消机器之间的速度差异，不受 --filter 影响
+REFERENCE_CASE = "reference.python_loop"
+
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    """构建所有用例，输入数据在这里预先准备好，不计入耗时"""
+    token = AccessToken(settings.rtc_app_id, settings.rtc_app_key, "*", "bench_user")
+    token.add_privilege(PrivSubscribeStream, 0)
+    token.add_privilege(PrivPublishStream, int(time.time()) + 3600)
+    token.expire_time(int(time.time()) + 3600)
+    raw_token = token.serialize()
+
+    set_app_info = {
+        "login_token": "0123456789abcdef0123456789abcdef", "app_id": settings.rtc_app_id,
+        "app_key": "app_key", "volc_ak": "volc_ak", "volc_sk": "volc_sk",
+    }
+    content = json.dumps(set_app_info)
+    request = {"event_name": "setAppInfo", "content": content}
+    row = {"user_id": "0123456789abcdef0123456789abcdef", "user_name": "1380", "phone": "13800000000",
+           "created_at": 1700000000}
+
+    # 与 RequestLoggingMiddleware 输出的访问日志记录一致
+    request_body = json.dumps(request).encode()
+    response_body = LoginReturn(code=200, message="ok", response=UserInfo(**row, login_token="x" * 32)) \
+        .model_dump_json().encode()
+    formatter = JsonFormatter()
+
+    def tee_bodies():
+        request_buffer, response_buffer = BoundedBuffer(10 * 1024), BoundedBuffer(10 * 1024)
+        request_buffer.append(request_body)
+        response_buffer.append(response_body)
+        return request_buffer, response_buffer
+
+    def format_access_log():
+        record = logging.LogRecord(
+            "log_mw", logging.INFO, __file__, 0, "请求结束: %s %s - 状态码: %s - 耗时: %.4fs",
+            ("POST", "/api/v1/login", 200, 0.0021), None
+        )
+        record.__dict__.update({
+            "request_id": "0123456789abcdef", "method": "POST", "path": "/api/v1/login", "status": 200,
+            "duration_ms": 2.1, "request_body": request_body, "request_body_truncated": False,
+            "response_body": response_body, "response_body_truncated": False,
+        })
+        return formatter.format(record)
+
+    def reference():
+        return sorted(str(i * 7919 % 1000) for i in range(100))
+
+    return {
+        REFERENCE_CASE: reference,
+        "access_token.serialize": token.serialize,
+        "access_token.parse": lambda: access_token.parse(raw_token),
+        "utils.generate_wildcard_token": lambda: generate_wildcard_token("bench_user"),
+        "utils.parse_content": lambda: parse_content(content),
+        "models.RequestModel": lambda: RequestModel(**request),
+        "models.SendSmsVerifyCodeRequest": lambda: SendSmsVerifyCodeRequest(phone="13800000000"),
+        "models.SmsVerifyCodeLoginRequest": lambda: SmsVerifyCodeLoginRequest(phone="13800000000", code="123456"),
+        "models.SetAppInfoRequest": lambda: SetAppInfoRequest(**set_app_info),
+        "models.ChangeUserNameRequest": lambda: ChangeUserNameRequest(user_name="bench", login_token="0" * 32),
+        "models.UserInfo_from_row": lambda: UserInfo(**row),
+        "log_mw.tee_bodies": tee_bodies,
+        "log_config.decode_body": lambda: decode_body(request_body),
+        "log_config.format_access_log": format_access_log,
+    }
+
+
+def autorange(func: Callable, min_time: float) -> int:
+    """确定单轮循环次数，使单轮耗时不少于 min_time"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time:
+            return number
+        number *= 2
+
+
+def measure_time(func: Callable, warmup: float, min_time: float, repeat: int) -> Tuple[float, float]:
+    """返回 (每次调用的最短耗时 ns, 各轮耗时的相对标准差)"""
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        func()
+    number = autorange(func, min_time)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1e9)
+    best = min(samples)
+    spread = statistics.stdev(samples) / statistics.mean(samples) if len(samples) > 1 else 0.0
+    return best, spread
+
+
+def measure_alloc(func: Callable, calls: int = 200) -> Tuple[float, float]:
+    """返回 (单次调用的内存峰值增量 bytes, 每次调用残留的内存块数)"""
+    func()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(calls):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+        before = tracemalloc.take_snapshot()
+        for _ in range(calls):
+            func()
+        after = tracemalloc.take_snapshot()
+        retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    finally:
+        tracemalloc.stop()
+    return statistics.median(peaks), retained / calls
+
+
+def run(args) -> Dict[str, dict]:
+    results = {}
+    for name, func in build_cases().items():
+        if args.filter and args.filter not in name and name != REFERENCE_CASE:
+            continue
+        ns, spread = measure_time(func, args.warmup, args.min_time, args.repeat)
+        alloc_bytes, retained = measure_alloc(func)
+        results[name] = {
+            "ns_per_op": round(ns, 1),
+            "ops_per_sec": round(1e9 / ns),
+            "spread": round(spread, 4),
+            "alloc_bytes": round(alloc_bytes),
+            "retained_blocks": round(retained, 2),
+            "relative": round(ns / results[REFERENCE_CASE]["ns_per_op"], 4) if results else 1.0,
+        }
+        print(f"{name:<36}{ns:>12.1f} ns{1e9 / ns:>14,.0f} ops/s  ±{spread:>5.1%}"
+              f"{alloc_bytes:>10.0f} B{retained:>8.2f} blk")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    problems = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        # 参照用例本身只反映机器速度；基线中没有 relative 时无法跨机器比较，跳过耗时对比
+        if name != REFERENCE_CASE and "relative" in base and stats["relative"] > base["relative"] * (1 + tolerance):
+            problems.append(f"{name}: {stats['relative']}x reference > baseline {base['relative']}x reference")
+        # 小于 64 字节的波动不计入
+        if stats["alloc_bytes"] > base["alloc_bytes"] * (1 + tolerance) + 64:
+            problems.append(f"{name}: {stats['alloc_bytes']} B/op > baseline {base['alloc_bytes']} B/op")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--warmup", type=float, default=0.2, help="每个用例的预热时间（秒）")
+    parser.add_argument("--min-time", type=float, default=0.05, help="单轮最短耗时（秒）")
+    parser.add_argument("--repeat", type=int, default=7, help="重复轮数，取最小值")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许超出基线的比例")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线中对应的用例")
+    args = parser.parse_args()
+
+    print(f"{'case':<36}{'time':>15}{'throughput':>20}{'spread':>8}{'alloc':>12}{'retained':>12}")
+    results = run(args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not baseline:
+        print("no baseline, skip comparison")
+        return
+    problems = compare(results, baseline, args.tolerance)
+    if problems:
+        print("REGRESSION:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+'''
+录制流量回放工具
+
+读取 CAPTURE_PATH 录制的 NDJSON 文件（可传入多个，例如多 worker 的 <路径>.<pid>），
+按录制时的时间间隔向目标服务重新发送请求，并对比录制与回放的返回码分布和延迟分位数。
+
+回放速度：
+    --speed 1     按原始节奏
+    --speed 5     按 5 倍速
+    --speed 0     不等待，在 --concurrency 限制下尽快发送
+
+敏感字段在录制时已替换为假名，回放时：
+- 每个不同的 login_token 假名在回放开始前用一个新的测试手机号登录，换取目标服务上真实的 login_token
+- 验证码统一替换为 --sms-code（目标服务需使用 SMS_PROVIDER=fake）
+回放流量来自同一个 IP，目标服务通常需要关闭限流（RATE_LIMIT_ENABLED=False）。
+
+用法：
+    python bench/replay.py capture.ndjson --url http://127.0.0.1:8000 --speed 2 --output replay.json
+'''
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from loadgen import HttpClient, percentile
+
+PSEUDONYM_PREFIX = "~"
+
+
+def load(paths: List[str], limit: int) -> List[dict]:
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    entries.sort(key=lambda entry: entry["t"])
+    return entries[:limit] if limit else entries
+
+
+def content_of(entry: dict) -> dict:
+    content = entry["b"].get("content")
+    return content if isinstance(content, dict) else {}
+
+
+async def resolve_tokens(client: HttpClient, entries: List[dict], sms_code: str) -> Dict[str, str]:
+    """为录制中出现的每个 login_token 假名登录一个测试用户，返回 假名 -> 真实 token"""
+    pseudonyms = {
+        content_of(entry).get("login_token") for entry in entries
+    }
+    pseudonyms = sorted(p for p in pseudonyms if isinstance(p, str) and p.startswith(PSEUDONYM_PREFIX))
+    tokens = {}
+    for pseudonym in pseudonyms:
+        phone = f"199{random.randrange(10 ** 8):08d}"
+        body = json.dumps({"event_name": "smsCodeLogin",
+                           "content": json.dumps({"phone": phone, "code": sms_code})}).encode()
+        status, payload = await client.request("POST", entries[0]["p"], body)
+        data = json.loads(payload) if status == 200 else {}
+        if data.get("code") != 200:
+            raise RuntimeError(f"login for replay session failed: {status} {payload[:200]!r}")
+        tokens[pseudonym] = data["response"]["login_token"]
+    return tokens
+
+
+def build_body(entry: dict, tokens: Dict[str, str], sms_code: str) -> bytes:
+    """还原请求体：content 重新编码为字符串，假名替换为回放用的值"""
+    body = dict(entry["b"])
+    content = content_of(entry)
+    if content:
+        content = dict(content)
+        if content.get("login_token") in tokens:
+            content["login_token"] = tokens[content["login_token"]]
+        if str(content.get("code", "")).startswith(PSEUDONYM_PREFIX):
+            content["code"] = sms_code
+        body["content"] = json.dumps(content, ensure_ascii=False)
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def latency_stats(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50": round(percentile(values, 0.50), 3),
+        "p90": round(percentile(values, 0.90), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "max": round(values[-1], 3) if values else 0.0,
+    }
+
+
+async def replay(args) -> dict:
+    entries = load(args.files, args.limit)
+    if not entries:
+        raise RuntimeError("no captured requests")
+    client = HttpClient(args.url)
+    tokens = await resolve_tokens(client, entries, args.sms_code)
+    bodies = [build_body(entry, tokens, args.sms_code) for entry in entries]
+
+    results: List[tuple] = [None] * len(entries)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(index: int):
+        entry = entries[index]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, payload = await client.request(entry["m"], entry["p"], bodies[index])
+                data = json.loads(payload) if payload else {}
+                code = data.get("code") if isinstance(data, dict) else None
+                code = str(code) if code is not None else f"http_{status}"
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                code = "transport_error"
+            results[index] = (code, (time.perf_counter() - start) * 1000)
+
+    tasks = []
+    origin = entries[0]["t"]
+    start = time.perf_counter()
+    for index, entry in enumerate(entries):
+        if args.speed > 0:
+            delay = (entry["t"] - origin) / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(index)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    # 按 EventName 对比录制与回放
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, entry in enumerate(entries):
+        groups[str(entry["b"].get("event_name"))].append(index)
+    events = {}
+    for event_name, indexes in sorted(groups.items()):
+        captured_codes, replayed_codes = defaultdict(int), defaultdict(int)
+        matched = 0
+        for index in indexes:
+            captured_codes[entries[index]["c"]] += 1
+            replayed_codes[results[index][0]] += 1
+            matched += entries[index]["c"] == results[index][0]
+        events[event_name] = {
+            "count": len(indexes),
+            "code_match_rate": round(matched / len(indexes), 4),
+            "captured_codes": dict(captured_codes),
+            "replayed_codes": dict(replayed_codes),
+            "captured_latency_ms": latency_stats([entries[i]["d"] for i in indexes]),
+            "replayed_latency_ms": latency_stats([results[i][1] for i in indexes]),
+        }
+    return {
+        "config": {"files": args.files, "url": args.url, "speed": args.speed, "concurrency": args.concurrency},
+        "requests": len(entries),
+        "sessions": len(tokens),
+        "captured_span_s": round(entries[-1]["t"] - origin, 3),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(entries) / elapsed, 1) if elapsed else 0.0,
+        "events": events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制流量回放")
+    parser.add_argument("files", nargs="+", help="录制文件")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="目标服务地址")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，0 表示尽快发送")
+    parser.add_argument("--concurrency", type=int, default=256, help="最大并发请求数")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放的请求数，0 表示全部")
+    parser.add_argument("--sms-code", default="123456", help="目标服务假短信服务的验证码")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    result = asyncio.run(replay(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    mismatched = [name for name, stats in result["events"].items() if stats["code_match_rate"] < 1]
+    if mismatched:
+        print(f"code mismatch in: {', '.join(mismatched)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
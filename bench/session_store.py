@@ -0,0 +1,172 @@
+'''
+会话存储后端基准
+
+对比 Redis 后端与进程内后端（session_store.py）在登录链路中的三种操作：
+- set：签发 login_token（smsCodeLogin）
+- get：校验 login_token（setAppInfo / changeUserName / WebSocket 建连）
+- refresh：刷新过期时间
+每种操作先串行测量单次延迟分位数，再以 --concurrency 个协程并发测量吞吐。
+
+进程内后端另外测量：
+- evict：--sessions 个会话全部过期后的淘汰耗时（每个会话一次出堆）
+- snapshot：写出与加载 --sessions 个会话的快照耗时和文件大小
+
+Redis 后端连接 REDIS_HOST / REDIS_PORT 等配置指定的 Redis，连接失败时跳过。
+
+用法：
+    python bench/session_store.py [--ops 20000] [--sessions 1000000] [--output session_store.json]
+'''
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 配置中的必填项，未设置时用占位值，保证不依赖 .env 也能运行
+for key, value in {
+    "VOLC_AK": "placeholder",
+    "VOLC_SK": "placeholder",
+    "RTC_APP_ID": "0" * 24,
+    "RTC_APP_KEY": "placeholder",
+    "DB_PASSWORD": "placeholder",
+    "REDIS_PASSWORD": "",
+}.items():
+    os.environ.setdefault(key, value)
+
+from loadgen import percentile
+from redis_client import RedisClient
+from session_store import SessionStore, RedisSessionStore, EmbeddedSessionStore
+
+TTL = 15 * 24 * 3600
+
+
+def latency_stats(values: List[float]) -> dict:
+    values = sorted(values)
+    return {
+        "p50_us": round(percentile(values, 0.50) * 1e6, 2),
+        "p99_us": round(percentile(values, 0.99) * 1e6, 2),
+        "mean_us": round(statistics.fmean(values) * 1e6, 2),
+    }
+
+
+async def bench_backend(store: SessionStore, ops: int, concurrency: int) -> Dict[str, dict]:
+    tokens = [uuid.uuid4().hex for _ in range(ops)]
+    user_ids = [uuid.uuid4().hex for _ in range(ops)]
+    operations = {
+        "set": lambda i: store.set_login_token(tokens[i], user_ids[i], TTL),
+        "get": lambda i: store.get_user_id_by_token(tokens[i]),
+        "refresh": lambda i: store.refresh_token_expiry(tokens[i], TTL),
+    }
+    results = {}
+    for name, operation in operations.items():
+        # 串行：单次延迟
+        latencies = []
+        for i in range(ops):
+            start = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - start)
+
+        # 并发：吞吐
+        async def worker(offset: int):
+            for i in range(offset, ops, concurrency):
+                await operation(i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        results[name] = {**latency_stats(latencies), "throughput_ops": round(ops / elapsed)}
+    await store.revoke_user_tokens(user_ids)
+    return results
+
+
+async def bench_embedded_maintenance(sessions: int) -> Dict[str, dict]:
+    results = {}
+    store = EmbeddedSessionStore()
+    for i in range(sessions):
+        await store.set_login_token(f"{i:032x}", f"user{i % (sessions // 2 or 1)}", TTL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.snapshot")
+        items = list(store._tokens.items())
+        start = time.perf_counter()
+        EmbeddedSessionStore._write_snapshot(path, items)
+        write_seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        restored = EmbeddedSessionStore(snapshot_path=path)
+        start = time.perf_counter()
+        count = restored.load_snapshot()
+        load_seconds = time.perf_counter() - start
+    results["snapshot"] = {
+        "sessions": count,
+        "write_ms": round(write_seconds * 1000, 1),
+        "load_ms": round(load_seconds * 1000, 1),
+        "size_mb": round(size / 1024 / 1024, 1),
+    }
+
+    start = time.perf_counter()
+    evicted = store.evict_expired(now=time.time() + TTL + 1)
+    elapsed = time.perf_counter() - start
+    results["evict"] = {
+        "sessions": evicted,
+        "total_ms": round(elapsed * 1000, 1),
+        "per_session_us": round(elapsed / max(evicted, 1) * 1e6, 3),
+    }
+    return results
+
+
+async def main(args: argparse.Namespace) -> dict:
+    result = {"config": {"ops": args.ops, "concurrency": args.concurrency, "sessions": args.sessions}}
+    result["embedded"] = await bench_backend(EmbeddedSessionStore(), args.ops, args.concurrency)
+
+    client = RedisClient()
+    try:
+        await client.connect()
+    except Exception as e:
+        print(f"redis unavailable, skipped: {e}", file=sys.stderr)
+    else:
+        try:
+            result["redis"] = await bench_backend(RedisSessionStore(client), args.ops, args.concurrency)
+        finally:
+            await client.close()
+
+    if args.sessions:
+        result["embedded_maintenance"] = await bench_embedded_maintenance(args.sessions)
+    return result
+
+
+def print_table(result: dict):
+    backends = [name for name in ("embedded", "redis") if name in result]
+    print(f"{'op':<10}" + "".join(f"{name + ' p50/p99 us':>26}{name + ' ops/s':>16}" for name in backends))
+    for op in ("set", "get", "refresh"):
+        row = f"{op:<10}"
+        for name in backends:
+            stats = result[name][op]
+            row += f"{stats['p50_us']:>14.1f} / {stats['p99_us']:<9.1f}{stats['throughput_ops']:>16}"
+        print(row)
+    for name, stats in result.get("embedded_maintenance", {}).items():
+        print(f"embedded {name}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="会话存储后端基准")
+    parser.add_argument("--ops", type=int, default=20000, help="每种操作的次数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发测量吞吐时的协程数")
+    parser.add_argument("--sessions", type=int, default=1000000, help="淘汰与快照测试的会话数，0 表示跳过")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+    print_table(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+            f.write("\n")
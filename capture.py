@@ -0,0 +1,126 @@
+'''
+流量录制模块
+RequestLoggingMiddleware 按 CAPTURE_SAMPLE_RATE 采样 CAPTURE_ROUTES 中的请求，
+把请求体和耗时交给后台线程，以紧凑的 NDJSON 格式追加写入 CAPTURE_PATH，供 bench/replay.py 回放。
+
+每行一条记录：
+    {"t": 开始时间（unix 秒）, "m": 方法, "p": 路径, "s": HTTP 状态码, "c": 返回码, "d": 耗时（毫秒）, "b": 请求体}
+
+敏感字段（验证码、login_token 等）替换为 "~" 开头的假名：同一进程内相同的值得到相同的假名，
+回放时可以据此还原会话关系，但无法反推出原值。
+'''
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import List, Optional, Tuple
+from config import settings, WORKERS_ENV
+from log_config import redact
+from memprof import register_cache
+
+logger = logging.getLogger(__name__)
+
+PSEUDONYM_PREFIX = "~"
+
+
+class TrafficCapture:
+    """后台线程批量写出录制的请求，队列满时直接丢弃，不阻塞请求"""
+
+    def __init__(self, max_queue_size: int = 10000, flush_interval: float = 1.0):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_interval = flush_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._key = os.urandom(16)  # 假名密钥，只保存在进程内存中
+        self._path = ""
+        self.dropped = 0
+
+    def should_record(self, path: str) -> bool:
+        """当前请求是否需要录制"""
+        return (
+            self._thread is not None
+            and path in settings.capture_routes
+            and random.random() < settings.capture_sample_rate
+        )
+
+    def submit(self, started_at: float, method: str, path: str, status: int, duration_ms: float,
+               request_body: bytes, response_body: bytes):
+        """提交一条录制记录，解析和脱敏在后台线程中完成"""
+        try:
+            self._queue.put_nowait((started_at, method, path, status, duration_ms, request_body, response_body))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None and settings.capture_path:
+            self._path = settings.capture_path
+            # 多 worker 时每个进程写入独立的文件，避免并发追加导致行交错
+            if int(os.environ.get(WORKERS_ENV, "1")) > 1:
+                self._path = f"{self._path}.{os.getpid()}"
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """停止写出线程并写出剩余的记录"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _pseudonym(self, value: str) -> str:
+        return PSEUDONYM_PREFIX + hmac.new(self._key, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def _encode(self, item: Tuple) -> Optional[str]:
+        started_at, method, path, status, duration_ms, request_body, response_body = item
+        try:
+            body = json.loads(request_body)
+        except ValueError:
+            return None
+        try:
+            response = json.loads(response_body)
+            code = response.get("code") if isinstance(response, dict) else None
+        except ValueError:
+            code = None
+        return json.dumps({
+            "t": round(started_at, 6),
+            "m": method,
+            "p": path,
+            "s": status,
+            "c": str(code) if code is not None else f"http_{status}",
+            "d": round(duration_ms, 3),
+            "b": redact(body, self._pseudonym),
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            lines: List[str] = []
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    line = self._encode(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if line is not None:
+                    lines.append(line)
+            if lines:
+                try:
+                    with open(self._path, "a", encoding="utf-8") as f:
+                        f.write("\n".join(lines) + "\n")
+                except OSError as e:
+                    logger.warning("Failed to write %s captured requests: %s", len(lines), e)
+
+
+# 全局录制实例
+traffic_capture = TrafficCapture()
+register_cache("capture.queue", lambda: traffic_capture._queue.qsize())
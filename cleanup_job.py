@@ -0,0 +1,207 @@
+'''
+后台维护任务模块
+按主键键集分页遍历 tb_user（分片部署时依次遍历当前布局的各个分片）：
+1. 批量吊销已停用用户（is_active = 0）在 Redis 中残留的 login_token
+2. 可选：将长期未登录的用户归档到 tb_user_archive
+
+任务限速运行（批间休眠、连接池繁忙时主动让路），进度以检查点形式保存在 Redis 中，
+进程重启后从上次位置继续；多个 worker 之间通过 Redis 锁保证同一时间只有一个实例在运行。
+
+单独运行一轮：python cleanup_job.py
+'''
+import asyncio
+import logging
+import uuid
+from typing import Dict, Optional
+from config import settings
+from mysql_client import router, scan_users, archive_users
+from redis_client import redis_client, revoke_user_tokens
+from utils import current_timestamp
+from fanout import push_fanout
+
+logger = logging.getLogger(__name__)
+
+# Redis Key 常量
+CHECKPOINT_KEY = "maintenance:cleanup:last_id"  # 值为 "分片编号:主键 id"
+LOCK_KEY = "maintenance:cleanup:lock"
+
+# 仅当锁仍由自己持有时才释放
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 仅当锁仍由自己持有时才续期；GET 与 EXPIRE 分开执行时，锁可能在两者之间过期并被其他进程取得
+RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class CleanupJob:
+    """停用用户会话清理与长期未登录用户归档任务"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lock_value = uuid.uuid4().hex
+        self._lock_ttl = 60
+
+    async def _acquire_lock(self) -> bool:
+        """获取（或续期）跨进程互斥锁"""
+        client = redis_client.client
+        if await client.set(LOCK_KEY, self._lock_value, nx=True, ex=self._lock_ttl):
+            return True
+        return bool(await client.eval(RENEW_LOCK_SCRIPT, 1, LOCK_KEY, self._lock_value, self._lock_ttl))
+
+    async def _release_lock(self):
+        """释放跨进程互斥锁"""
+        try:
+            await redis_client.client.eval(RELEASE_LOCK_SCRIPT, 1, LOCK_KEY, self._lock_value)
+        except Exception as e:
+            logger.warning("Failed to release cleanup lock: %s", e)
+
+    async def _yield_to_hot_path(self, shard: int) -> bool:
+        """
+        批间休眠；分片的连接池已无空闲连接时继续等待，避免与登录请求争抢连接
+        等待可能超过锁的有效期，期间定期续期
+
+        Returns:
+            bool: 锁是否仍由当前实例持有
+        """
+        await asyncio.sleep(settings.cleanup_batch_pause)
+        loop = asyncio.get_running_loop()
+        renew_at = loop.time() + self._lock_ttl / 3
+        pool = router.current.shards[shard].pool
+        while pool is not None and pool.freesize == 0 and pool.size >= pool.maxsize:
+            await asyncio.sleep(max(settings.cleanup_batch_pause, 0.05))
+            if loop.time() >= renew_at:
+                if not await self._acquire_lock():
+                    return False
+                renew_at = loop.time() + self._lock_ttl / 3
+        return await self._acquire_lock()
+
+    async def run_pass(self) -> Dict[str, int]:
+        """
+        从检查点开始执行一轮完整扫描
+
+        Returns:
+            Dict[str, int]: 本轮扫描、吊销和归档的统计数据
+        """
+        stats = {"scanned": 0, "revoked_tokens": 0, "archived": 0}
+        if not await self._acquire_lock():
+            logger.info("Cleanup job is running in another process, skipped")
+            return stats
+
+        try:
+            client = redis_client.client
+            shard, _, last_id = (await client.get(CHECKPOINT_KEY) or "").rpartition(":")
+            shard, last_id = int(shard or 0), int(last_id or 0)
+            if shard >= len(router.current.shards):
+                # 分片数变化后检查点失效
+                shard, last_id = 0, 0
+            if shard or last_id:
+                logger.info("Cleanup job resumed from checkpoint: shard=%s, id=%s", shard, last_id)
+
+            archive_days = settings.cleanup_archive_after_days
+            archive_before = current_timestamp() - archive_days * 24 * 60 * 60
+
+            while shard < len(router.current.shards):
+                rows = await scan_users(last_id, settings.cleanup_batch_size, shard)
+                if not rows:
+                    shard, last_id = shard + 1, 0
+                    continue
+
+                inactive = [row["user_id"] for row in rows if not row["is_active"]]
+                dormant = []
+                if archive_days > 0:
+                    dormant = [
+                        row["user_id"] for row in rows
+                        if (row["last_login_at"] or row["created_at"]) < archive_before
+                    ]
+
+                if inactive or dormant:
+                    stats["revoked_tokens"] += await revoke_user_tokens(set(inactive + dormant))
+                    push_fanout.force_logout(set(inactive + dormant), reason="account inactive")
+                if dormant:
+                    stats["archived"] += await archive_users(dormant)
+
+                stats["scanned"] += len(rows)
+                last_id = rows[-1]["id"]
+                await client.set(CHECKPOINT_KEY, f"{shard}:{last_id}")
+                if not await self._yield_to_hot_path(shard):
+                    # 锁已过期并被其他实例取得，由其从检查点继续
+                    logger.warning("Cleanup lock lost, pass stopped: shard=%s, id=%s", shard, last_id)
+                    return stats
+
+            # 完成一轮后从头开始
+            await client.delete(CHECKPOINT_KEY)
+            logger.info(
+                "Cleanup pass finished: scanned=%s, revoked_tokens=%s, archived=%s",
+                stats["scanned"], stats["revoked_tokens"], stats["archived"]
+            )
+        finally:
+            await self._release_lock()
+        return stats
+
+    async def _run_forever(self):
+        """循环执行扫描，单轮失败不影响后续执行"""
+        while True:
+            try:
+                await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Cleanup pass failed: %s", e)
+            await asyncio.sleep(settings.cleanup_interval_seconds)
+
+    def start(self):
+        """在当前事件循环中启动后台任务"""
+        if redis_client.client is None:
+            # 检查点和实例锁保存在 Redis 中
+            logger.warning("Cleanup job requires Redis, not started")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+            logger.info("Cleanup job started")
+
+    async def stop(self):
+        """停止后台任务，检查点保留在 Redis 中供下次继续"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self._release_lock()
+            logger.info("Cleanup job stopped")
+
+
+# 全局维护任务实例
+cleanup_job = CleanupJob()
+
+
+if __name__ == "__main__":
+    from mysql_client import init_db, close_db
+    from redis_client import init_redis, close_redis
+
+    async def run_once():
+        await init_db()
+        await init_redis()
+        try:
+            await cleanup_job.run_pass()
+        finally:
+            await push_fanout.stop()
+            await close_redis()
+            await close_db()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    asyncio.run(run_once())
@@ -1,5 +1,9 @@
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
+# 启动器（server.py）通过该环境变量把 worker 数量传给各 worker 进程
+WORKERS_ENV = "JUSI_WORKERS"
+
 class Settings(BaseSettings):
     # AK/SK配置
     volc_ak: str
@@ -17,6 +21,15 @@ class Settings(BaseSettings):
     sms_template_id: str = "S1T_1y2p1bc526ebm"
     sms_expire_time: int = 600  # 验证码有效时间，单位秒
     sms_try_count: int = 5  # 验证码可以尝试验证次数
+    sms_provider: str = "volcengine"  # 短信服务商：volcengine、http、fake（不发送短信，验证码固定为 SMS_FAKE_CODE，仅用于压测），逗号分隔多个时按延迟和成功率路由（见 sms_client.py）
+    sms_fake_code: str = "123456"
+    sms_timeout: float = 5.0  # 单次调用服务商的超时时间（秒），超时后改用下一个服务商；同时作为 SDK / HTTP 客户端的连接和读取超时
+    sms_max_workers: int = 8  # 每个服务商调用 SDK 的线程数（每个 worker 进程），服务商卡住时最多占用这些线程
+    sms_ewma_alpha: float = 0.2  # 服务商耗时和成功率 EWMA 的平滑系数，越大越偏重最近的调用
+    sms_explore_rate: float = 0.05  # 发送验证码时改用非首选服务商的概率
+    sms_http_send_url: str = ""  # 通用 HTTP 服务商的发送接口
+    sms_http_check_url: str = ""  # 通用 HTTP 服务商的校验接口
+    sms_http_token: str = ""  # 通用 HTTP 服务商的 Bearer 令牌，留空表示不发送
 
     # MySQL数据库配置
     db_host: str = "localhost"
@@ -24,16 +37,130 @@ class Settings(BaseSettings):
     db_user: str = "jusi"
     db_password: str
     db_name: str = "jusi_db"
+    db_pool_minsize: int = 1  # 每个 worker 连接池的最小连接数
+    db_pool_maxsize: int = 10  # 每个 worker 连接池的最大连接数
+    db_max_connections: int = 0  # 所有 worker 共享的连接预算（应小于 MySQL max_connections），0 表示不限制
+    db_shards: str = ""  # tb_user 分片列表（见 sharding.py），逗号分隔的 [user[:password]@]host[:port][/db]，留空表示只使用 DB_HOST
+    db_shards_previous: str = ""  # 重新分片期间的旧分片列表，迁移完成（reshard.py）后清空
+    db_phone_claim_grace_seconds: int = 300  # 手机号目录项登记超过该时间（秒）且用户行不存在时，才允许新用户接管
+    db_migrate_on_startup: bool = False  # 启动时是否执行待执行的数据库迁移（见 migrate.py），否则只输出警告
+    migration_lock_wait_timeout: int = 5  # 迁移语句获取元数据锁的最长等待时间（秒）
+    migration_ddl_retries: int = 10  # 获取元数据锁超时后的重试次数
 
     # Redis配置
-    redis_host: str = "localhost"
+    redis_host: str = "localhost"  # 留空表示不使用 Redis（仅 SESSION_BACKEND=embedded 时允许）
     redis_port: int = 6379
     redis_db: int = 0
     redis_password: str
+    redis_socket_timeout: float = 5.0  # 单条命令的读写超时（秒）
+    redis_connect_timeout: float = 5.0  # 建立连接的超时（秒）
 
     # Token配置
     login_token_expire_days: int = 15  # login_token有效期（天）
 
+    # 会话存储配置（见 session_store.py）
+    session_backend: str = "redis"  # redis，或 embedded（进程内存储，仅适用于单进程部署和测试环境，服务固定以单个 worker 运行）
+    session_snapshot_path: str = "sessions.snapshot"  # embedded 后端的快照文件路径，留空表示不保存快照
+    session_snapshot_interval: float = 60.0  # embedded 后端写出快照的间隔（秒）
+
+    # 后台维护任务配置（吊销停用用户会话、归档长期未登录用户）
+    cleanup_enabled: bool = False  # 是否在服务进程内运行维护任务
+    cleanup_batch_size: int = 500  # 每批扫描的用户数
+    cleanup_batch_pause: float = 0.2  # 每批之间的休眠时间（秒），用于限速
+    cleanup_interval_seconds: int = 3600  # 两次全表扫描之间的间隔（秒）
+    cleanup_archive_after_days: int = 0  # 超过该天数未登录的用户将被归档，0 表示不归档
+
+    # 指标配置
+    metrics_dir: str = ""  # 多 worker 部署时各进程指标快照的共享目录，留空表示只统计当前进程
+    metrics_flush_interval: float = 5.0  # 写出指标快照的间隔（秒）
+
+    # 链路追踪配置
+    trace_sample_rate: float = 0.0  # 请求入口的头部采样率，0 表示关闭（上游 traceparent 标记为采样的请求仍会被追踪）
+    trace_export_path: str = ""  # span 导出文件路径（OTLP/JSON，每行一批）；多 worker 时各进程写入 <路径>.<pid>
+    trace_otlp_endpoint: str = ""  # OTLP/HTTP 采集器地址，如 http://localhost:4318/v1/traces
+
+    # 事件循环监控配置
+    loop_monitor_enabled: bool = True  # 是否测量事件循环延迟并检测阻塞调用
+    loop_lag_interval: float = 0.1  # 调度延迟的采样间隔（秒）
+    loop_block_threshold: float = 0.2  # 单个回调阻塞超过该时间（秒）时输出调用栈
+
+    # 自适应并发限制配置（登录接口）
+    admission_enabled: bool = True  # 是否开启自适应并发限制和按优先级削峰
+    admission_initial_limit: int = 50  # 初始并发上限
+    admission_min_limit: int = 5  # 并发上限的下限
+    admission_max_limit: int = 500  # 并发上限的上限
+    admission_rtt_tolerance: float = 1.5  # 短期延迟超过长期延迟的该倍数时开始收缩上限
+    admission_update_interval: float = 0.1  # 并发上限的最短调整间隔（秒）
+    admission_priority_step: float = 0.15  # 优先级每降低一级，可用的并发额度减少的比例
+    admission_default_priority: int = 1  # 未配置的 EventName 的优先级
+    admission_priorities: Dict[str, int] = {  # 各 EventName 的优先级，0 最高
+        "setAppInfo": 0,
+        "changeUserName": 1,
+        "smsCodeLogin": 1,
+        "sendSmsCode": 2,
+    }
+
+    # 限流配置
+    rate_limit_enabled: bool = True  # 是否开启按手机号 / IP / login_token 的限流
+    # EventName -> {维度: "次数/窗口秒数,..."}；默认不按 IP 限流：部署在反向代理之后且未开启 TRUST_PROXY_HEADERS 时，
+    # 所有请求的 IP 都是代理的地址，IP 规则会作用于全部客户端
+    rate_limit_rules: Dict[str, Dict[str, str]] = {
+        "sendSmsCode": {"phone": "1/60,10/86400"},
+        "smsCodeLogin": {"phone": "10/600"},
+        "setAppInfo": {"login_token": "60/60"},
+        "changeUserName": {"login_token": "10/60"},
+    }
+    rate_limit_local_max_keys: int = 100000  # 本地近似计数保存的最大键数
+    trust_proxy_headers: bool = False  # 是否从 X-Forwarded-For / X-Real-IP 获取客户端 IP（部署在反向代理之后时开启）
+
+    # WebSocket 配置（会话事件推送）
+    ws_heartbeat_interval: float = 30.0  # 连接空闲超过该时间（秒）时发送心跳
+    ws_heartbeat_timeout: float = 75.0  # 连接空闲超过该时间（秒）时断开
+    ws_wheel_tick: float = 1.0  # 时间轮每格的时长（秒），即心跳与超时检查的精度
+    ws_send_timeout: float = 5.0  # 单条消息写出的最长等待时间（秒），超时视为客户端接收过慢并断开
+    ws_max_message_size: int = 4096  # 客户端单条消息的最大字节数
+
+    # 跨节点推送配置（经由 Redis 发布订阅，见 fanout.py）
+    push_fanout_enabled: bool = True  # 是否把推送转发到其他节点上的连接
+    push_presence_buckets: int = 4096  # 在线状态的分桶数
+    push_presence_ttl: int = 90  # 在线状态的有效期（秒），各节点每隔 1/3 有效期续期一次
+    push_batch_interval: float = 0.005  # 推送的批量合并窗口（秒）
+
+    # 审计日志配置（登录、login_token 签发、修改用户名，见 audit.py）
+    audit_sink: str = ""  # 写出目标：redis（Redis Stream）、file（本地文件），留空表示关闭（默认）
+    audit_queue_size: int = 10000  # 内存队列长度，队列满时丢弃新事件
+    audit_batch_size: int = 500  # 每批写出的事件数
+    audit_flush_interval: float = 1.0  # 写出间隔（秒）
+    audit_stream: str = "audit:login"  # Redis Stream 键名
+    audit_stream_maxlen: int = 1000000  # Stream 的近似最大长度，超出时裁剪最旧的事件
+    audit_consumer_group: str = "audit-loader"  # audit_consumer.py 使用的消费组
+    audit_file_path: str = "audit.ndjson"  # 审计文件路径；多 worker 时各进程写入 <路径>.<pid>
+    audit_file_max_bytes: int = 100 * 1024 * 1024  # 审计文件超过该大小时轮转
+    audit_file_backups: int = 10  # 保留的轮转文件数
+
+    # 内部令牌校验接口配置（供 RTS 服务等内部服务批量解析 login_token，见 introspection.py）
+    introspection_secret: str = ""  # 共享密钥，请求头 X-Internal-Secret 需与之一致；留空表示关闭该接口
+    introspection_max_tokens: int = 1000  # 单次请求最多包含的 token 数
+
+    # 内存分析接口配置（tracemalloc 与对象、缓存统计，见 memprof.py）
+    memprof_secret: str = ""  # 共享密钥，请求头 X-Internal-Secret 需与之一致；留空表示关闭该接口
+
+    # 健康检查与优雅退出配置
+    health_check_interval: float = 5.0  # 就绪探针依赖状态的刷新间隔（秒）
+    health_check_timeout: float = 2.0  # 单个依赖检查的超时时间（秒）
+    drain_delay_seconds: float = 5.0  # 收到 SIGTERM 后保持服务、等待流量摘除的时间（秒）
+    drain_timeout_seconds: float = 30.0  # 等待进行中请求结束的最长时间（秒）
+
+    # 压测配置（生产环境保持默认值）
+    stand_in_backends: bool = False  # 使用进程内的内存替身代替 MySQL / Redis，见 stand_ins.py
+    fault_injection_enabled: bool = False  # 是否开启依赖调用的故障注入（见 faults.py）
+    fault_rules: Dict[str, Dict[str, float]] = {}  # "组件.操作"（支持通配符）-> 规则，如 {"redis.*": {"latency_ms": 2, "latency_p99_ms": 40}}
+    fault_injection_secret: str = ""  # /internal/faults 的共享密钥，请求头 X-Internal-Secret 需与之一致；留空表示关闭该接口
+
+    # 启动预热配置
+    warmup_enabled: bool = True  # 就绪前是否预热（导入短信 SDK、构建模型校验器与 OpenAPI 文档、预建连接）
+    warmup_connections: int = 4  # 预先建立的 MySQL / Redis 连接数（不超过连接池上限）
+
     # 其他配置项
     api_vstr: str = "/api/v1"
     app_name: str = "JUSI RTS"
@@ -41,7 +168,25 @@ class Settings(BaseSettings):
     bind_addr: str = "0.0.0.0"
     bind_port: int = 8000
     rts_server_url: str = "http://service.jusiai.com:9000/api/v1/rts/message"
-    debug: bool = True
+    debug: bool = False
+
+    # 服务进程配置（仅生产模式生效）
+    workers: int = 0  # worker 进程数，0 表示取 CPU 核数
+    server_backlog: int = 2048  # 监听队列长度
+    server_keep_alive: int = 15  # HTTP keep-alive 超时（秒）
+    server_limit_concurrency: int = 0  # 单个 worker 的最大并发连接数，0 表示不限制
+    request_log_enabled: bool = False  # 非调试模式下是否开启请求日志中间件（访问日志以 INFO 级别输出，不受 WARNING 级别限制）
+
+    # 日志配置
+    log_json: bool = True  # 是否输出单行 JSON 日志
+    log_queue_size: int = 10000  # 日志队列上限（条），输出跟不上时丢弃新日志并记录丢弃数
+    log_body_sample_rate: float = 1.0  # 完整记录请求体/响应体的默认采样率
+    log_body_sample_routes: Dict[str, float] = {}  # 按路由覆盖采样率，如 {"/api/v1/login": 0.01}
+
+    # 流量录制配置（录制的请求可用 bench/replay.py 回放）
+    capture_path: str = ""  # 录制文件路径（NDJSON，追加写入），留空表示关闭；多 worker 时各进程写入 <路径>.<pid>
+    capture_sample_rate: float = 0.01  # 录制采样率
+    capture_routes: List[str] = ["/api/v1/login"]  # 需要录制的路由
     
     # 指定配置文件和相关参数
     class Config:
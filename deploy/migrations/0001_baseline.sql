@@ -0,0 +1,57 @@
+-- 初始表结构（与 deploy/create_tb_user.sql 相同），已用该脚本建表的库执行本迁移不会有任何变化
+-- 已发布的迁移脚本不能再修改，结构变更请新增脚本
+
+-- 创建用户表 tb_user
+CREATE TABLE IF NOT EXISTS tb_user (
+    id INT AUTO_INCREMENT PRIMARY KEY COMMENT '自增主键',
+    user_id VARCHAR(64) NOT NULL UNIQUE COMMENT '用户ID',
+    user_name VARCHAR(128) NOT NULL COMMENT '用户名',
+    phone VARCHAR(20) DEFAULT NULL COMMENT '手机号',
+    created_at BIGINT NOT NULL COMMENT '创建时间戳（秒）',
+    updated_at BIGINT NOT NULL COMMENT '更新时间戳（秒）',
+    last_login_at BIGINT DEFAULT NULL COMMENT '最后登录时间戳（秒）',
+    is_active TINYINT(1) DEFAULT 1 COMMENT '是否激活：1-激活，0-停用',
+    UNIQUE KEY uk_user_id (user_id),
+    UNIQUE KEY uk_phone (phone),
+    INDEX idx_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用户信息表';
+
+-- 创建用户归档表 tb_user_archive（由后台维护任务写入长期未登录的用户）
+CREATE TABLE IF NOT EXISTS tb_user_archive (
+    id INT AUTO_INCREMENT PRIMARY KEY COMMENT '自增主键',
+    user_id VARCHAR(64) NOT NULL COMMENT '用户ID',
+    user_name VARCHAR(128) NOT NULL COMMENT '用户名',
+    phone VARCHAR(20) DEFAULT NULL COMMENT '手机号',
+    created_at BIGINT NOT NULL COMMENT '创建时间戳（秒）',
+    updated_at BIGINT NOT NULL COMMENT '更新时间戳（秒）',
+    last_login_at BIGINT DEFAULT NULL COMMENT '最后登录时间戳（秒）',
+    is_active TINYINT(1) DEFAULT 1 COMMENT '归档前的激活状态',
+    archived_at BIGINT NOT NULL COMMENT '归档时间戳（秒）',
+    UNIQUE KEY uk_user_id (user_id),
+    INDEX idx_phone (phone)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用户归档表';
+
+-- 创建手机号目录表 tb_user_phone（仅 tb_user 分片部署时使用，每个分片都需要创建，见 sharding.py）
+CREATE TABLE IF NOT EXISTS tb_user_phone (
+    phone VARCHAR(20) NOT NULL PRIMARY KEY COMMENT '手机号',
+    user_id VARCHAR(64) NOT NULL COMMENT '用户ID（用户行按 user_id 路由到所在的分片）',
+    created_at BIGINT NOT NULL COMMENT '登记时间戳（秒）'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='手机号目录表';
+
+-- 创建登录审计表 tb_login_audit（由 audit_consumer.py 批量写入，可部署在独立的 MySQL 实例上）
+CREATE TABLE IF NOT EXISTS tb_login_audit (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '自增主键',
+    event_id VARCHAR(32) NOT NULL COMMENT '事件ID（用于去重）',
+    event VARCHAR(32) NOT NULL COMMENT '事件类型：login / token_issue / name_change',
+    user_id VARCHAR(64) DEFAULT NULL COMMENT '用户ID',
+    phone VARCHAR(20) DEFAULT NULL COMMENT '手机号',
+    ip VARCHAR(45) DEFAULT NULL COMMENT '客户端IP',
+    code INT NOT NULL COMMENT '返回码',
+    request_id VARCHAR(64) DEFAULT NULL COMMENT '请求ID',
+    detail VARCHAR(512) DEFAULT NULL COMMENT '附加信息（JSON）',
+    created_at BIGINT NOT NULL COMMENT '事件时间戳（毫秒）',
+    UNIQUE KEY uk_event_id (event_id),
+    INDEX idx_user_id_created_at (user_id, created_at),
+    INDEX idx_phone_created_at (phone, created_at),
+    INDEX idx_ip_created_at (ip, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='登录审计表';
@@ -0,0 +1,17 @@
+-- 登录查询的覆盖索引
+-- get_user_by_phone、get_user_info、get_users_info 按 phone 或 user_id 查询，过滤 is_active，只读取 user_id、user_name、phone、created_at。
+-- 原来经 uk_phone / uk_user_id 找到主键后还要回表读取整行，覆盖索引包含这些列，查询只访问二级索引。
+-- uk_phone、uk_user_id 保留，用于保证唯一；等值条件命中唯一索引时优化器按 const 访问而不会选择覆盖索引，
+-- 因此服务启动时检测到本版本已执行后，查询以 FORCE INDEX 指定覆盖索引（见 mysql_client._user_lookup_sql）。
+-- 代价：修改用户名时需要同时更新两个覆盖索引；更新登录时间（last_login_at、updated_at）不涉及这些索引。
+
+ALTER TABLE tb_user
+    ADD INDEX idx_phone_lookup (phone, is_active, user_id, user_name, created_at),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE tb_user
+    ADD INDEX idx_user_id_lookup (user_id, is_active, user_name, phone, created_at),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 建表语句中 user_id 列上的 UNIQUE 与 uk_user_id 重复，删除列定义生成的索引 `user_id`
+ALTER TABLE tb_user DROP INDEX user_id, ALGORITHM=INPLACE, LOCK=NONE;
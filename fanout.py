@@ -0,0 +1,302 @@
+'''
+跨节点推送模块
+用户的 WebSocket 连接可能在任意 worker 上，本模块基于 redis_client 把推送送达连接所在的进程：
+1. 在线状态：user_id -> 节点 的映射按 user_id 的哈希分桶，保存在 push:presence:<桶> 哈希中，
+   字段值为 "节点@过期时间;..."（同一用户可能同时连在多个节点上）。
+   各节点每隔 PUSH_PRESENCE_TTL / 3 秒为本节点的在线用户续期，节点宕机后其条目在 TTL 后失效，
+   并在下次写入该用户或后台清扫时删除
+2. 投递：先查在线状态，只向连接所在节点的频道 push:node:<节点> 发布，不向所有节点广播；
+   本节点的连接直接投递，不经过 Redis
+3. 批量：推送先进入本地队列，每 PUSH_BATCH_INTERVAL 秒合并一次，
+   一批中的在线状态查询合并为一次流水线，发往同一节点的消息合并为一次发布
+
+推送是尽力而为的：订阅连接重连期间发往本节点的消息会丢失，客户端重连后应以接口返回的数据为准。
+STAND_IN_BACKENDS=True 时内存替身不支持 Lua 和发布订阅，只在本进程内投递。
+'''
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import settings
+from metrics import PUSH_FANOUT_PUBLISHES, PUSH_FANOUT_MESSAGES
+from memprof import register_cache
+from redis_client import redis_client
+from ws_manager import manager, CLOSE_FORCED_LOGOUT
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_PREFIX = "push:presence:"
+CHANNEL_PREFIX = "push:node:"
+
+# 节点标识，每个 worker 进程一个；不能包含 ";" 和 "@"
+NODE_ID = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+
+# KEYS[1]：分桶键；ARGV[1]：节点，ARGV[2]：当前时间，ARGV[3]：新的过期时间（0 表示移除），
+# ARGV[4]：分桶键的 TTL，ARGV[5..]：user_id
+# 对每个用户：去掉本节点的旧条目和已过期的条目，按需追加本节点的新条目
+UPDATE_PRESENCE_SCRIPT = """
+local node, now, expires = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+for i = 5, #ARGV do
+    local entries = {}
+    local value = redis.call('HGET', KEYS[1], ARGV[i])
+    if value then
+        for entry_node, entry_expires in string.gmatch(value, '([^;@]+)@(%d+)') do
+            if entry_node ~= node and tonumber(entry_expires) > now then
+                table.insert(entries, entry_node .. '@' .. entry_expires)
+            end
+        end
+    end
+    if expires ~= '0' then
+        table.insert(entries, node .. '@' .. expires)
+    end
+    if #entries > 0 then
+        redis.call('HSET', KEYS[1], ARGV[i], table.concat(entries, ';'))
+    else
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 0
+"""
+
+# KEYS[1]：分桶键；ARGV[1]：当前时间。删除分桶中全部已过期的条目
+SWEEP_PRESENCE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local entries, expired = {}, 0
+    for entry_node, entry_expires in string.gmatch(fields[i + 1], '([^;@]+)@(%d+)') do
+        if tonumber(entry_expires) > now then
+            table.insert(entries, entry_node .. '@' .. entry_expires)
+        else
+            expired = expired + 1
+        end
+    end
+    if #entries == 0 then
+        redis.call('HDEL', KEYS[1], fields[i])
+    elseif expired > 0 then
+        redis.call('HSET', KEYS[1], fields[i], table.concat(entries, ';'))
+    end
+end
+return 0
+"""
+
+
+def presence_bucket(user_id: str) -> int:
+    return zlib.crc32(user_id.encode("utf-8")) % settings.push_presence_buckets
+
+
+def parse_presence(value: Optional[str], now: int) -> List[str]:
+    """解析在线状态字段，返回未过期的节点"""
+    nodes = []
+    if value:
+        for entry in value.split(";"):
+            node, _, expires = entry.partition("@")
+            if expires.isdigit() and int(expires) > now:
+                nodes.append(node)
+    return nodes
+
+
+class PushFanout:
+    """跨节点推送与在线状态维护"""
+
+    def __init__(self):
+        # 待发送的推送：(user_ids, 消息, 关闭码)
+        self._outbox: List[Tuple[List[str], dict, Optional[int]]] = []
+        # 待写入的在线状态变化：user_id -> 是否在线
+        self._presence_changes: Dict[str, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._update_script = None
+        self._sweep_script = None
+        self._sweep_cursor = 0
+
+    @property
+    def _remote(self) -> bool:
+        return settings.push_fanout_enabled and not settings.stand_in_backends and redis_client.client is not None
+
+    def push(self, user_id: str, message: dict):
+        """向用户的全部连接（不论在哪个节点）推送消息"""
+        self._enqueue([user_id], message, None)
+
+    def force_logout(self, user_ids: Iterable[str], reason: str = ""):
+        """通知用户会话已被吊销，并关闭其全部连接"""
+        self._enqueue(list(user_ids), {"event": "forcedLogout", "reason": reason}, CLOSE_FORCED_LOGOUT)
+
+    def _enqueue(self, user_ids: List[str], message: dict, close_code: Optional[int]):
+        # 本节点的连接直接投递
+        manager.deliver(user_ids, message, close_code)
+        if not self._remote:
+            return
+        self._outbox.append((user_ids, message, close_code))
+        self._wake()
+
+    def _wake(self):
+        self._wakeup.set()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    def _presence_changed(self, user_id: str, online: bool):
+        self._presence_changes[user_id] = online
+        self._wake()
+
+    def _scripts(self):
+        if self._update_script is None:
+            self._update_script = redis_client.client.register_script(UPDATE_PRESENCE_SCRIPT)
+            self._sweep_script = redis_client.client.register_script(SWEEP_PRESENCE_SCRIPT)
+        return self._update_script, self._sweep_script
+
+    async def _write_presence(self, user_ids: Iterable[str], online: bool):
+        """按分桶批量写入本节点的在线状态"""
+        buckets: Dict[int, List[str]] = {}
+        for user_id in user_ids:
+            buckets.setdefault(presence_bucket(user_id), []).append(user_id)
+        if not buckets:
+            return
+        update_script, _ = self._scripts()
+        now = int(time.time())
+        ttl = settings.push_presence_ttl
+        expires = now + ttl if online else 0
+        async with redis_client.client.pipeline(transaction=False) as pipe:
+            for bucket, users in buckets.items():
+                await update_script(
+                    keys=[f"{PRESENCE_PREFIX}{bucket}"], args=[NODE_ID, now, expires, ttl, *users], client=pipe
+                )
+            await pipe.execute()
+
+    async def _lookup(self, user_ids: Set[str]) -> Dict[str, Set[str]]:
+        """查询用户所在的节点（不含本节点），返回 节点 -> user_id 集合"""
+        buckets: Dict[int, List[str]] = {}
+        for user_id in user_ids:
+            buckets.setdefault(presence_bucket(user_id), []).append(user_id)
+        async with redis_client.client.pipeline(transaction=False) as pipe:
+            for bucket, users in buckets.items():
+                pipe.hmget(f"{PRESENCE_PREFIX}{bucket}", users)
+            results = await pipe.execute()
+        now = int(time.time())
+        nodes: Dict[str, Set[str]] = {}
+        for users, values in zip(buckets.values(), results):
+            for user_id, value in zip(users, values):
+                for node in parse_presence(value, now):
+                    if node != NODE_ID:
+                        nodes.setdefault(node, set()).add(user_id)
+        return nodes
+
+    async def flush(self):
+        """写入在线状态变化，并把队列中的推送发布到目标节点"""
+        changes, self._presence_changes = self._presence_changes, {}
+        outbox, self._outbox = self._outbox, []
+        if not self._remote:
+            return
+        if changes:
+            await self._write_presence([u for u, online in changes.items() if online], True)
+            await self._write_presence([u for u, online in changes.items() if not online], False)
+        if not outbox:
+            return
+
+        nodes = await self._lookup({user_id for user_ids, _, _ in outbox for user_id in user_ids})
+        if not nodes:
+            return
+        batches: Dict[str, list] = {}
+        for user_ids, message, close_code in outbox:
+            for node, node_users in nodes.items():
+                targets = [user_id for user_id in user_ids if user_id in node_users]
+                if targets:
+                    batches.setdefault(node, []).append({"u": targets, "m": message, "c": close_code})
+        async with redis_client.client.pipeline(transaction=False) as pipe:
+            for node, envelopes in batches.items():
+                pipe.publish(f"{CHANNEL_PREFIX}{node}", json.dumps(envelopes, ensure_ascii=False))
+            await pipe.execute()
+        PUSH_FANOUT_PUBLISHES.inc(value=len(batches))
+        PUSH_FANOUT_MESSAGES.inc("sent", value=sum(len(envelopes) for envelopes in batches.values()))
+
+    async def _run_flusher(self):
+        while True:
+            await self._wakeup.wait()
+            # 等待一个批量窗口，合并这段时间内的推送
+            await asyncio.sleep(settings.push_batch_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Push fan-out flush failed: %s", e)
+
+    async def _run_heartbeat(self):
+        """为本节点的在线用户续期，并轮流清扫一部分分桶中的过期条目"""
+        buckets = settings.push_presence_buckets
+        sweep_per_round = max(1, buckets // 100)
+        while True:
+            await asyncio.sleep(settings.push_presence_ttl / 3)
+            try:
+                await self._write_presence(manager.online_users(), True)
+                _, sweep_script = self._scripts()
+                now = int(time.time())
+                async with redis_client.client.pipeline(transaction=False) as pipe:
+                    for _ in range(sweep_per_round):
+                        await sweep_script(keys=[f"{PRESENCE_PREFIX}{self._sweep_cursor}"], args=[now], client=pipe)
+                        self._sweep_cursor = (self._sweep_cursor + 1) % buckets
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning("Push presence heartbeat failed: %s", e)
+
+    async def _run_listener(self):
+        """订阅本节点的频道，把其他节点发来的推送投递到本地连接"""
+        channel = f"{CHANNEL_PREFIX}{NODE_ID}"
+        while True:
+            pubsub = redis_client.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(channel)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    envelopes = json.loads(message["data"])
+                    PUSH_FANOUT_MESSAGES.inc("received", value=len(envelopes))
+                    for envelope in envelopes:
+                        manager.deliver(envelope["u"], envelope["m"], envelope["c"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Push channel subscription failed, resubscribing: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def start(self):
+        """订阅本节点频道并开始维护在线状态"""
+        if not self._remote or self._listener is not None:
+            return
+        manager.presence_listener = self._presence_changed
+        self._listener = asyncio.create_task(self._run_listener())
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        """停止后台任务，移除本节点的在线状态并发出剩余的推送"""
+        manager.presence_listener = None
+        for task in (self._listener, self._heartbeat, self._flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._heartbeat = self._flusher = None
+        for user_id in manager.online_users():
+            self._presence_changes[user_id] = False
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Final push fan-out flush failed: %s", e)
+
+
+# 全局推送实例
+push_fanout = PushFanout()
+register_cache("push_fanout.outbox", lambda: len(push_fanout._outbox))
+register_cache("push_fanout.presence_changes", lambda: len(push_fanout._presence_changes))
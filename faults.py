@@ -0,0 +1,279 @@
+'''
+故障注入模块（仅用于压测）
+在 Redis、MySQL、SMS 调用前注入延迟、错误和长时间卡顿，用于离线测量依赖变慢或失败时的尾延迟、
+连接池耗尽和超时处理。注入点位于 instrumentation.py 的埋点范围内，因此注入的延迟和错误同样计入依赖耗时直方图和 span；
+注入的错误与真实故障类型相同、位置相同，经过调用方原有的异常处理（如 MySQL 函数出错时返回 None / False）。
+
+规则以 "组件.操作" 为键，支持通配符（fnmatch），完全匹配的规则优先，其余按配置顺序取第一条匹配的规则：
+
+    FAULT_INJECTION_ENABLED=True
+    FAULT_RULES={"redis.*": {"latency_ms": 2, "latency_p99_ms": 40},
+                 "mysql_pool.acquire": {"stall_rate": 0.01, "stall_ms": 10000},
+                 "sms.volcengine.send_code": {"error_rate": 0.05}}
+
+    latency_ms       延迟的中位数（毫秒）
+    latency_p99_ms   延迟的 p99（毫秒），大于 latency_ms 时延迟服从对数正态分布，否则为固定值
+    error_rate       抛出错误的概率，错误在延迟之后抛出
+    stall_rate       卡顿的概率，卡顿时以 stall_ms 代替正常延迟
+    stall_ms         卡顿时长（毫秒）
+    timeout_ms       延迟达到该值时等待该时长后抛出超时错误；0 表示取组件的默认超时
+                     （redis 为 REDIS_SOCKET_TIMEOUT，sms 为 SMS_TIMEOUT，mysql 没有超时）
+
+组件与操作：
+1. redis.<操作>：会话存储的各操作（见 session_store.py），抛出 redis.exceptions.ConnectionError / TimeoutError
+2. mysql.<函数名>：mysql_client.py 中带埋点的函数，注入发生在函数内部第一次获取连接之前（每次调用最多一次），
+   抛出 pymysql OperationalError (2013)，与真实的数据库错误一样由函数自身的异常处理捕获，并记为 error（见 instrumentation.mark_failed）
+3. mysql_pool.acquire：每次从连接池取得连接之后、执行语句之前，注入期间连接保持占用，用于模拟慢查询导致的连接池耗尽
+4. sms.<服务商>.<操作>：各短信服务商的 send_code / check_code 调用（见 sms_client.py），
+   抛出 InjectedFault，可用于观察路由在服务商变慢或出错时的切换
+
+运行中可以通过 /internal/faults 查看和替换规则（请求头 X-Internal-Secret 需与 FAULT_INJECTION_SECRET 一致）：
+
+    GET    /internal/faults    当前规则
+    PUT    /internal/faults    以请求体（与 FAULT_RULES 格式相同）替换全部规则
+    DELETE /internal/faults    清空规则
+
+FAULT_INJECTION_ENABLED=False（默认）时不注入任何故障，接口返回 404；埋点只多一次属性判断。
+规则只作用于收到请求的进程，多 worker 部署时应改用 FAULT_RULES 配置，或以单 worker 运行。
+'''
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import math
+import random
+from fnmatch import fnmatchcase
+from typing import Dict, Optional, Tuple
+import pymysql.err
+import redis.exceptions
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from config import settings
+from metrics import FAULTS_INJECTED
+
+logger = logging.getLogger(__name__)
+
+FAULTS_PATH = "/internal/faults"
+SECRET_HEADER = "x-internal-secret"
+
+# 标准正态分布的 0.99 分位数，用于由 p99 推算对数正态分布的 sigma
+Z_99 = 2.326
+
+
+class InjectedFault(Exception):
+    """注入的错误（redis、mysql 以外的组件）"""
+
+
+class FaultRule:
+    """一条故障注入规则"""
+
+    FIELDS = ("latency_ms", "latency_p99_ms", "error_rate", "stall_rate", "stall_ms", "timeout_ms")
+    __slots__ = FIELDS + ("_mu", "_sigma")
+
+    def __init__(self, latency_ms: float = 0, latency_p99_ms: float = 0, error_rate: float = 0,
+                 stall_rate: float = 0, stall_ms: float = 0, timeout_ms: float = 0):
+        self.latency_ms = float(latency_ms)
+        self.latency_p99_ms = float(latency_p99_ms)
+        self.error_rate = float(error_rate)
+        self.stall_rate = float(stall_rate)
+        self.stall_ms = float(stall_ms)
+        self.timeout_ms = float(timeout_ms)
+        for field in self.FIELDS:
+            if not getattr(self, field) >= 0:
+                raise ValueError(f"{field} must be >= 0")
+        if self.error_rate > 1 or self.stall_rate > 1:
+            raise ValueError("error_rate and stall_rate must be <= 1")
+        if self.latency_p99_ms and self.latency_p99_ms < self.latency_ms:
+            raise ValueError("latency_p99_ms must be >= latency_ms")
+        self._sigma = 0.0
+        self._mu = 0.0
+        if self.latency_p99_ms > self.latency_ms > 0:
+            self._mu = math.log(self.latency_ms / 1000)
+            self._sigma = math.log(self.latency_p99_ms / self.latency_ms) / Z_99
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FaultRule":
+        if not isinstance(data, dict):
+            raise ValueError("rule must be an object")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field)}
+
+    def latency(self) -> float:
+        """抽样一次正常延迟（秒）"""
+        if self._sigma:
+            return random.lognormvariate(self._mu, self._sigma)
+        return self.latency_ms / 1000
+
+
+# 规则：模式 -> 规则；active 为 False 时埋点不调用本模块
+_rules: Dict[str, FaultRule] = {}
+_resolved: Dict[Tuple[str, str], Optional[FaultRule]] = {}
+active = False
+
+# 当前带埋点的调用中尚未注入的 (组件, 操作)，由函数内部的 I/O 处取出并注入
+_pending: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("fault_pending", default=None)
+
+
+def configure(rules: Dict[str, dict]):
+    """
+    替换全部规则
+
+    Args:
+        rules: 模式 -> 规则字段，格式与 FAULT_RULES 相同；为空时关闭注入
+
+    Raises:
+        ValueError: 规则格式不正确，此时保留原有规则
+    """
+    global active
+    if not isinstance(rules, dict):
+        raise ValueError("rules must be an object")
+    parsed = {}
+    for pattern, data in rules.items():
+        try:
+            parsed[pattern] = FaultRule.from_dict(data)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{pattern}: {e}") from None
+    _rules.clear()
+    _rules.update(parsed)
+    _resolved.clear()
+    active = bool(_rules)
+
+
+def rules_dict() -> Dict[str, dict]:
+    return {pattern: rule.to_dict() for pattern, rule in _rules.items()}
+
+
+def _match(component: str, operation: str) -> Optional[FaultRule]:
+    key = (component, operation)
+    try:
+        return _resolved[key]
+    except KeyError:
+        pass
+    name = f"{component}.{operation}"
+    rule = _rules.get(name)
+    if rule is None:
+        rule = next((rule for pattern, rule in _rules.items() if fnmatchcase(name, pattern)), None)
+    _resolved[key] = rule
+    return rule
+
+
+def _error(component: str, operation: str, timeout: bool) -> Exception:
+    """与真实故障相同类型的异常，调用方的异常处理按原有路径执行"""
+    message = f"injected {'timeout' if timeout else 'error'}: {component}.{operation}"
+    if component == "redis":
+        return redis.exceptions.TimeoutError(message) if timeout else redis.exceptions.ConnectionError(message)
+    if component in ("mysql", "mysql_pool"):
+        return pymysql.err.OperationalError(2013, message)
+    return InjectedFault(message)
+
+
+def _default_timeout(component: str) -> float:
+    return {"redis": settings.redis_socket_timeout, "sms": settings.sms_timeout}.get(component, 0.0)
+
+
+def _plan(component: str, operation: str) -> Tuple[float, Optional[Exception]]:
+    """
+    按规则抽样本次调用的故障
+
+    Returns:
+        Tuple[float, Optional[Exception]]: 注入的延迟（秒）和延迟之后抛出的异常
+    """
+    rule = _match(component, operation)
+    if rule is None:
+        return 0.0, None
+    if rule.stall_rate and random.random() < rule.stall_rate:
+        delay, kind = rule.stall_ms / 1000, "stall"
+    else:
+        delay = rule.latency()
+        kind = "latency" if delay else None
+
+    timeout = rule.timeout_ms / 1000 or _default_timeout(component)
+    if timeout and delay >= timeout:
+        FAULTS_INJECTED.inc(component, operation, "timeout")
+        return timeout, _error(component, operation, True)
+    if kind:
+        FAULTS_INJECTED.inc(component, operation, kind)
+    if rule.error_rate and random.random() < rule.error_rate:
+        FAULTS_INJECTED.inc(component, operation, "error")
+        return delay, _error(component, operation, False)
+    return delay, None
+
+
+async def inject(component: str, operation: str):
+    """注入点，按规则等待并抛出异常"""
+    delay, error = _plan(component, operation)
+    if delay:
+        await asyncio.sleep(delay)
+    if error is not None:
+        raise error
+
+
+def arm(component: str, operation: str) -> contextvars.Token:
+    """登记本次调用的故障，推迟到函数内部的 I/O 处注入（见 inject_pending）"""
+    return _pending.set((component, operation))
+
+
+def disarm(token: contextvars.Token):
+    _pending.reset(token)
+
+
+async def inject_pending(component: str):
+    """I/O 处的注入点：注入当前调用中该组件尚未注入的故障，每次调用最多注入一次"""
+    pending = _pending.get()
+    if pending is not None and pending[0] == component:
+        _pending.set(None)
+        await inject(*pending)
+
+
+if settings.fault_injection_enabled:
+    configure(settings.fault_rules)
+
+
+def _authorized(request: Request) -> bool:
+    secret = request.headers.get(SECRET_HEADER, "")
+    return hmac.compare_digest(secret.encode("utf-8"), settings.fault_injection_secret.encode("utf-8"))
+
+
+def _guard(request: Request) -> Optional[JSONResponse]:
+    if not settings.fault_injection_enabled or not settings.fault_injection_secret:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if not _authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return None
+
+
+faults_router = APIRouter(prefix=FAULTS_PATH, include_in_schema=False)
+
+
+@faults_router.get("")
+async def get_rules(request: Request):
+    return _guard(request) or JSONResponse({"rules": rules_dict()})
+
+
+@faults_router.put("")
+async def put_rules(request: Request):
+    denied = _guard(request)
+    if denied:
+        return denied
+    try:
+        configure(json.loads(await request.body()))
+    except ValueError as e:
+        return JSONResponse({"error": f"invalid rules: {e}"}, status_code=400)
+    logger.warning("Fault injection rules replaced: %s", json.dumps(rules_dict(), ensure_ascii=False))
+    return JSONResponse({"rules": rules_dict()})
+
+
+@faults_router.delete("")
+async def delete_rules(request: Request):
+    denied = _guard(request)
+    if denied:
+        return denied
+    configure({})
+    logger.warning("Fault injection rules cleared")
+    return JSONResponse({"rules": {}})
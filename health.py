@@ -0,0 +1,160 @@
+'''
+健康检查与优雅退出模块
+1. /health/live：存活探针，只要事件循环能响应即返回 200
+2. /health/ready：就绪探针，只读取后台任务定期刷新的 MySQL / Redis 状态缓存，探针本身不访问数据库
+3. 收到 SIGTERM 后先把就绪状态置为不可用，等待 DRAIN_DELAY_SECONDS 让负载均衡摘除流量，
+   再交给 uvicorn 停止监听；关闭阶段等待进行中的请求结束（最长 DRAIN_TIMEOUT_SECONDS）
+'''
+import asyncio
+import logging
+import signal
+import time
+from typing import Dict, Optional
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from config import settings
+from mysql_client import router
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class HealthState:
+    """进程健康状态"""
+
+    def __init__(self):
+        self.started = False  # 启动流程是否完成
+        self.draining = False  # 是否处于退出排空阶段
+        self.in_flight = 0  # 进行中的 HTTP 请求数
+        self.dependencies: Dict[str, bool] = {"mysql": False}
+        if settings.redis_host or settings.stand_in_backends:
+            # 会话存储使用进程内后端时可以不配置 Redis
+            self.dependencies["redis"] = False
+        self.checked_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.started and not self.draining and all(self.dependencies.values())
+
+    async def _check_mysql(self) -> bool:
+        # 分片部署时全部分片可用才算可用
+        for db in router.shards:
+            if db.pool is None:
+                return False
+            async with db.get_connection() as conn:
+                await conn.ping(reconnect=False)
+        return True
+
+    async def _check_redis(self) -> bool:
+        if redis_client.client is None:
+            return False
+        return bool(await redis_client.client.ping())
+
+    async def refresh(self):
+        """刷新依赖状态缓存"""
+        for name, check in (("mysql", self._check_mysql), ("redis", self._check_redis)):
+            if name not in self.dependencies:
+                continue
+            try:
+                healthy = await asyncio.wait_for(check(), timeout=settings.health_check_timeout)
+            except Exception as e:
+                logger.warning("Health check failed: %s: %s", name, e)
+                healthy = False
+            if healthy and not self.dependencies[name]:
+                logger.info("Dependency %s is healthy", name)
+            elif not healthy and self.dependencies[name]:
+                logger.warning("Dependency %s is unhealthy", name)
+            self.dependencies[name] = healthy
+        self.checked_at = time.time()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.health_check_interval)
+            await self.refresh()
+
+    async def start(self):
+        """首次刷新后启动后台刷新任务，并接管 SIGTERM"""
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+        self._install_signal_handler()
+        self.started = True
+
+    def _install_signal_handler(self):
+        """包装 uvicorn 的 SIGTERM 处理函数：先置为不可就绪，延迟 DRAIN_DELAY_SECONDS 后再停止服务"""
+        original = signal.getsignal(signal.SIGTERM)
+        if not callable(original):
+            return
+        loop = asyncio.get_running_loop()
+
+        def handle_sigterm(signum, frame):
+            if self.draining:
+                original(signum, frame)
+                return
+            self.draining = True
+            logger.warning("SIGTERM received, draining for %ss before shutdown", settings.drain_delay_seconds)
+            loop.call_soon_threadsafe(loop.call_later, settings.drain_delay_seconds, original, signum, frame)
+
+        try:
+            signal.signal(signal.SIGTERM, handle_sigterm)
+        except ValueError:
+            # 非主线程中无法设置信号处理函数（例如测试环境）
+            pass
+
+    async def drain(self):
+        """停止刷新任务，并等待进行中的请求结束"""
+        self.draining = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        deadline = time.monotonic() + settings.drain_timeout_seconds
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.in_flight > 0:
+            logger.warning("Drain timeout, %s requests still in flight", self.in_flight)
+
+
+# 全局健康状态实例
+health = HealthState()
+
+
+class InFlightMiddleware:
+    """统计进行中的 HTTP 请求数（纯 ASGI 实现）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        health.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            health.in_flight -= 1
+
+
+health_router = APIRouter()
+
+
+@health_router.get("/health/live", include_in_schema=False)
+async def live():
+    return {"status": "ok"}
+
+
+@health_router.get("/health/ready", include_in_schema=False)
+async def ready():
+    body = {
+        "status": "ready" if health.ready else "unavailable",
+        "draining": health.draining,
+        "dependencies": health.dependencies,
+        "checked_at": int(health.checked_at),
+    }
+    return JSONResponse(body, status_code=200 if health.ready else 503)
@@ -0,0 +1,80 @@
+'''
+依赖调用埋点模块
+为 Redis、MySQL、SMS 调用统一记录耗时直方图和链路追踪子 span；
+开启故障注入时按规则注入延迟和错误（见 faults.py）：Redis 和 SMS 在调用前注入，
+MySQL 函数自身捕获数据库异常，故障在函数内部获取连接时注入（见 Database.get_connection），使注入的错误经过同样的异常处理；
+这类函数捕获异常后返回 None / False，由异常处理调用 mark_failed，使本次调用仍记为 error
+'''
+import functools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+import faults
+from metrics import DEPENDENCY_DURATION
+from tracing import start_span, end_span
+
+# 当前带埋点调用的失败标记，每次调用一个
+_failed: ContextVar[Optional[List[bool]]] = ContextVar("instrumented_failed", default=None)
+
+
+def mark_failed():
+    """将当前带埋点的调用记为失败，用于捕获异常后正常返回的函数"""
+    failed = _failed.get()
+    if failed is not None:
+        failed[0] = True
+
+
+def instrumented(component: str, inject_at_io: bool = False):
+    """
+    异步函数埋点装饰器，operation 取函数名，函数抛出异常或调用了 mark_failed 时 outcome 记为 error
+
+    Args:
+        component: 组件名
+        inject_at_io: 为 True 时故障不在调用前注入，而是由函数内部的 I/O 处调用 faults.inject_pending 注入
+    """
+    def decorator(func):
+        operation = func.__name__
+        span_name = f"{component}.{operation}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            token = start_span(span_name)
+            outcome = "error"
+            pending = None
+            failed = [False]
+            failed_token = _failed.set(failed)
+            try:
+                if faults.active:
+                    if inject_at_io:
+                        pending = faults.arm(component, operation)
+                    else:
+                        await faults.inject(component, operation)
+                result = await func(*args, **kwargs)
+                outcome = "error" if failed[0] else "ok"
+                return result
+            finally:
+                _failed.reset(failed_token)
+                if pending is not None:
+                    faults.disarm(pending)
+                DEPENDENCY_DURATION.observe(time.perf_counter() - start, component, operation, outcome)
+                end_span(token, outcome == "error")
+        return wrapper
+    return decorator
+
+
+@asynccontextmanager
+async def instrument(component: str, operation: str):
+    """代码块埋点上下文管理器，用于操作名在运行时才确定等无法使用装饰器的场景（如按服务商区分的短信调用）"""
+    start = time.perf_counter()
+    token = start_span(f"{component}.{operation}")
+    outcome = "error"
+    try:
+        if faults.active:
+            await faults.inject(component, operation)
+        yield
+        outcome = "ok"
+    finally:
+        DEPENDENCY_DURATION.observe(time.perf_counter() - start, component, operation, outcome)
+        end_span(token, outcome == "error")
@@ -0,0 +1,93 @@
+'''
+内部令牌校验模块
+供 RTS 服务等内部服务批量把 login_token 解析为用户，不经过 /login 的事件信封：
+
+    POST /internal/introspect
+    X-Internal-Secret: <INTROSPECTION_SECRET>
+    Content-Type: application/json 或 application/msgpack
+    {"tokens": ["...", "..."], "profile": true}
+
+响应中的 user_ids 与 tokens 一一对应，无效或已过期的 token 为 null；
+profile 为 true 时另外返回 profiles：user_id -> {"user_name", "created_at"}（已停用的用户没有资料）。
+Accept 包含 application/msgpack 时响应以 msgpack 编码，否则为 JSON。
+
+1. 全部 token 通过一次 MGET 解析（embedded 后端直接读内存），资料按分片各一条 IN 查询
+2. 直接解析和编码请求体，不经过 Pydantic 模型
+3. INTROSPECTION_SECRET 为空时接口关闭（返回 404），密钥使用恒定时间比较；
+   该路径只应在内网开放，反向代理不应转发 /internal/ 前缀
+4. 请求体中包含 token，访问日志不记录该路径的请求体（见 main.py）
+'''
+import hmac
+import json
+import logging
+from typing import Any
+import msgpack
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+from config import settings
+from metrics import INTROSPECTED_TOKENS
+from mysql_client import get_users_info
+from redis_client import get_user_ids_by_tokens
+
+logger = logging.getLogger(__name__)
+
+INTROSPECT_PATH = "/internal/introspect"
+SECRET_HEADER = "x-internal-secret"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def _respond(request: Request, body: Any, status_code: int = 200) -> Response:
+    """按 Accept 选择 msgpack 或 JSON 编码"""
+    if "msgpack" in request.headers.get("accept", ""):
+        return Response(msgpack.packb(body), status_code=status_code, media_type=MSGPACK_MEDIA_TYPE)
+    content = json.dumps(body, ensure_ascii=False, separators=(",", ":"))
+    return Response(content, status_code=status_code, media_type="application/json")
+
+
+def _authorized(request: Request) -> bool:
+    secret = request.headers.get(SECRET_HEADER, "")
+    return hmac.compare_digest(secret.encode("utf-8"), settings.introspection_secret.encode("utf-8"))
+
+
+introspection_router = APIRouter()
+
+
+@introspection_router.post(INTROSPECT_PATH, include_in_schema=False)
+async def introspect(request: Request):
+    if not settings.introspection_secret:
+        return _respond(request, {"error": "not found"}, 404)
+    if not _authorized(request):
+        return _respond(request, {"error": "unauthorized"}, 401)
+
+    body = await request.body()
+    try:
+        if "msgpack" in request.headers.get("content-type", ""):
+            payload = msgpack.unpackb(body)
+        else:
+            payload = json.loads(body)
+        tokens = payload["tokens"]
+        if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+            raise ValueError("tokens must be a list of strings")
+        with_profile = bool(payload.get("profile", False))
+    except Exception as e:
+        return _respond(request, {"error": f"invalid request: {e}"}, 400)
+    if len(tokens) > settings.introspection_max_tokens:
+        return _respond(request, {"error": f"too many tokens (max {settings.introspection_max_tokens})"}, 413)
+
+    try:
+        user_ids = await get_user_ids_by_tokens(tokens)
+        valid = [user_id for user_id in user_ids if user_id is not None]
+        result = {"user_ids": user_ids}
+        if with_profile:
+            users = await get_users_info(valid) if valid else {}
+            result["profiles"] = {
+                user_id: {"user_name": user.user_name, "created_at": user.created_at}
+                for user_id, user in users.items()
+            }
+    except Exception as e:
+        logger.error("Token introspection failed: %s", e)
+        return _respond(request, {"error": "backend unavailable"}, 503)
+
+    INTROSPECTED_TOKENS.inc("valid", value=len(valid))
+    INTROSPECTED_TOKENS.inc("invalid", value=len(user_ids) - len(valid))
+    return _respond(request, result)
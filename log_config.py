@@ -0,0 +1,244 @@
+'''
+日志配置模块
+1. 所有日志通过 QueueHandler 进入内存队列，由后台监听线程写出，请求路径上不做任何 IO
+2. 日志以单行 JSON 输出，自动附带 request_id / event_name / user_id 上下文字段
+3. 消息格式化和请求体解析都推迟到监听线程中进行
+4. 敏感字段（验证码、login_token、app_key、volc_sk）在输出前脱敏，被截断而无法解析的请求体按字段名做文本替换
+5. 队列有上限，监听线程跟不上时丢弃新日志并在之后输出一条丢弃计数，不会无限占用内存
+'''
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import re
+import sys
+import time
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional
+
+# 需要脱敏的字段
+SENSITIVE_FIELDS = frozenset({"code", "login_token", "app_key", "volc_sk"})
+REDACTED = "***"
+
+# 无法解析为 JSON 的文本（如被截断的请求体）中敏感字段的值，键名前后的反斜杠对应嵌套在字符串中的 JSON
+_SENSITIVE_TEXT = re.compile(
+    r'(\\*"(?:' + "|".join(map(re.escape, sorted(SENSITIVE_FIELDS))) + r')\\*"\s*:\s*\\*")[^"\\]*'
+)
+
+# 日志队列的默认上限（条）
+DEFAULT_QUEUE_SIZE = 10000
+
+# 附加到每条日志上的上下文字段
+CONTEXT_FIELDS = ("request_id", "trace_id", "event_name", "user_id")
+
+# 当前请求的日志上下文；使用可变字典，使处理函数中绑定的字段对中间件同样可见
+_log_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_context", default=None)
+
+# LogRecord 的标准属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+# Python 3.12 之前无法在其他线程中读取任务的 Context，因此另外记录 任务 -> 日志上下文，供事件循环监控使用
+_TRACK_TASKS = sys.version_info < (3, 12)
+_task_log_contexts: "weakref.WeakKeyDictionary[asyncio.Task, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def new_log_context(request_id: str) -> Dict[str, Any]:
+    """为当前请求创建新的日志上下文"""
+    context = {"request_id": request_id}
+    _log_context.set(context)
+    if _TRACK_TASKS:
+        task = asyncio.current_task()
+        if task is not None:
+            _task_log_contexts[task] = context
+    return context
+
+
+def bind_log_context(**fields):
+    """向当前请求的日志上下文中绑定字段（如 event_name、user_id）"""
+    context = _log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def get_log_context() -> Dict[str, Any]:
+    """获取当前请求的日志上下文"""
+    return _log_context.get() or {}
+
+
+def get_task_log_context(task: asyncio.Task) -> Dict[str, Any]:
+    """获取指定任务的日志上下文，可在其他线程中调用"""
+    if _TRACK_TASKS:
+        return _task_log_contexts.get(task) or {}
+    return task.get_context().get(_log_context) or {}
+
+
+def redact(value: Any, mask: Optional[Callable[[str], str]] = None) -> Any:
+    """
+    递归脱敏敏感字段
+
+    字符串形式的 JSON（如 RequestModel.content）会被解析后一并脱敏；
+    只脱敏字符串值，避免误伤 ResponseModel 中数值类型的 code 字段。
+    mask 用于自定义敏感值的替换方式，默认替换为 REDACTED。
+    """
+    if isinstance(value, dict):
+        return {
+            key: (mask(item) if mask else REDACTED) if key in SENSITIVE_FIELDS and isinstance(item, str)
+            else redact(item, mask)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, mask) for item in value]
+    if isinstance(value, str) and value[:1] in ("{", "["):
+        try:
+            return redact(json.loads(value), mask)
+        except ValueError:
+            return value
+    return value
+
+
+def redact_text(text: str) -> str:
+    """按字段名替换文本中敏感字段的值，用于无法解析为 JSON 的文本"""
+    return _SENSITIVE_TEXT.sub(lambda match: match.group(1) + REDACTED, text)
+
+
+def decode_body(body: Any, truncated: bool = False) -> Any:
+    """将原始请求体/响应体解码为脱敏后的 JSON 对象或字符串"""
+    if isinstance(body, (bytes, bytearray)):
+        text = bytes(body).decode("utf-8", errors="ignore")
+        if truncated:
+            return redact_text(text) + " ... <truncated>"
+        try:
+            return redact(json.loads(text))
+        except ValueError:
+            return redact_text(text)
+    return redact(body)
+
+
+class ContextFilter(logging.Filter):
+    """在调用方线程中把请求上下文写入日志记录"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if context:
+            for field in CONTEXT_FIELDS:
+                if field in context and not hasattr(record, field):
+                    setattr(record, field, context[field])
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    不在调用方线程中格式化消息的 QueueHandler，格式化交给监听线程完成
+    队列已满时丢弃日志并计数，下一条成功入队的日志之前补一条丢弃计数
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Log queue full, %s records dropped", "args": (self.dropped,),
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BoundedQueueListener(QueueListener):
+    """停止时阻塞等待队列有空位再放入结束标记，队列已满时不会失败"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志格式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key in _RECORD_ATTRS or key.startswith("_"):
+                continue
+            if key.endswith("_body"):
+                value = decode_body(value, getattr(record, key + "_truncated", False))
+            entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    """本地调试使用的文本格式，上下文字段附加在行尾"""
+
+    def __init__(self):
+        super().__init__(
+            fmt="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = {
+            key: decode_body(value, getattr(record, key + "_truncated", False)) if key.endswith("_body") else value
+            for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS and not key.startswith("_")
+        }
+        if extras:
+            line += " " + json.dumps(extras, ensure_ascii=False, default=str)
+        return line
+
+
+def setup_logging(level: int, json_format: bool = True, stream=None, queue_size: int = DEFAULT_QUEUE_SIZE):
+    """
+    配置根日志器：根日志器只挂载一个 QueueHandler，真正的输出在后台线程中完成
+
+    Args:
+        level: 日志级别
+        json_format: 是否输出单行 JSON，False 时输出文本格式
+        stream: 输出流，默认为标准错误
+        queue_size: 队列上限（条），超出时丢弃新日志
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if json_format else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = BoundedQueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """停止后台监听线程，并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,183 +1,173 @@
-import json
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+import random
 import time
+import uuid
+from typing import Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from log_config import new_log_context
+from capture import TrafficCapture
 
 
 logger = logging.getLogger(__name__)
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """请求日志中间件"""
-    
-    async def dispatch(self, request: Request, call_next):
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class BoundedBuffer:
+    """有上限的字节缓冲区，超出上限的部分只计数不保存"""
+
+    __slots__ = ("limit", "data", "total")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.data = bytearray()
+        self.total = 0
+
+    def append(self, chunk: bytes):
+        remaining = self.limit - len(self.data)
+        if remaining > 0:
+            self.data += chunk[:remaining]
+        self.total += len(chunk)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.data)
+
+
+class RequestLoggingMiddleware:
+    """
+    请求日志中间件（纯 ASGI 实现）
+
+    为每个请求分配 request_id 并写入日志上下文，请求结束时输出一条结构化访问日志。
+    被采样的请求会把请求体和响应体在流经中间件时旁路复制到有上限的缓冲区中，
+    不会提前读取请求体，也不会重建响应对象，流式响应保持原样透传；
+    请求体的解码和脱敏由日志监听线程完成。
+    传入 capture 时，被录制的请求同样旁路复制请求体，即使访问日志处于关闭状态。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        enabled: bool = True,
+        max_body_bytes: int = 10 * 1024,
+        sample_rate: float = 1.0,
+        route_sample_rates: Optional[Dict[str, float]] = None,
+        capture: Optional[TrafficCapture] = None
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.max_body_bytes = max_body_bytes  # 日志中记录的最大字节数，超过会被截断
+        self.sample_rate = sample_rate  # 完整记录请求体/响应体的默认采样率
+        self.route_sample_rates = route_sample_rates or {}  # 按路由覆盖的采样率
+        self.capture = capture  # 流量录制，为 None 时不录制
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = self._get_request_id(scope)
+        new_log_context(request_id)
+
+        path = scope["path"]
+        log_enabled = self.enabled and logger.isEnabledFor(logging.INFO)
+        record = self.capture is not None and self.capture.should_record(path)
+        if not log_enabled and not record:
+            await self.app(scope, receive, self._with_request_id(send, request_id))
+            return
+
         # 记录请求开始时间
-        start_time = time.time()
-        
-        # 获取请求体（对于可能验证失败的情况特别重要）
-        request_body = await self._get_request_body(request)
-        
-        # 记录请求信息
-        logger.info(f"请求开始: {request.method} {request.url}")
-        logger.info(f"请求头: {dict(request.headers)}")
-        logger.info(f"查询参数: {dict(request.query_params)}")
-        logger.info(f"路径参数: {request.path_params}")
-        
-        if request_body:
-            # 格式化请求体为易读JSON
-            formatted_request_body = self._format_body(request_body)
-            logger.info(f"请求体: {formatted_request_body}")
-        
-        # 存储请求体到 state 以便后续使用
-        request.state.request_body = request_body
-        
+        started_at = time.time()
+        start_time = time.perf_counter()
+        sample_body = log_enabled and random.random() < self.route_sample_rates.get(path, self.sample_rate)
+        capture = sample_body or record
+        request_buffer = BoundedBuffer(self.max_body_bytes) if capture else None
+        response_buffer = BoundedBuffer(self.max_body_bytes) if capture else None
+        response_start = {}
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                request_buffer.append(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())]
+                response_start.update(message)
+            elif capture and message["type"] == "http.response.body":
+                response_buffer.append(message.get("body", b""))
+            await send(message)
+
         try:
             # 继续处理请求
-            response = await call_next(request)
-        except Exception as e:
+            await self.app(scope, receive_wrapper if capture else receive, send_wrapper)
+        except Exception:
             # 处理异常
-            logger.error(f"请求处理异常: {str(e)}")
-            logger.error(f"请求URL: {request.url}")
-            if hasattr(request.state, 'request_body'):
-                formatted_request_body = self._format_body(request.state.request_body)
-                logger.error(f"请求体: {formatted_request_body}")
+            if log_enabled:
+                logger.exception(
+                    "请求处理异常: %s %s", scope["method"], path,
+                    extra=self._body_fields("request", request_buffer if sample_body else None, scope.get("headers", []))
+                )
             raise
 
-        # 尝试读取并记录响应体（安全且有限制）
-        response_body = None
-        try:
-            max_bytes = 10 * 1024  # 日志中记录的最大字节数，超过会被截断
-            content_type = response.headers.get("content-type", "")
-            # 对于可能的文件/大流式响应，避免读取大量数据
-            content_length = response.headers.get("content-length")
-            should_try_read = False
-            if content_length is not None:
-                try:
-                    should_try_read = int(content_length) <= max_bytes
-                except Exception:
-                    should_try_read = False
-            else:
-                # 若没有 content-length，且类型可读时尝试读取
-                if content_type.startswith("application/json") or content_type.startswith("text/"):
-                    should_try_read = True
-
-            if should_try_read:
-                # 首先尝试从 body_iterator 读取（针对 StreamingResponse）
-                if hasattr(response, "body_iterator"):
-                    body = b""
-                    truncated = False
-                    async for chunk in response.body_iterator:
-                        body += chunk
-                        if len(body) > max_bytes:
-                            body = body[:max_bytes]
-                            truncated = True
-                            break
-
-                    # body_iterator 已耗尽，需要创建新的 Response 供客户端使用
-                    from starlette.responses import Response
-                    new_response = Response(content=body, status_code=response.status_code, headers=dict(response.headers), media_type=response.media_type)
-                    response = new_response
-
-                    if body:
-                        try:
-                            if "application/json" in content_type:
-                                response_body = json.loads(body.decode("utf-8"))
-                            else:
-                                response_body = body.decode("utf-8", errors="ignore")
-                            if truncated:
-                                response_body = str(response_body) + " ... <truncated>"
-                        except Exception:
-                            response_body = "<可读响应体解析失败>"
-
-                # 如果没有 body_iterator，尝试从 response.body 读取
-                elif hasattr(response, "body"):
-                    body = response.body
-                    if isinstance(body, (bytes, bytearray)):
-                        truncated = len(body) > max_bytes
-                        if truncated:
-                            body = body[:max_bytes]
-                        try:
-                            if "application/json" in content_type:
-                                response_body = json.loads(body.decode("utf-8"))
-                            else:
-                                response_body = body.decode("utf-8", errors="ignore")
-                            if truncated:
-                                response_body = str(response_body) + " ... <truncated>"
-                        except Exception:
-                            response_body = "<可读响应体解析失败>"
-
-        except Exception as e:
-            logger.warning(f"获取响应体失败: {e}")
-
-        # 计算处理时间
-        process_time = time.time() - start_time
-        
         # 记录响应信息
-        logger.info(f"请求结束: {request.method} {request.url} - 状态码: {response.status_code} - 耗时: {process_time:.4f}s")
-        logger.info(f"响应头: {dict(response.headers)}")
-        if response_body is not None:
-            # 格式化响应体为易读JSON
-            formatted_response_body = self._format_body(response_body)
-            logger.info(f"响应体: {formatted_response_body}")
-        
-        return response
-    
-    async def _get_request_body(self, request: Request):
-        """安全地获取请求体"""
-        try:
-            # 对于JSON请求
-            if request.headers.get("content-type", "").startswith("application/json"):
-                body = await request.body()
-                if body:
-                    try:
-                        return json.loads(body.decode("utf-8"))
-                    except json.JSONDecodeError:
-                        return body.decode("utf-8")
-            
-            # 对于表单数据
-            elif request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
-                form_data = await request.form()
-                return dict(form_data)
-            
-            # 对于 multipart/form-data
-            elif request.headers.get("content-type", "").startswith("multipart/form-data"):
-                # 注意：对于文件上传，不要读取整个文件到内存
-                form_data = await request.form()
-                result = {}
-                for key, value in form_data.items():
-                    if hasattr(value, 'filename'):  # 文件字段
-                        result[key] = f"<文件: {value.filename}, 大小: {value.size}字节>"
-                    else:
-                        result[key] = value
-                return result
-            
-            # 其他类型的请求体
-            else:
-                body = await request.body()
-                if body:
-                    return body.decode("utf-8", errors="ignore")
-                
-        except Exception as e:
-            logger.warning(f"获取请求体失败: {e}")
-        
-        return None
-    
-    def _format_body(self, body):
-        """格式化请求体或响应体为易读JSON"""
-        try:
-            if isinstance(body, (dict, list)):
-                # 如果已经是JSON对象，直接格式化
-                return json.dumps(body, indent=2, ensure_ascii=False)
-            elif isinstance(body, str):
-                # 如果是字符串，尝试解析为JSON后再格式化
-                try:
-                    parsed_json = json.loads(body)
-                    return json.dumps(parsed_json, indent=2, ensure_ascii=False)
-                except (json.JSONDecodeError, TypeError):
-                    # 如果不是JSON字符串，直接返回
-                    return body
-            else:
-                # 其他类型直接返回
-                return body
-        except Exception as e:
-            logger.warning(f"格式化请求体/响应体失败: {e}")
\ No newline at end of file
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        fields = {
+            "method": scope["method"],
+            "path": path,
+            "status": response_start.get("status"),
+            "duration_ms": round(duration_ms, 3),
+        }
+        # 录制请求（请求体被截断的请求无法回放，直接跳过）
+        if record and not request_buffer.truncated:
+            self.capture.submit(
+                started_at, scope["method"], path, fields["status"], duration_ms,
+                bytes(request_buffer.data), bytes(response_buffer.data)
+            )
+        if not log_enabled:
+            return
+
+        if sample_body:
+            fields.update(self._body_fields("request", request_buffer, scope.get("headers", [])))
+            fields.update(self._body_fields("response", response_buffer, response_start.get("headers", [])))
+        logger.info(
+            "请求结束: %s %s - 状态码: %s - 耗时: %.4fs",
+            scope["method"], path, fields["status"], duration_ms / 1000,
+            extra=fields
+        )
+
+    @staticmethod
+    def _get_request_id(scope: Scope) -> str:
+        """优先沿用上游传入的 X-Request-ID，否则生成新的 request_id"""
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER:
+                return value.decode("latin-1")[:64]
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _with_request_id(send: Send, request_id: str) -> Send:
+        """在响应头中附加 X-Request-ID"""
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())]
+            await send(message)
+        return send_wrapper
+
+    @staticmethod
+    def _body_fields(prefix: str, buffer: Optional[BoundedBuffer], raw_headers) -> dict:
+        """生成请求体/响应体日志字段，原始字节交由日志监听线程解码和脱敏"""
+        if buffer is None or not buffer.total:
+            return {}
+        content_type = b""
+        for key, value in raw_headers:
+            if key == b"content-type":
+                content_type = value
+                break
+        # 对于文件上传，只记录大小
+        if content_type.startswith(b"multipart/form-data"):
+            return {f"{prefix}_body": f"<multipart 数据, 大小: {buffer.total}字节>"}
+        return {
+            f"{prefix}_body": buffer.data,
+            f"{prefix}_body_truncated": buffer.truncated,
+        }
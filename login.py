@@ -2,9 +2,10 @@
 与火山veRTC Meeting Demo配套的登录服务器
 '''
 import logging
-import json
-from fastapi import APIRouter
-from fastapi import HTTPException
+import math
+import time
+from typing import Optional
+from fastapi import APIRouter, Request
 from fastapi.middleware.cors import CORSMiddleware
 from models import (
     RequestModel,
@@ -27,7 +28,14 @@ from utils import (
     current_timestamp
     )
 from config import settings
-from volcengine.sms.SmsService import SmsService
+from log_config import bind_log_context
+from metrics import record_request
+from tracing import set_span_attributes
+from admission import limiter
+from ratelimit import rate_limiter, client_ip
+from sms_client import sms_client, CHECK_WRONG, CHECK_EXPIRED
+from fanout import push_fanout
+from audit import audit_log, LOGIN, TOKEN_ISSUE, NAME_CHANGE
 from mysql_client import (
     create_user,
     get_user_info,
@@ -48,57 +56,67 @@ login_router = APIRouter()
 
 # 登录路由
 @login_router.post("/login", tags=["login"])
-async def login(request: RequestModel):
+async def login(request: RequestModel, http_request: Request):
+    start_time = time.perf_counter()
+    code = 500
+    try:
+        # 超出当前优先级的并发额度时直接拒绝，避免在连接池前排队
+        if not limiter.try_acquire(request.event_name.value):
+            code = 503
+            return ResponseModel(code=503, message="服务繁忙，请稍后重试")
+        try:
+            response = await handle_event(request, client_ip(http_request.client, http_request.headers))
+        finally:
+            limiter.release(time.perf_counter() - start_time)
+        code = response.code
+        return response
+    finally:
+        record_request(request.event_name.value, code, time.perf_counter() - start_time)
+        set_span_attributes(event_name=request.event_name.value, code=code)
+
+
+async def handle_event(request: RequestModel, ip: Optional[str] = None) -> ResponseModel:
+    """按 event_name 分发处理登录相关事件"""
     event_name = request.event_name
     content = parse_content(request.content)
+    bind_log_context(event_name=event_name.value)
+
+    # 按手机号、客户端 IP、login_token 限流；content 不是对象时由下面各事件的参数校验返回 400
+    fields = content if isinstance(content, dict) else {}
+    retry_after = await rate_limiter.check(event_name.value, {
+        "phone": fields.get("phone"),
+        "ip": ip,
+        "login_token": fields.get("login_token"),
+    })
+    if retry_after is not None:
+        return ResponseModel(
+            code=429,
+            message=f"请求过于频繁，请{math.ceil(retry_after)}秒后重试"
+        )
 
     # 发送短信验证码
     if event_name == EventName.SEND_SMS_CODE:
         try:
             send_sms_data = SendSmsVerifyCodeRequest(**content)
         except Exception as e:
-            logger.error(f"Invalid request data: {str(e)}")
+            logger.error("Invalid request data: %s", e)
             return ResponseModel(
                 code=400,
                 message="Invalid request data: " + str(e)
             )
         
-        # 调用火山引擎SendSmsVerifyCode接口
+        # 调用短信服务商发送验证码（多个服务商时按延迟和成功率选择，见 sms_client.py）
         try:
-            # 初始化火山引擎SMS服务
-            sms_service = SmsService()
-            sms_service.set_ak(settings.volc_ak)
-            sms_service.set_sk(settings.volc_sk)
-            
-            # 准备发送验证码的参数
-            send_params = {
-                "SmsAccount": settings.sms_account,       # 消息组ID（验码主键之一）
-                "Sign": settings.sms_signature,           # 短信签名，巨思人工智能
-                "TemplateID": settings.sms_template_id,   # 验证码模板ID
-                "PhoneNumber": send_sms_data.phone,       # 接收手机号，不支持批量发送（验码主键之一）
-                "Scene": settings.sms_scene,              # 验证码使用场景（验码主键之一）
-                "ExpireTime": settings.sms_expire_time,   # 验证码有效时间，单位秒
-                "TryCount": settings.sms_try_count,       # 验证码可以尝试验证次数
-                "Tag": ""                                 # 透传字段
-            }
-            
-            # 调用火山引擎发送验证码接口
-            response = sms_service.send_sms_verify_code(json.dumps(send_params))
-            
-            # 检查发送响应
-            if response.get("ResponseMetadata", {}).get("Error"):
-                error_code = response["ResponseMetadata"]["Error"].get("Code", "未知错误")
-                error_msg = response["ResponseMetadata"]["Error"].get("Message", "验证码发送失败")
-                error_info = f"{error_code}: {error_msg}"
-                raise HTTPException(status_code=500, detail=f"SMS send failed: {error_info}")
-            
+            provider = await sms_client.send_code(send_sms_data.phone)
+            set_span_attributes(sms_provider=provider)
+
             return ResponseModel(
                 code=200,
                 message="验证码发送成功"
             )
             
         except Exception as e:
-            logger.error(f"发送验证码失败: {str(e)}")
+            logger.error("发送验证码失败: %s", e)
             return ResponseModel(
                 code=500,
                 message="验证码发送失败：" + str(e)
@@ -109,44 +127,25 @@ async def login(request: RequestModel):
         try:
             sms_login_data = SmsVerifyCodeLoginRequest(**content)
         except Exception as e:
-            logger.error(f"Invalid request data: {str(e)}")
+            logger.error("Invalid request data: %s", e)
             return ResponseModel(
                 code=400,
                 message="Invalid request data: " + str(e)
             )
         
-        # 验证验证码（这里应该调用火山引擎SMS服务进行验证）
+        # 验证验证码（由发送该验证码的短信服务商校验）
         try:
-            # 初始化火山引擎SMS服务
-            sms_service = SmsService()
-            sms_service.set_ak(settings.volc_ak)
-            sms_service.set_sk(settings.volc_sk)
-            
-            # 验证验证码
-            verify_params = {
-                "SmsAccount": settings.sms_account,   # 消息组ID（验码主键之一）
-                "PhoneNumber": sms_login_data.phone,  # 接收手机号（验码主键之一）
-                "Scene": settings.sms_scene,          # 验证码使用场景（验码主键之一）
-                "Code": sms_login_data.code           # 待校验验证码
-            }
-            
-            # 调用验证接口
-            response = sms_service.check_sms_verify_code(json.dumps(verify_params))
-            
-            # 检查验证响应
-            if response.get("ResponseMetadata", {}).get("Error"):
-                error_code = response["ResponseMetadata"]["Error"].get("Code", "未知错误")
-                error_msg = response["ResponseMetadata"]["Error"].get("Message", "验证码验证失败")
-                error_info = f"{error_code}: {error_msg}"
-                raise HTTPException(status_code=500, detail=f"SMS verify failed: {error_info}")
+            result = await sms_client.check_code(sms_login_data.phone, sms_login_data.code)
             
             # 检查校验结果
-            if response.get("Result") == "1":
+            if result == CHECK_WRONG:
+                audit_log.record(LOGIN, phone=sms_login_data.phone, ip=ip, code=441)
                 return ResponseModel(
                     code=441,
                     message="验证码不正确，请重新输入验证码"
                 )
-            elif response.get("Result") == "2":
+            elif result == CHECK_EXPIRED:
+                audit_log.record(LOGIN, phone=sms_login_data.phone, ip=ip, code=440)
                 return ResponseModel(
                     code=440,
                     message="验证码过期，请重新发送验证码"
@@ -154,6 +153,7 @@ async def login(request: RequestModel):
 
             # 验证通过后，先通过手机号查询用户
             user_info = await get_user_by_phone(sms_login_data.phone)
+            new_user = user_info is None
 
             login_token = generate_login_token()
 
@@ -161,7 +161,7 @@ async def login(request: RequestModel):
                 # 老用户：更新最后登录时间
                 update_success = await update_login_time(user_info.user_id)
                 if not update_success:
-                    logger.warning(f"Failed to update login time for user: {user_info.user_id}")
+                    logger.warning("Failed to update login time for user: %s", user_info.user_id)
             else:
                 # 新用户：创建用户记录
                 new_user_id = generate_user_id()
@@ -183,6 +183,8 @@ async def login(request: RequestModel):
                         message="用户信息存储失败"
                     )
 
+            bind_log_context(user_id=user_info.user_id)
+
             # 将 login_token 存储到 Redis，设置 15 天过期
             redis_success = await set_login_token(login_token, user_info.user_id)
             if not redis_success:
@@ -191,6 +193,12 @@ async def login(request: RequestModel):
                     message="登录令牌缓存失败"
                 )
 
+            audit_log.record(
+                LOGIN, user_id=user_info.user_id, phone=sms_login_data.phone, ip=ip,
+                detail={"new_user": new_user}
+            )
+            audit_log.record(TOKEN_ISSUE, user_id=user_info.user_id, ip=ip, detail={"token": login_token[:8]})
+
             # 返回用户信息时附加 login_token
             user_info.login_token = login_token
 
@@ -201,7 +209,7 @@ async def login(request: RequestModel):
             )
             
         except Exception as e:
-            logger.error(f"验证码验证失败: {str(e)}")
+            logger.error("验证码验证失败: %s", e)
             return ResponseModel(
                 code=500,
                 message="验证码验证失败：" + str(e)
@@ -212,7 +220,7 @@ async def login(request: RequestModel):
         try:
             set_app_info_data = SetAppInfoRequest(**content)
         except Exception as e:
-            logger.error(f"Invalid request data: {str(e)}")
+            logger.error("Invalid request data: %s", e)
             return ResponseModel(
                 code=400,
                 message="Invalid request data: " + str(e)
@@ -225,6 +233,7 @@ async def login(request: RequestModel):
                 code=450,
                 message="Invalid login_token"
             )
+        bind_log_context(user_id=user_id)
         
         # 生成RTS状态信息
         rts_token = generate_wildcard_token(user_id=user_id)
@@ -248,7 +257,7 @@ async def login(request: RequestModel):
         try:
             change_name_data = ChangeUserNameRequest(**content)
         except Exception as e:
-            logger.error(f"Invalid request data: {str(e)}")
+            logger.error("Invalid request data: %s", e)
             return ResponseModel(
                 code=400,
                 message="Invalid request data: " + str(e)
@@ -261,6 +270,7 @@ async def login(request: RequestModel):
                 code=450,
                 message="Invalid login_token"
             )
+        bind_log_context(user_id=user_id)
 
         # 更新用户名
         success = await update_user_name(user_id, change_name_data.user_name)
@@ -270,10 +280,15 @@ async def login(request: RequestModel):
                 message="Failed to update user name"
             )
 
+        audit_log.record(NAME_CHANGE, user_id=user_id, ip=ip, detail={"user_name": change_name_data.user_name})
+
+        # 通知该用户已建立的 WebSocket 连接（例如其他设备，可能在其他节点上）
+        push_fanout.push(user_id, {"event": "userNameChanged", "user_name": change_name_data.user_name})
+
         return ResponseModel()
     
     else:
-        logger.error(f"Unknown event_name: {event_name}")
+        logger.error("Unknown event_name: %s", event_name)
         return ResponseModel(
             code=400,
             message="Unknown event_name: " + event_name
@@ -0,0 +1,99 @@
+'''
+事件循环监控模块
+1. 后台任务每隔 LOOP_LAG_INTERVAL 秒测量一次调度延迟（实际唤醒时间与预期之差），记入直方图
+2. 看门狗线程检查事件循环的心跳，单个回调阻塞超过 LOOP_BLOCK_THRESHOLD 秒时，
+   从看门狗线程采集事件循环线程的调用栈，连同当前请求的 event_name / request_id 一起输出告警日志
+'''
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+from config import settings
+from log_config import get_task_log_context
+from metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """事件循环延迟测量与阻塞检测"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0  # 事件循环最近一次开始等待的时间
+        self._reported = 0.0  # 已经上报过的心跳，避免同一次阻塞重复上报
+
+    async def _measure(self):
+        interval = settings.loop_lag_interval
+        while True:
+            start = time.monotonic()
+            self._heartbeat = start
+            await asyncio.sleep(interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.monotonic() - start - interval))
+
+    def _watch(self):
+        interval = settings.loop_lag_interval
+        threshold = settings.loop_block_threshold
+        while not self._stopping.wait(threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - interval
+            if blocked > threshold and heartbeat != self._reported:
+                self._reported = heartbeat
+                self._report(blocked)
+
+    def _report(self, blocked: float):
+        """在看门狗线程中采集事件循环线程的调用栈"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        # 读取事件循环正在执行的任务；循环线程此时处于阻塞状态，跨线程读取是安全的
+        task = asyncio.tasks._current_tasks.get(self._loop)
+        context = get_task_log_context(task) if task is not None else {}
+        event_name = context.get("event_name", "")
+        logger.warning(
+            "Event loop blocked for more than %.3fs (event_name=%s)", blocked, event_name or "-",
+            extra={
+                "blocked_seconds": round(blocked, 3),
+                "blocked_task": task.get_name() if task is not None else "",
+                "blocked_stack": stack,
+                # 看门狗线程没有请求上下文，显式带上阻塞任务的上下文字段
+                "request_id": context.get("request_id", ""),
+                "event_name": event_name,
+            }
+        )
+        # 指标只在事件循环线程中更新，阻塞结束后才会计数
+        self._loop.call_soon_threadsafe(EVENT_LOOP_BLOCKED.inc, event_name)
+
+    def start(self):
+        if not settings.loop_monitor_enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# 全局事件循环监控实例
+loop_monitor = LoopMonitor()
@@ -2,19 +2,34 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
+from log_config import setup_logging
 from log_mw import RequestLoggingMiddleware
 from login import login_router
+from metrics import metrics_router, snapshot_writer
+from tracing import TracingMiddleware, exporter
+from capture import traffic_capture
+from loop_monitor import loop_monitor
 from mysql_client import init_db, close_db
-from redis_client import init_redis, close_redis
+from migrate import migrate_on_startup
+from redis_client import init_redis, close_redis, init_session_store, close_session_store
+from cleanup_job import cleanup_job
+from server import db_pool_size
+from health import health, health_router, InFlightMiddleware
+from warmup import warm_up
+from ws_manager import manager, ws_router
+from introspection import introspection_router, INTROSPECT_PATH
+from memprof import memprof_router
+from faults import faults_router
+from fanout import push_fanout
+from audit import audit_log
 
 
 # 配置日志
 log_level = logging.DEBUG if settings.debug else logging.WARNING
-logging.basicConfig(
-    level=log_level,
-    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+setup_logging(log_level, json_format=settings.log_json, queue_size=settings.log_queue_size)
+if settings.request_log_enabled and not settings.debug:
+    # 访问日志为 INFO 级别，根日志器为 WARNING 时单独放开请求日志中间件的日志器
+    logging.getLogger(RequestLoggingMiddleware.__module__).setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -23,18 +38,53 @@ async def lifespan(app: FastAPI):
     """应用生命周期事件"""
 
     # 启动事件
-    logger.info(f"启动 {settings.app_name} v{settings.app_version}")
+    logger.info("启动 %s v%s", settings.app_name, settings.app_version)
 
     # 初始化数据库连接
-    await init_db()
+    await init_db(minsize=settings.db_pool_minsize, maxsize=db_pool_size())
     logger.info("数据库连接池已初始化")
 
+    # 执行或检查数据库迁移
+    await migrate_on_startup()
+
     # 初始化 Redis 连接
     await init_redis()
     logger.info("Redis 连接已建立")
 
+    # 启动会话存储
+    await init_session_store()
+
+    # 启动 span 导出线程
+    exporter.start()
+
+    # 启动审计事件写出任务
+    audit_log.start()
+
+    # 启动流量录制线程（仅配置了 CAPTURE_PATH 时）
+    traffic_capture.start()
+
+    # 启动事件循环延迟测量与阻塞检测
+    loop_monitor.start()
+
+    # 启动指标快照写出任务（仅多进程模式）
+    snapshot_writer.start()
+
+    # 启动后台维护任务
+    if settings.cleanup_enabled:
+        cleanup_job.start()
+
     # 启动心跳监控
-    #await manager.start_heartbeat_monitor()
+    await manager.start_heartbeat_monitor()
+
+    # 订阅跨节点推送频道
+    await push_fanout.start()
+
+    # 启动预热，完成后才报告就绪
+    if settings.warmup_enabled:
+        await warm_up(app)
+
+    # 启动依赖状态刷新任务，此后就绪探针开始返回可用
+    await health.start()
 
     logger.info("应用启动完成")
     
@@ -43,14 +93,42 @@ async def lifespan(app: FastAPI):
     # 关闭事件
     logger.info("应用正在关闭...")
 
+    # 等待进行中的请求结束
+    await health.drain()
+
     # 关闭所有 WebSocket 连接
-    #for connection_id in list(manager.active_connections.keys()):
-    #    await manager.disconnect(connection_id, reason="服务器关闭")
+    for connection_id in list(manager.active_connections.keys()):
+        await manager.disconnect(connection_id, reason="server shutdown")
+    await manager.stop_heartbeat_monitor()
+
+    # 移除本节点的在线状态，发出剩余的推送
+    await push_fanout.stop()
+
+    # 停止后台维护任务
+    await cleanup_job.stop()
+
+    # 停止事件循环监控
+    await loop_monitor.stop()
+
+    # 写出最终的指标快照
+    await snapshot_writer.stop()
+
+    # 写出剩余的 span
+    exporter.stop()
+
+    # 写出剩余的审计事件
+    await audit_log.stop()
+
+    # 写出剩余的录制记录
+    traffic_capture.stop()
 
     # 关闭数据库连接
     await close_db()
     logger.info("数据库连接已关闭")
 
+    # 关闭会话存储（进程内后端写出最终快照）
+    await close_session_store()
+
     # 关闭 Redis 连接
     await close_redis()
     logger.info("Redis 连接已关闭")
@@ -74,12 +152,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 添加Log中间件
-if settings.debug:
-    app.add_middleware(RequestLoggingMiddleware)
+# 添加进行中请求计数中间件（位于 CORS 中间件外层、链路追踪中间件内层，用于退出时排空请求）
+app.add_middleware(InFlightMiddleware)
+
+# 添加链路追踪中间件（位于Log中间件内层，以便把 trace_id 写入日志上下文）
+app.add_middleware(TracingMiddleware, sample_rate=settings.trace_sample_rate)
+
+# 添加Log中间件（始终负责分配 request_id，访问日志仅在调试模式或显式开启时输出，同时负责流量录制）
+app.add_middleware(
+    RequestLoggingMiddleware,
+    enabled=settings.debug or settings.request_log_enabled,
+    sample_rate=settings.log_body_sample_rate,
+    # 内部令牌校验接口的请求体中包含 token，不记录
+    route_sample_rates={**settings.log_body_sample_routes, INTROSPECT_PATH: 0.0},
+    capture=traffic_capture,
+)
 
 # 注册路由
 app.include_router(login_router, prefix=settings.api_vstr, tags=["JUSI Login Server"])
+app.include_router(ws_router, prefix=settings.api_vstr)
+app.include_router(metrics_router)
+app.include_router(health_router)
+app.include_router(introspection_router)
+app.include_router(memprof_router)
+app.include_router(faults_router)
 
 # 处理根路径请求
 @app.get("/")
@@ -89,12 +185,5 @@ async def root():
 
 # 启动应用
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "main:app",
-        host=settings.bind_addr,
-        port=settings.bind_port,
-        reload=settings.debug,
-        reload_dirs=["."],
-        log_level=log_level,
-        )
\ No newline at end of file
+    from server import run
+    run()
@@ -0,0 +1,245 @@
+'''
+内存分析模块
+用于在线上进程中定位内存占用，接口位于 /internal/debug/memory，请求头 X-Internal-Secret 需与 MEMPROF_SECRET 一致：
+
+    GET  /internal/debug/memory            进程内存概况（RSS、tracemalloc 状态、GC 计数）
+    POST /internal/debug/memory/start      开始 tracemalloc 跟踪（?frames=记录的调用栈深度），并记录基线快照
+    POST /internal/debug/memory/stop       停止跟踪并丢弃快照
+    GET  /internal/debug/memory/top        当前分配最多的位置（?limit=&group_by=lineno|filename|traceback）
+    GET  /internal/debug/memory/diff       与基线快照相比增长最多的位置（?rebase=true 时以当前快照作为新基线）
+    GET  /internal/debug/memory/objects    本项目各类对象（UserInfo、AccessToken、各响应模型等）的实例数
+    GET  /internal/debug/memory/caches     各模块登记的进程内缓存和队列的条目数
+
+1. 未开始跟踪时没有任何额外开销；跟踪期间每次分配都要记录调用栈，应在排查完成后及时停止
+2. objects 需要遍历全部 GC 对象，耗时与堆大小成正比，在线程中执行以免长时间阻塞事件循环
+3. 多 worker 部署时请求只会落在其中一个进程上，响应中的 pid 标识该进程
+4. MEMPROF_SECRET 为空时接口关闭（返回 404）
+
+各模块通过 register_cache 登记自己的缓存，本模块不引用其他业务模块。
+'''
+import asyncio
+import gc
+import hmac
+import os
+import sys
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from config import settings
+
+MEMPROF_PREFIX = "/internal/debug/memory"
+SECRET_HEADER = "x-internal-secret"
+MAX_LIMIT = 200
+
+# 快照中忽略的分配位置
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# 即使实例数为 0 也出现在 objects 结果中的类型
+TRACKED_TYPES = ("UserInfo", "AccessToken", "ResponseModel", "LoginReturn", "SetAppInfoReturn", "RequestModel")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 进程内缓存：名称 -> 返回当前条目数的函数
+_caches: Dict[str, Callable[[], int]] = {}
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def register_cache(name: str, size: Callable[[], int]):
+    """
+    登记进程内缓存或队列，/internal/debug/memory/caches 返回其当前条目数
+
+    Args:
+        name: 缓存名称，如 "ratelimit.local_windows"
+        size: 返回当前条目数的函数，只在请求该接口时调用
+    """
+    _caches[name] = size
+
+
+def cache_sizes() -> Dict[str, int]:
+    sizes = {}
+    for name, size in sorted(_caches.items()):
+        try:
+            sizes[name] = size()
+        except Exception:
+            sizes[name] = -1
+    return sizes
+
+
+def _rss_bytes() -> Optional[int]:
+    """当前常驻内存（仅 Linux）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _short_path(filename: str) -> str:
+    """去掉项目目录和 Python 安装目录前缀，缩短响应"""
+    for prefix in (ROOT, sys.prefix, sys.base_prefix):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def _statistics(group_by: str, limit: int, baseline: Optional[tracemalloc.Snapshot] = None):
+    """在线程中执行：拍摄快照并统计，传入 baseline 时与之比较"""
+    snapshot = _take_snapshot()
+    stats = snapshot.compare_to(baseline, group_by) if baseline is not None else snapshot.statistics(group_by)
+    return snapshot, stats[:max(1, min(limit, MAX_LIMIT))]
+
+
+def _format_stat(stat, group_by: str) -> dict:
+    frames = [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+    item = {
+        "location": frames if group_by == "traceback" else frames[0],
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        item["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        item["count_diff"] = stat.count_diff
+    return item
+
+
+def count_objects(limit: int) -> Dict[str, int]:
+    """统计本项目模块中定义的类型的实例数"""
+    project_modules = {
+        name for name, module in list(sys.modules.items())
+        if (getattr(module, "__file__", None) or "").startswith(ROOT + os.sep)
+    }
+    counts: Counter = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls.__module__ in project_modules:
+            counts[cls.__qualname__] += 1
+    result = {name: counts.get(name, 0) for name in TRACKED_TYPES}
+    for name, count in counts.most_common(limit):
+        result.setdefault(name, count)
+    return result
+
+
+def _authorized(request: Request) -> bool:
+    secret = request.headers.get(SECRET_HEADER, "")
+    return hmac.compare_digest(secret.encode("utf-8"), settings.memprof_secret.encode("utf-8"))
+
+
+def _guard(request: Request) -> Optional[JSONResponse]:
+    if not settings.memprof_secret:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if not _authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return None
+
+
+def _not_tracing() -> JSONResponse:
+    return JSONResponse({"error": "tracemalloc is not tracing, POST /start first"}, status_code=409)
+
+
+def _status() -> dict:
+    status = {
+        "pid": os.getpid(),
+        "rss_bytes": _rss_bytes(),
+        "tracing": tracemalloc.is_tracing(),
+        "gc_counts": gc.get_count(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        status.update(
+            traced_frames=tracemalloc.get_traceback_limit(),
+            traced_bytes=current,
+            traced_peak_bytes=peak,
+            tracemalloc_overhead_bytes=tracemalloc.get_tracemalloc_memory(),
+        )
+    return status
+
+
+memprof_router = APIRouter(prefix=MEMPROF_PREFIX, include_in_schema=False)
+
+
+@memprof_router.get("")
+async def status(request: Request):
+    return _guard(request) or JSONResponse(_status())
+
+
+@memprof_router.post("/start")
+async def start(request: Request, frames: int = 1):
+    global _baseline
+    denied = _guard(request)
+    if denied:
+        return denied
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 50)))
+        _baseline = _take_snapshot()
+    return JSONResponse(_status())
+
+
+@memprof_router.post("/stop")
+async def stop(request: Request):
+    global _baseline
+    denied = _guard(request)
+    if denied:
+        return denied
+    tracemalloc.stop()
+    _baseline = None
+    return JSONResponse(_status())
+
+
+@memprof_router.get("/top")
+async def top(request: Request, limit: int = 25, group_by: str = "lineno"):
+    denied = _guard(request)
+    if denied:
+        return denied
+    if not tracemalloc.is_tracing():
+        return _not_tracing()
+    if group_by not in ("lineno", "filename", "traceback"):
+        return JSONResponse({"error": "group_by must be lineno, filename or traceback"}, status_code=400)
+    _, stats = await asyncio.to_thread(_statistics, group_by, limit)
+    return JSONResponse({
+        **_status(),
+        "top": [_format_stat(stat, group_by) for stat in stats],
+    })
+
+
+@memprof_router.get("/diff")
+async def diff(request: Request, limit: int = 25, group_by: str = "lineno", rebase: bool = False):
+    global _baseline
+    denied = _guard(request)
+    if denied:
+        return denied
+    if not tracemalloc.is_tracing() or _baseline is None:
+        return _not_tracing()
+    if group_by not in ("lineno", "filename", "traceback"):
+        return JSONResponse({"error": "group_by must be lineno, filename or traceback"}, status_code=400)
+    snapshot, stats = await asyncio.to_thread(_statistics, group_by, limit, _baseline)
+    if rebase:
+        _baseline = snapshot
+    return JSONResponse({
+        **_status(),
+        "diff": [_format_stat(stat, group_by) for stat in stats],
+    })
+
+
+@memprof_router.get("/objects")
+async def objects(request: Request, limit: int = 50):
+    denied = _guard(request)
+    if denied:
+        return denied
+    counts = await asyncio.to_thread(count_objects, max(1, min(limit, MAX_LIMIT)))
+    return JSONResponse({"pid": os.getpid(), "objects": counts})
+
+
+@memprof_router.get("/caches")
+async def caches(request: Request):
+    return _guard(request) or JSONResponse({"pid": os.getpid(), "caches": cache_sizes()})
@@ -0,0 +1,305 @@
+'''
+指标采集模块
+提供 Prometheus 文本格式的 /metrics 接口：
+1. 按 EventName 和返回码统计的请求数与耗时直方图
+2. Redis、MySQL、SMS 各依赖调用的耗时直方图（SMS 按服务商区分）
+3. 事件循环调度延迟直方图和阻塞次数
+4. 自适应并发上限、进行中请求数和被拒绝的请求数
+5. 被限流的请求数
+6. WebSocket 连接数、推送的消息数和断开次数，以及跨节点推送的发布次数
+7. 写出和丢弃的审计事件数
+8. 内部令牌校验接口解析的 token 数
+9. 故障注入的次数
+10. 短信请求路由到各服务商的次数，以及以各服务商为首选的进程数
+
+指标只在事件循环线程中更新，直接修改进程内的字典和列表，不使用锁；
+多 worker 部署时每个进程定期把快照写入 METRICS_DIR，/metrics 汇总目录下所有进程的数据；
+已退出（或长时间未更新快照）的进程只计入计数器和直方图，不计入瞬时值。
+'''
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from config import settings
+from memprof import register_cache
+
+logger = logging.getLogger(__name__)
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 快照超过该倍数的写出间隔未更新时，视为进程已停止
+STALE_FLUSH_INTERVALS = 3
+
+
+class Counter:
+    """计数器"""
+
+    __slots__ = ("name", "help", "label_names", "series")
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+
+class Gauge(Counter):
+    """瞬时值，多进程汇总时取各进程之和"""
+
+    __slots__ = ()
+    type = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.series[labels] = value
+
+
+class Histogram:
+    """直方图，每个标签组合保存各分桶的（非累计）计数，最后一个元素为观测值之和"""
+
+    __slots__ = ("name", "help", "label_names", "buckets", "series")
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        values = self.series.get(labels)
+        if values is None:
+            # len(buckets) 个分桶 + Inf 分桶 + sum
+            values = self.series[labels] = [0] * (len(self.buckets) + 2)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+
+# 全局指标注册表
+REGISTRY: Dict[str, object] = {}
+
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+REQUESTS_TOTAL = _register(Counter(
+    "jusi_requests_total", "登录接口请求数", ("event_name", "code")))
+REQUEST_DURATION = _register(Histogram(
+    "jusi_request_duration_seconds", "登录接口请求耗时", ("event_name", "code")))
+DEPENDENCY_DURATION = _register(Histogram(
+    "jusi_dependency_duration_seconds", "依赖调用耗时", ("component", "operation", "outcome")))
+EVENT_LOOP_LAG = _register(Histogram(
+    "jusi_event_loop_lag_seconds", "事件循环调度延迟", (),
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+EVENT_LOOP_BLOCKED = _register(Counter(
+    "jusi_event_loop_blocked_total", "事件循环被单个回调阻塞超过阈值的次数", ("event_name",)))
+ADMISSION_LIMIT = _register(Gauge(
+    "jusi_admission_limit", "自适应并发上限", ()))
+ADMISSION_IN_FLIGHT = _register(Gauge(
+    "jusi_admission_in_flight", "已放行且未完成的登录接口请求数", ()))
+ADMISSION_SHED = _register(Counter(
+    "jusi_admission_shed_total", "因超出并发额度被拒绝的请求数", ("event_name",)))
+RATE_LIMITED = _register(Counter(
+    "jusi_rate_limited_total", "被限流的请求数（source 为 local 表示在本地拒绝）", ("event_name", "dimension", "source")))
+WS_CONNECTIONS = _register(Gauge(
+    "jusi_ws_connections", "WebSocket 连接数", ()))
+WS_PUSHED = _register(Counter(
+    "jusi_ws_pushed_total", "推送的 WebSocket 消息数", ("event",)))
+WS_DISCONNECTS = _register(Counter(
+    "jusi_ws_disconnects_total", "服务端主动断开的 WebSocket 连接数", ("code",)))
+PUSH_FANOUT_PUBLISHES = _register(Counter(
+    "jusi_push_fanout_publishes_total", "跨节点推送的发布次数（每次发布包含发往同一节点的一批消息）", ()))
+PUSH_FANOUT_MESSAGES = _register(Counter(
+    "jusi_push_fanout_messages_total", "跨节点发送和收到的推送数", ("direction",)))
+AUDIT_WRITTEN = _register(Counter(
+    "jusi_audit_written_total", "写出的审计事件数", ()))
+AUDIT_DROPPED = _register(Counter(
+    "jusi_audit_dropped_total", "丢弃的审计事件数（队列已满或写出失败）", ("reason",)))
+INTROSPECTED_TOKENS = _register(Counter(
+    "jusi_introspected_tokens_total", "内部令牌校验接口解析的 login_token 数", ("result",)))
+FAULTS_INJECTED = _register(Counter(
+    "jusi_faults_injected_total", "注入的依赖故障数（仅压测时开启）", ("component", "operation", "fault")))
+SMS_ROUTED = _register(Counter(
+    "jusi_sms_routed_total", "路由到各短信服务商的调用数", ("provider", "operation", "reason")))
+SMS_PREFERRED = _register(Gauge(
+    "jusi_sms_preferred_provider", "当前以该服务商为首选的进程数", ("provider",)))
+
+register_cache("metrics.series", lambda: sum(len(metric.series) for metric in REGISTRY.values()))
+
+
+def record_request(event_name: str, code: int, seconds: float):
+    """记录一次登录接口请求"""
+    code = str(code)
+    REQUESTS_TOTAL.inc(event_name, code)
+    REQUEST_DURATION.observe(seconds, event_name, code)
+
+
+# 多进程汇总
+
+def snapshot() -> Dict[str, dict]:
+    """导出当前进程的指标快照"""
+    return {
+        name: {"series": [[list(labels), values] for labels, values in metric.series.items()]}
+        for name, metric in REGISTRY.items()
+    }
+
+
+def _merge(target: Dict[Tuple[str, ...], object], series: list):
+    """把一个进程的快照数据累加到 target 中"""
+    for labels, values in series:
+        labels = tuple(labels)
+        current = target.get(labels)
+        if current is None:
+            target[labels] = list(values) if isinstance(values, list) else values
+        elif isinstance(current, list):
+            for i, value in enumerate(values):
+                current[i] += value
+        else:
+            target[labels] = current + values
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(settings.metrics_dir, f"metrics-{pid}.json")
+
+
+def write_snapshot():
+    """原子地把当前进程的快照写入 METRICS_DIR"""
+    path = _snapshot_path(os.getpid())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot(), f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshots() -> List[Tuple[dict, bool]]:
+    """
+    读取 METRICS_DIR 中其他进程的快照，涉及文件读取，应在线程中调用
+
+    Returns:
+        List[Tuple[dict, bool]]: 快照及其进程是否仍在运行（进程存在且快照在最近几个写出间隔内更新过）
+    """
+    snapshots = []
+    if not settings.metrics_dir:
+        return snapshots
+    stale_before = time.time() - STALE_FLUSH_INTERVALS * settings.metrics_flush_interval
+    for file_name in os.listdir(settings.metrics_dir):
+        match = re.fullmatch(r"metrics-(\d+)\.json", file_name)
+        if not match or int(match.group(1)) == os.getpid():
+            continue
+        path = os.path.join(settings.metrics_dir, file_name)
+        try:
+            live = os.stat(path).st_mtime >= stale_before and _pid_alive(int(match.group(1)))
+            with open(path) as f:
+                snapshots.append((json.load(f), live))
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to read metrics snapshot %s: %s", file_name, e)
+    return snapshots
+
+
+def collect(others: Sequence[Tuple[dict, bool]] = ()) -> Dict[str, Dict[Tuple[str, ...], object]]:
+    """
+    汇总当前进程和其他进程（read_snapshots 的结果）的指标
+
+    已停止进程的计数器和直方图保留退出前的最终值，保证汇总值不回退；瞬时值不再计入
+    """
+    merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in REGISTRY}
+    for data, live in [(snapshot(), True), *others]:
+        for name, metric_data in data.items():
+            if name in merged and (live or REGISTRY[name].type != "gauge"):
+                _merge(merged[name], metric_data["series"])
+    return merged
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(others: Sequence[Tuple[dict, bool]] = ()) -> str:
+    """以 Prometheus 文本格式输出所有指标"""
+    lines = []
+    for name, series in collect(others).items():
+        metric = REGISTRY[name]
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, values in sorted(series.items()):
+            if metric.type != "histogram":
+                lines.append(f"{name}{_format_labels(metric.label_names, labels)} {values}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(metric.label_names, labels, f'le="{le}"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric.label_names, labels)} {values[-1]}")
+            lines.append(f"{name}_count{_format_labels(metric.label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class SnapshotWriter:
+    """多进程模式下定期写出本进程快照的后台任务"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.metrics_flush_interval)
+            try:
+                write_snapshot()
+            except OSError as e:
+                logger.warning("Failed to write metrics snapshot: %s", e)
+
+    def start(self):
+        if settings.metrics_dir and self._task is None:
+            os.makedirs(settings.metrics_dir, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # 退出前写出最终快照，保证计数器不因 worker 退出而丢失
+            write_snapshot()
+
+
+snapshot_writer = SnapshotWriter()
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    # 其他进程的快照在线程中读取；当前进程的快照只能在事件循环线程中生成
+    others = await asyncio.to_thread(read_snapshots) if settings.metrics_dir else []
+    return PlainTextResponse(render(others), media_type="text/plain; version=0.0.4; charset=utf-8")
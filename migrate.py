@@ -0,0 +1,226 @@
+'''
+数据库迁移工具
+deploy/migrations/ 下按版本号命名的 SQL 脚本（NNNN_说明.sql）按版本顺序在每个分片上执行，
+各库已执行的版本记录在 schema_migrations 表中：
+
+    python migrate.py status             # 各分片已执行和待执行的版本
+    python migrate.py up                 # 执行全部待执行的版本
+    python migrate.py up --target 2      # 只执行到版本 2
+
+DB_MIGRATE_ON_STARTUP=True 时服务启动时自动执行，否则启动时只对待执行的版本输出警告。
+启动时记录各库已执行的版本（Database.schema_version），依赖新索引的查询据此启用，手动执行迁移后重启服务生效。
+
+1. 同一时间每个库只有一个进程执行迁移（GET_LOCK），多个 worker 或实例同时启动时，其余进程等待后跳过已执行的版本
+2. 已执行的脚本被修改（校验和不一致）时拒绝继续，结构变更应新增脚本
+3. 在线变更：ALTER TABLE 必须带 LOCK=NONE（脚本首行为 "-- offline" 时除外），MySQL 无法在线执行时直接报错，
+   不会退化为锁表复制；每条语句获取元数据锁最多等待 MIGRATION_LOCK_WAIT_TIMEOUT 秒，
+   超时（该表上有长事务）后重试，避免 DDL 排队期间阻塞该表上的全部查询
+4. DDL 不能回滚，脚本中途失败后重新运行时，已存在的索引（1061）和已删除的索引（1091）视为已执行
+
+脚本中的语句以分号结尾，以 -- 开头的行为注释，字符串中不能包含分号。
+'''
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+import pymysql.err
+from config import settings
+from mysql_client import Database, init_db, close_db, router
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deploy", "migrations")
+LOCK_NAME = "jusi:schema_migrations"
+
+ER_LOCK_WAIT_TIMEOUT = 1205
+# 重新执行时视为已完成的错误：索引已存在、要删除的索引不存在
+IDEMPOTENT_ERRORS = (1061, 1091)
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY COMMENT '版本号',
+        name VARCHAR(128) NOT NULL COMMENT '脚本名',
+        checksum CHAR(64) NOT NULL COMMENT '脚本的 SHA-256',
+        applied_at BIGINT NOT NULL COMMENT '执行时间戳（秒）',
+        duration_ms INT NOT NULL COMMENT '执行耗时（毫秒）'
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='已执行的数据库迁移'
+"""
+
+
+class Migration:
+    """一个迁移脚本"""
+
+    __slots__ = ("version", "name", "checksum", "statements", "offline")
+
+    def __init__(self, version: int, name: str, sql: str):
+        self.version = version
+        self.name = name
+        self.checksum = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        self.offline = sql.lstrip().startswith("-- offline")
+        lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+        self.statements = [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+    def __str__(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """
+    读取并检查迁移脚本
+
+    Raises:
+        ValueError: 版本号重复，或在线脚本中的 ALTER TABLE 没有 LOCK=NONE
+    """
+    migrations: Dict[int, Migration] = {}
+    for filename in sorted(os.listdir(directory)):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            migration = Migration(int(match.group(1)), match.group(2), f.read())
+        if migration.version in migrations:
+            raise ValueError(f"Duplicate migration version: {filename}")
+        for statement in migration.statements if not migration.offline else ():
+            if re.match(r"ALTER\s+TABLE", statement, re.I) and not re.search(r"LOCK\s*=\s*NONE", statement, re.I):
+                raise ValueError(f"Migration {migration}: ALTER TABLE without LOCK=NONE (mark the script '-- offline')")
+        migrations[migration.version] = migration
+    return sorted(migrations.values(), key=lambda migration: migration.version)
+
+
+async def _applied(cursor) -> Dict[int, str]:
+    await cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(await cursor.fetchall())
+
+
+def _verify(database: Database, migrations: List[Migration], applied: Dict[int, str]):
+    """已执行的脚本不能被修改"""
+    known = {migration.version: migration for migration in migrations}
+    for version, checksum in sorted(applied.items()):
+        migration = known.get(version)
+        if migration is None:
+            # 服务回滚到旧版本时会出现，不影响运行
+            logger.warning("%s: applied migration %s is unknown to this version", database.shard or "db", version)
+        elif migration.checksum != checksum:
+            raise RuntimeError(f"{database.shard or 'db'}: migration {migration} was modified after it was applied")
+
+
+async def _execute(cursor, statement: str):
+    """执行一条语句，元数据锁等待超时时重试"""
+    for attempt in range(settings.migration_ddl_retries + 1):
+        try:
+            await cursor.execute(statement)
+            return
+        except pymysql.err.MySQLError as e:
+            code = e.args[0] if e.args else None
+            if code in IDEMPOTENT_ERRORS:
+                logger.warning("Statement already applied (%s), skipped: %s", e, statement.split("\n")[0])
+                return
+            if code != ER_LOCK_WAIT_TIMEOUT or attempt == settings.migration_ddl_retries:
+                raise
+            logger.warning("Metadata lock wait timed out, retrying (%s/%s)", attempt + 1, settings.migration_ddl_retries)
+            await asyncio.sleep(min(2 ** attempt, 30))
+
+
+async def migrate_database(database: Database, migrations: List[Migration],
+                           target: Optional[int] = None, dry_run: bool = False) -> List[Migration]:
+    """
+    在一个库上执行待执行的迁移
+
+    Args:
+        target: 最高执行到的版本，None 表示全部
+        dry_run: 只返回待执行的迁移，不执行
+
+    Returns:
+        List[Migration]: 待执行（dry_run 时）或本次执行的迁移
+    """
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            if dry_run:
+                # 只读：记录表不存在时全部待执行，不建表
+                await cursor.execute(
+                    "SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() "
+                    "AND table_name = 'schema_migrations'"
+                )
+                applied = await _applied(cursor) if await cursor.fetchone() else {}
+                _verify(database, migrations, applied)
+                database.schema_version = max(applied, default=0)
+                return [m for m in migrations if m.version not in applied and (target is None or m.version <= target)]
+
+            await cursor.execute(CREATE_MIGRATIONS_TABLE)
+            await cursor.execute("SELECT GET_LOCK(%s, -1)", (LOCK_NAME,))
+            try:
+                # 取得锁之后再读取，其他进程可能已经执行完
+                applied = await _applied(cursor)
+                _verify(database, migrations, applied)
+                database.schema_version = max(applied, default=0)
+                pending = [m for m in migrations if m.version not in applied and (target is None or m.version <= target)]
+                await cursor.execute("SET SESSION lock_wait_timeout = %s", (settings.migration_lock_wait_timeout,))
+                for migration in pending:
+                    start = time.time()
+                    for statement in migration.statements:
+                        await _execute(cursor, statement)
+                    duration_ms = int((time.time() - start) * 1000)
+                    await cursor.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum, applied_at, duration_ms) "
+                        "VALUES (%s, %s, %s, %s, %s)",
+                        (migration.version, migration.name, migration.checksum, int(start), duration_ms)
+                    )
+                    logger.warning("%s: applied migration %s in %sms", database.shard or "db", migration, duration_ms)
+                    database.schema_version = max(database.schema_version, migration.version)
+                return pending
+            finally:
+                # 连接归还连接池，恢复会话设置
+                await cursor.execute("SET SESSION lock_wait_timeout = DEFAULT")
+                await cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+
+
+async def migrate_on_startup():
+    """服务启动时执行待执行的迁移（DB_MIGRATE_ON_STARTUP=True），否则只输出警告"""
+    if settings.stand_in_backends:
+        return
+    migrations = load_migrations()
+    for database in router.shards:
+        pending = await migrate_database(database, migrations, dry_run=not settings.db_migrate_on_startup)
+        if pending and not settings.db_migrate_on_startup:
+            logger.warning("%s: %s pending migrations (%s), run python migrate.py up",
+                           database.shard or "db", len(pending), ", ".join(map(str, pending)))
+
+
+async def main(args: argparse.Namespace):
+    migrations = load_migrations()
+    await init_db(minsize=1, maxsize=1)
+    try:
+        for database in router.shards:
+            shard = database.shard or "db"
+            if args.command == "status":
+                pending = await migrate_database(database, migrations, dry_run=True)
+                applied = [m for m in migrations if m not in pending]
+                logger.info("%s: applied %s, pending %s", shard,
+                            ", ".join(map(str, applied)) or "-", ", ".join(map(str, pending)) or "-")
+                continue
+            executed = await migrate_database(database, migrations, target=args.target)
+            logger.info("%s: %s", shard, f"applied {len(executed)} migrations" if executed else "up to date")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据库迁移工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="各分片已执行和待执行的迁移")
+    up_parser = subparsers.add_parser("up", help="执行待执行的迁移")
+    up_parser.add_argument("--target", type=int, default=None, help="最高执行到的版本")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -23,6 +23,12 @@ class UserInfo(BaseModel):
     login_token: Optional[str] = None  # login_token 改为可选，存储在 Redis 中
     created_at: int
 
+# 用户完整记录（导出/导入使用，包含 tb_user 的全部业务列）
+class UserRecord(UserInfo):
+    updated_at: Optional[int] = None  # 旧版本导出的文件中没有该字段，导入时取 created_at
+    last_login_at: Optional[int] = None
+    is_active: int = 1  # 1-激活，0-停用
+
 # 登录响应模型
 class LoginReturn(ResponseModel):
     response: UserInfo
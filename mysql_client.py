@@ -1,12 +1,17 @@
 '''
 数据库操作模块
+配置 DB_SHARDS 时 tb_user 按 sharding.py 的规则拆分到多个库，本模块的函数按 user_id / phone 路由到对应的分片，
+调用方不需要感知分片；审计表等不分片的表位于第一个分片（db）上。
 '''
 import logging
 import aiomysql
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 from contextlib import asynccontextmanager
-from models import UserInfo
+from models import UserInfo, UserRecord
 from config import settings
+import faults
+from instrumentation import instrumented, mark_failed
+from sharding import ShardConfig, ShardLayout, ShardRouter, parse_shards
 
 logger = logging.getLogger(__name__)
 
@@ -14,26 +19,34 @@ logger = logging.getLogger(__name__)
 class Database:
     """数据库连接池管理类"""
 
-    def __init__(self):
+    def __init__(self, shard: Optional[ShardConfig] = None):
         self.pool = None
+        self.shard = shard  # 为 None 时使用 DB_* 配置
+        self.schema_version = 0  # 已执行的最高迁移版本，启动时由 migrate.py 设置
 
-    async def connect(self):
+    async def connect(self, minsize: int = 1, maxsize: int = 10):
         """创建数据库连接池"""
+        if settings.stand_in_backends:
+            from stand_ins import MemoryPool
+            self.pool = MemoryPool(maxsize=maxsize)
+            logger.warning("Using in-memory MySQL stand-in")
+            return
+        shard = self.shard or ShardConfig()
         try:
             self.pool = await aiomysql.create_pool(
-                host=settings.db_host,
-                port=settings.db_port,
-                user=settings.db_user,
-                password=settings.db_password,
-                db=settings.db_name,
+                host=shard.host,
+                port=shard.port,
+                user=shard.user,
+                password=shard.password,
+                db=shard.db,
                 charset='utf8mb4',
                 autocommit=True,
-                minsize=1,
-                maxsize=10
+                minsize=minsize,
+                maxsize=maxsize
             )
-            logger.info("Database connection pool created successfully")
+            logger.info("Database connection pool created successfully: %s", shard)
         except Exception as e:
-            logger.error(f"Failed to create database connection pool: {str(e)}")
+            logger.error("Failed to create database connection pool: %s: %s", shard, e)
             raise
 
     async def close(self):
@@ -46,25 +59,171 @@ class Database:
     @asynccontextmanager
     async def get_connection(self):
         """获取数据库连接的上下文管理器"""
+        if faults.active:
+            # 带埋点函数的故障在此注入，位于函数自身的异常处理之内
+            await faults.inject_pending("mysql")
         async with self.pool.acquire() as conn:
+            if faults.active:
+                await faults.inject("mysql_pool", "acquire")
             yield conn
 
 
-# 全局数据库实例
+# 增加登录查询覆盖索引的迁移版本（deploy/migrations/0002_covering_lookup_indexes.sql）
+COVERING_LOOKUP_VERSION = 2
+
+# 全局数据库实例（分片部署时为第一个分片）
 db = Database()
 
+# 分片路由，未配置 DB_SHARDS 时只有 db 一个分片
+router: ShardRouter[Database] = ShardRouter(db)
+
+
+async def init_db(minsize: int = 1, maxsize: int = 10):
+    """初始化数据库连接，每个分片一个连接池（minsize / maxsize 为每个分片的连接数）"""
+    current = parse_shards(settings.db_shards)
+    previous = parse_shards(settings.db_shards_previous)
+    databases: Dict[str, Database] = {}
+
+    def resolve(shard: ShardConfig) -> Database:
+        # 新旧布局中的同一个库共用一个连接池，第一个分片复用全局的 db
+        if shard.key not in databases:
+            database = db if not databases else Database()
+            database.shard = shard
+            databases[shard.key] = database
+        return databases[shard.key]
 
-async def init_db():
-    """初始化数据库连接"""
-    await db.connect()
+    if current:
+        router.current = ShardLayout([resolve(shard) for shard in current])
+    if previous:
+        if not current:
+            raise ValueError("DB_SHARDS_PREVIOUS requires DB_SHARDS")
+        router.previous = ShardLayout([resolve(shard) for shard in previous])
+        logger.warning("Resharding in progress: %s -> %s shards", len(previous), len(current))
+
+    for database in router.shards:
+        await database.connect(minsize=minsize, maxsize=maxsize)
 
 
 async def close_db():
     """关闭数据库连接"""
-    await db.close()
+    for database in router.shards:
+        await database.close()
+
+
+def _user_lookup_sql(database: Database, column: str, index: str) -> str:
+    """
+    按 user_id / phone 查询用户的语句
+
+    迁移 0002 之后指定使用覆盖索引：等值条件命中唯一索引（uk_user_id / uk_phone）时优化器按 const 访问，
+    不会考虑覆盖索引，仍然回表读取整行
+    """
+    hint = f" FORCE INDEX ({index})" if database.schema_version >= COVERING_LOOKUP_VERSION else ""
+    return f"""
+        SELECT user_id, user_name, phone, created_at
+        FROM tb_user{hint}
+        WHERE {column} = %s AND is_active = 1
+    """
+
+
+async def _select_user_by_id(database: Database, user_id: str) -> Optional[UserInfo]:
+    async with database.get_connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            sql = _user_lookup_sql(database, "user_id", "idx_user_id_lookup")
+            await cursor.execute(sql, (user_id,))
+            result = await cursor.fetchone()
+            return UserInfo(**result) if result else None
+
+
+async def _select_user_by_phone(database: Database, phone: str) -> Optional[UserInfo]:
+    async with database.get_connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            sql = _user_lookup_sql(database, "phone", "idx_phone_lookup")
+            await cursor.execute(sql, (phone,))
+            result = await cursor.fetchone()
+            return UserInfo(**result) if result else None
+
+
+async def _find_user(user_id: str) -> Optional[UserInfo]:
+    """在用户行可能所在的分片中依次查找"""
+    for database in router.user_shards(user_id):
+        user = await _select_user_by_id(database, user_id)
+        if user is not None:
+            return user
+    return None
+
+
+async def _user_exists(user_id: str) -> bool:
+    """用户行是否存在（包括已停用的用户）"""
+    for database in router.user_shards(user_id):
+        async with database.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT 1 FROM tb_user WHERE user_id = %s", (user_id,))
+                if await cursor.fetchone():
+                    return True
+    return False
+
+
+async def _update_user(sql: str, args: tuple, user_id: str) -> bool:
+    """在用户行所在的分片上执行 UPDATE（user_id 为最后一个参数），返回是否更新了行"""
+    for database in router.user_shards(user_id):
+        async with database.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, args)
+                if cursor.rowcount > 0:
+                    return True
+    return False
+
+
+async def _lookup_phone(database: Database, phone: str) -> Optional[str]:
+    """查询手机号目录"""
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT user_id FROM tb_user_phone WHERE phone = %s", (phone,))
+            result = await cursor.fetchone()
+            return result[0] if result else None
+
+
+async def _claim_phone(database: Database, phone: str, user_id: str, now: int) -> bool:
+    """
+    在手机号目录中登记 phone -> user_id，目录的主键保证同一手机号在所有分片中只属于一个用户
+
+    Returns:
+        bool: 登记成功返回 True，手机号已属于其他用户返回 False
+    """
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "INSERT IGNORE INTO tb_user_phone (phone, user_id, created_at) VALUES (%s, %s, %s)",
+                (phone, user_id, now)
+            )
+            if cursor.rowcount > 0:
+                return True
+    owner = await _lookup_phone(database, phone)
+    if owner == user_id:
+        return True
+    if owner is not None and await _user_exists(owner):
+        return False
+    # 目录项指向的用户行不存在（创建用户中途失败或用户已归档），由新用户接管；
+    # 新登记的目录项可能属于另一个正在创建的用户（先登记目录、后写入用户行），登记超过宽限期后才能接管
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "UPDATE tb_user_phone SET user_id = %s, created_at = %s "
+                "WHERE phone = %s AND user_id = %s AND created_at < %s",
+                (user_id, now, phone, owner, now - settings.db_phone_claim_grace_seconds)
+            )
+            return cursor.rowcount > 0
+
+
+async def _release_phone(database: Database, phone: str, user_id: str):
+    """撤销 _claim_phone 的登记"""
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("DELETE FROM tb_user_phone WHERE phone = %s AND user_id = %s", (phone, user_id))
 
 
 # 用户数据库操作函数
+@instrumented("mysql", inject_at_io=True)
 async def create_user(user_info: UserInfo) -> bool:
     """
     创建新用户
@@ -75,31 +234,46 @@ async def create_user(user_info: UserInfo) -> bool:
     Returns:
         bool: 创建是否成功
     """
+    layout = router.current
+    # 分片部署时先在手机号目录中登记，保证手机号全局唯一
+    directory = layout.for_phone(user_info.phone) if layout.sharded and user_info.phone is not None else None
     try:
-        async with db.get_connection() as conn:
-            async with conn.cursor() as cursor:
-                sql = """
-                    INSERT INTO tb_user (user_id, user_name, phone, created_at, updated_at, last_login_at)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                # 使用 UserInfo 对象中的 phone 字段
-                phone = user_info.phone
-
-                await cursor.execute(sql, (
-                    user_info.user_id,
-                    user_info.user_name,
-                    phone,
-                    user_info.created_at,
-                    user_info.created_at,  # updated_at 初始值与 created_at 相同
-                    user_info.created_at   # last_login_at 初始值与 created_at 相同
-                ))
-                logger.info(f"User created successfully: user_id={user_info.user_id}")
-                return True
+        if directory is not None and not await _claim_phone(
+            directory, user_info.phone, user_info.user_id, user_info.created_at
+        ):
+            logger.error("Failed to create user: phone already registered")
+            return False
+        try:
+            async with layout.for_user(user_info.user_id).get_connection() as conn:
+                async with conn.cursor() as cursor:
+                    sql = """
+                        INSERT INTO tb_user (user_id, user_name, phone, created_at, updated_at, last_login_at)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    """
+                    # 使用 UserInfo 对象中的 phone 字段
+                    phone = user_info.phone
+
+                    await cursor.execute(sql, (
+                        user_info.user_id,
+                        user_info.user_name,
+                        phone,
+                        user_info.created_at,
+                        user_info.created_at,  # updated_at 初始值与 created_at 相同
+                        user_info.created_at   # last_login_at 初始值与 created_at 相同
+                    ))
+        except Exception:
+            if directory is not None:
+                await _release_phone(directory, user_info.phone, user_info.user_id)
+            raise
+        logger.info("User created successfully: user_id=%s", user_info.user_id)
+        return True
     except Exception as e:
-        logger.error(f"Failed to create user: {str(e)}")
+        logger.error("Failed to create user: %s", e)
+        mark_failed()
         return False
 
 
+@instrumented("mysql", inject_at_io=True)
 async def get_user_info(user_id: str) -> Optional[UserInfo]:
     """
     根据 user_id 获取用户信息
@@ -111,24 +285,51 @@ async def get_user_info(user_id: str) -> Optional[UserInfo]:
         Optional[UserInfo]: 用户信息对象，如果不存在则返回 None
     """
     try:
-        async with db.get_connection() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                sql = """
-                    SELECT user_id, user_name, phone, created_at
-                    FROM tb_user
-                    WHERE user_id = %s AND is_active = 1
-                """
-                await cursor.execute(sql, (user_id,))
-                result = await cursor.fetchone()
-
-                if result:
-                    return UserInfo(**result)
-                return None
+        return await _find_user(user_id)
     except Exception as e:
-        logger.error(f"Failed to get user by user_id: {str(e)}")
+        logger.error("Failed to get user by user_id: %s", e)
+        mark_failed()
         return None
 
 
+@instrumented("mysql", inject_at_io=True)
+async def get_users_info(user_ids: List[str]) -> Dict[str, UserInfo]:
+    """
+    批量获取用户信息，每个分片一条 IN 查询；数据库出错时抛出异常
+
+    Args:
+        user_ids: 用户ID列表
+
+    Returns:
+        Dict[str, UserInfo]: user_id -> 用户信息，不存在或已停用的用户不在结果中
+    """
+    users: Dict[str, UserInfo] = {}
+    remaining = list(dict.fromkeys(user_ids))
+    # 重新分片期间旧布局中找不到的用户再到新布局中查询
+    for layout in router.layouts:
+        groups: Dict[Database, List[str]] = {}
+        for user_id in remaining:
+            groups.setdefault(layout.for_user(user_id), []).append(user_id)
+        for database, group in groups.items():
+            placeholders = ", ".join(["%s"] * len(group))
+            # 与 _user_lookup_sql 相同，迁移 0002 之后按覆盖索引做范围扫描，不回表
+            hint = " FORCE INDEX (idx_user_id_lookup)" if database.schema_version >= COVERING_LOOKUP_VERSION else ""
+            async with database.get_connection() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(f"""
+                        SELECT user_id, user_name, phone, created_at
+                        FROM tb_user{hint}
+                        WHERE user_id IN ({placeholders}) AND is_active = 1
+                    """, tuple(group))
+                    for row in await cursor.fetchall():
+                        users[row["user_id"]] = UserInfo(**row)
+        remaining = [user_id for user_id in remaining if user_id not in users]
+        if not remaining:
+            break
+    return users
+
+
+@instrumented("mysql", inject_at_io=True)
 async def update_user_name(user_id: str, user_name: str) -> bool:
     """
     更新用户名
@@ -141,27 +342,25 @@ async def update_user_name(user_id: str, user_name: str) -> bool:
         bool: 更新是否成功
     """
     try:
-        async with db.get_connection() as conn:
-            async with conn.cursor() as cursor:
-                from utils import current_timestamp
-                updated_at = current_timestamp()
-
-                sql = """
-                    UPDATE tb_user
-                    SET user_name = %s, updated_at = %s
-                    WHERE user_id = %s AND is_active = 1
-                """
-                await cursor.execute(sql, (user_name, updated_at, user_id))
-
-                if cursor.rowcount > 0:
-                    logger.info(f"User name updated successfully: user_id={user_id}")
-                    return True
-                return False
+        from utils import current_timestamp
+        updated_at = current_timestamp()
+
+        sql = """
+            UPDATE tb_user
+            SET user_name = %s, updated_at = %s
+            WHERE user_id = %s AND is_active = 1
+        """
+        if await _update_user(sql, (user_name, updated_at, user_id), user_id):
+            logger.info("User name updated successfully: user_id=%s", user_id)
+            return True
+        return False
     except Exception as e:
-        logger.error(f"Failed to update user name: {str(e)}")
+        logger.error("Failed to update user name: %s", e)
+        mark_failed()
         return False
 
 
+@instrumented("mysql", inject_at_io=True)
 async def get_user_by_phone(phone: str) -> Optional[UserInfo]:
     """
     根据手机号获取用户信息
@@ -173,24 +372,23 @@ async def get_user_by_phone(phone: str) -> Optional[UserInfo]:
         Optional[UserInfo]: 用户信息对象，如果不存在则返回 None
     """
     try:
-        async with db.get_connection() as conn:
-            async with conn.cursor(aiomysql.DictCursor) as cursor:
-                sql = """
-                    SELECT user_id, user_name, phone, created_at
-                    FROM tb_user
-                    WHERE phone = %s AND is_active = 1
-                """
-                await cursor.execute(sql, (phone,))
-                result = await cursor.fetchone()
-
-                if result:
-                    return UserInfo(**result)
-                return None
+        for layout in router.layouts:
+            if layout.sharded:
+                # 先查手机号目录得到 user_id，再到用户行所在的分片查询
+                user_id = await _lookup_phone(layout.for_phone(phone), phone)
+                user = await _find_user(user_id) if user_id else None
+            else:
+                user = await _select_user_by_phone(layout.shards[0], phone)
+            if user is not None:
+                return user
+        return None
     except Exception as e:
-        logger.error(f"Failed to get user by phone: {str(e)}")
+        logger.error("Failed to get user by phone: %s", e)
+        mark_failed()
         return None
 
 
+@instrumented("mysql", inject_at_io=True)
 async def update_login_time(user_id: str) -> bool:
     """
     更新用户最后登录时间
@@ -202,22 +400,207 @@ async def update_login_time(user_id: str) -> bool:
         bool: 更新是否成功
     """
     try:
-        async with db.get_connection() as conn:
-            async with conn.cursor() as cursor:
-                from utils import current_timestamp
-                now = current_timestamp()
+        from utils import current_timestamp
+        now = current_timestamp()
+
+        sql = """
+            UPDATE tb_user
+            SET last_login_at = %s, updated_at = %s
+            WHERE user_id = %s AND is_active = 1
+        """
+        if await _update_user(sql, (now, now, user_id), user_id):
+            logger.info("User login time updated successfully: user_id=%s", user_id)
+            return True
+        return False
+    except Exception as e:
+        logger.error("Failed to update user login time: %s", e)
+        mark_failed()
+        return False
+
+
+async def iter_users(fetch_size: int = 1000) -> AsyncIterator[UserRecord]:
+    """
+    使用服务端非缓冲游标（SSCursor）流式遍历所有用户（包括已停用的用户），内存占用与表大小无关
+    分片部署时依次遍历当前布局的各个分片；重新分片期间旧布局中尚未迁移的用户不会被遍历到
 
+    Args:
+        fetch_size: 每次从服务端拉取的行数
+
+    Yields:
+        UserRecord: 用户完整记录
+    """
+    for database in router.current.shards:
+        async with database.get_connection() as conn:
+            async with conn.cursor(aiomysql.SSDictCursor) as cursor:
                 sql = """
-                    UPDATE tb_user
-                    SET last_login_at = %s, updated_at = %s
-                    WHERE user_id = %s AND is_active = 1
+                    SELECT user_id, user_name, phone, created_at, updated_at, last_login_at, is_active
+                    FROM tb_user
+                    ORDER BY id
                 """
-                await cursor.execute(sql, (now, now, user_id))
+                await cursor.execute(sql)
+                while True:
+                    rows = await cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield UserRecord(**row)
 
-                if cursor.rowcount > 0:
-                    logger.info(f"User login time updated successfully: user_id={user_id}")
-                    return True
-                return False
-    except Exception as e:
-        logger.error(f"Failed to update user login time: {str(e)}")
-        return False
+
+@instrumented("mysql", inject_at_io=True)
+async def bulk_create_users(users: List[UserRecord]) -> int:
+    """
+    批量创建用户，使用多行 INSERT 语句写入，已存在的 user_id / phone 会被忽略
+    各列按记录原样写入，updated_at 缺失时取 created_at
+    分片部署时按分片拆成多条语句，并登记手机号目录（已登记的手机号保持不变）
+
+    Args:
+        users: 用户完整记录列表
+
+    Returns:
+        int: 实际插入的行数
+    """
+    if not users:
+        return 0
+
+    layout = router.current
+    groups: Dict[Database, List[UserRecord]] = {}
+    for u in users:
+        groups.setdefault(layout.for_user(u.user_id), []).append(u)
+
+    inserted = 0
+    for database, group in groups.items():
+        async with database.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                # executemany 会将 INSERT ... VALUES 改写为多行插入语句
+                sql = """
+                    INSERT IGNORE INTO tb_user
+                        (user_id, user_name, phone, created_at, updated_at, last_login_at, is_active)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """
+                await cursor.executemany(sql, [
+                    (u.user_id, u.user_name, u.phone, u.created_at,
+                     u.created_at if u.updated_at is None else u.updated_at, u.last_login_at, u.is_active)
+                    for u in group
+                ])
+                inserted += cursor.rowcount
+
+    if layout.sharded:
+        directories: Dict[Database, List[UserRecord]] = {}
+        for u in users:
+            if u.phone is not None:
+                directories.setdefault(layout.for_phone(u.phone), []).append(u)
+        for database, group in directories.items():
+            async with database.get_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(
+                        "INSERT IGNORE INTO tb_user_phone (phone, user_id, created_at) VALUES (%s, %s, %s)",
+                        [(u.phone, u.user_id, u.created_at) for u in group]
+                    )
+    return inserted
+
+
+@instrumented("mysql", inject_at_io=True)
+async def scan_users(after_id: int, limit: int, shard: int = 0) -> List[Dict[str, Any]]:
+    """
+    按自增主键做键集分页，扫描一批用户的状态信息（供后台维护任务使用）
+
+    Args:
+        after_id: 上一批最后一行的主键 id
+        limit: 本批最多返回的行数
+        shard: 当前布局中的分片编号（各分片的自增主键相互独立）
+
+    Returns:
+        List[Dict[str, Any]]: 包含 id, user_id, is_active, last_login_at, created_at 的行
+    """
+    async with router.current.shards[shard].get_connection() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            sql = """
+                SELECT id, user_id, is_active, last_login_at, created_at
+                FROM tb_user
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """
+            await cursor.execute(sql, (after_id, limit))
+            return list(await cursor.fetchall())
+
+
+@instrumented("mysql", inject_at_io=True)
+async def archive_users(user_ids: List[str]) -> int:
+    """
+    将用户从 tb_user 移入归档表 tb_user_archive（同一事务内完成）
+    分片部署时在用户所在的分片上归档，归档表与 tb_user 位于同一个库；
+    手机号目录项保留，该手机号再次登录时由新用户接管
+
+    Args:
+        user_ids: 用户ID列表
+
+    Returns:
+        int: 归档的用户数
+    """
+    if not user_ids:
+        return 0
+
+    from utils import current_timestamp
+    groups: Dict[Database, List[str]] = {}
+    for user_id in user_ids:
+        groups.setdefault(router.current.for_user(user_id), []).append(user_id)
+
+    archived = 0
+    for database, group in groups.items():
+        placeholders = ", ".join(["%s"] * len(group))
+        async with database.get_connection() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(f"""
+                        INSERT IGNORE INTO tb_user_archive
+                            (user_id, user_name, phone, created_at, updated_at, last_login_at, is_active, archived_at)
+                        SELECT user_id, user_name, phone, created_at, updated_at, last_login_at, is_active, %s
+                        FROM tb_user
+                        WHERE user_id IN ({placeholders})
+                    """, (current_timestamp(), *group))
+                    await cursor.execute(f"""
+                        DELETE FROM tb_user
+                        WHERE user_id IN ({placeholders})
+                    """, tuple(group))
+                    archived += cursor.rowcount
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+    logger.info("Users archived: count=%s", archived)
+    return archived
+
+
+@instrumented("mysql", inject_at_io=True)
+async def insert_audit_events(events: List[Dict[str, str]]) -> int:
+    """
+    批量写入审计事件，按 event_id 去重（重复投递的事件会被忽略）
+
+    Args:
+        events: 审计事件列表，字段见 audit.FIELDS
+
+    Returns:
+        int: 实际插入的行数
+    """
+    if not events:
+        return 0
+
+    async with db.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            # executemany 会将 INSERT ... VALUES 改写为多行插入语句
+            sql = """
+                INSERT IGNORE INTO tb_login_audit
+                    (event_id, event, user_id, phone, ip, code, request_id, detail, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            await cursor.executemany(sql, [
+                (
+                    e["event_id"], e["event"], e.get("user_id") or None, e.get("phone") or None,
+                    e.get("ip") or None, int(e.get("code") or 0), e.get("request_id") or None,
+                    e.get("detail") or None, int(e["created_at"])
+                )
+                for e in events
+            ])
+            return cursor.rowcount
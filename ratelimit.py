@@ -0,0 +1,187 @@
+'''
+分布式限流模块
+按 EventName 配置的规则，对手机号、客户端 IP、login_token 三个维度做滑动窗口限流：
+1. 滑动窗口计数：当前固定窗口的计数 + 上一窗口计数 × 上一窗口在滑动窗口中的剩余占比
+2. 一次请求涉及的所有规则在一次 Redis Lua 调用中原子地检查并计数，任一规则超限则都不计数
+3. 进程内维护近似的本地计数和"封禁到期时间"：
+   本地计数只记录 Redis 放行的请求，必然不大于全局计数，本地已超限时直接拒绝，不访问 Redis；
+   被 Redis 拒绝的客户端在重试等待时间内也直接在本地拒绝
+4. Redis 不可用时放行（fail open），只记录告警；未配置 Redis 时只使用本地计数
+
+规则格式：RATE_LIMIT_RULES={"sendSmsCode": {"phone": "1/60,5/3600", "ip": "20/3600"}}，
+即 EventName -> {维度: "次数/窗口秒数,..."}，维度取值为 phone / ip / login_token。
+ip 维度取 client_ip() 的结果，部署在反向代理之后时需开启 TRUST_PROXY_HEADERS，默认规则不包含 ip 维度。
+'''
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from metrics import RATE_LIMITED
+from memprof import register_cache
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+# KEYS[i]：第 i 条规则的键前缀；ARGV[2i-1], ARGV[2i]：第 i 条规则的次数上限和窗口秒数
+# 返回 {0, "0"} 表示放行，{i, 重试等待秒数} 表示第 i 条规则超限
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local current_keys = {}
+for i, prefix in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 - 1])
+    local window = tonumber(ARGV[i * 2])
+    local bucket = math.floor(t / window)
+    local elapsed = t - bucket * window
+    local current_key = prefix .. ':' .. bucket
+    local current = tonumber(redis.call('GET', current_key) or '0')
+    local previous = tonumber(redis.call('GET', prefix .. ':' .. (bucket - 1)) or '0')
+    if previous * (1 - elapsed / window) + current + 1 > limit then
+        local retry_after = window - elapsed
+        if current + 1 <= limit and previous > 0 then
+            retry_after = window * (1 - (limit - 1 - current) / previous) - elapsed
+        end
+        return {i, tostring(retry_after)}
+    end
+    current_keys[i] = current_key
+end
+for i, key in ipairs(current_keys) do
+    redis.call('INCR', key)
+    redis.call('EXPIRE', key, tonumber(ARGV[i * 2]) * 2)
+end
+return {0, '0'}
+"""
+
+
+def parse_rules(spec: str) -> List[Tuple[int, int]]:
+    """解析 "次数/窗口秒数,..." 格式的规则"""
+    rules = []
+    for item in spec.split(","):
+        limit, _, window = item.strip().partition("/")
+        rules.append((int(limit), int(window)))
+    return rules
+
+
+class LocalWindow:
+    """单个键的本地滑动窗口计数"""
+
+    __slots__ = ("bucket", "current", "previous", "blocked_until")
+
+    def __init__(self):
+        self.bucket = 0
+        self.current = 0
+        self.previous = 0
+        self.blocked_until = 0.0
+
+    def estimate(self, now: float, window: int) -> float:
+        bucket = int(now // window)
+        if bucket != self.bucket:
+            self.previous = self.current if bucket == self.bucket + 1 else 0
+            self.current = 0
+            self.bucket = bucket
+        return self.previous * (1 - (now - bucket * window) / window) + self.current
+
+
+class RateLimiter:
+    """Redis 滑动窗口限流 + 本地近似限流"""
+
+    def __init__(self):
+        self._rules: Dict[str, List[Tuple[str, int, int]]] = {}
+        self._local: Dict[str, LocalWindow] = {}
+        self._script = None
+
+    def _event_rules(self, event_name: str) -> List[Tuple[str, int, int]]:
+        """EventName 对应的 (维度, 次数, 窗口) 列表，解析结果缓存"""
+        rules = self._rules.get(event_name)
+        if rules is None:
+            rules = [
+                (dimension, limit, window)
+                for dimension, spec in settings.rate_limit_rules.get(event_name, {}).items()
+                for limit, window in parse_rules(spec)
+            ]
+            self._rules[event_name] = rules
+        return rules
+
+    def _local_window(self, key: str) -> LocalWindow:
+        window = self._local.get(key)
+        if window is None:
+            if len(self._local) >= settings.rate_limit_local_max_keys:
+                # 本地计数只是优化，超出容量时直接清空
+                self._local.clear()
+            window = self._local[key] = LocalWindow()
+        return window
+
+    async def check(self, event_name: str, identities: Dict[str, Optional[str]]) -> Optional[float]:
+        """
+        检查并计数一次请求
+
+        Args:
+            event_name: 事件名称
+            identities: 各维度的取值，如 {"phone": ..., "ip": ..., "login_token": ...}，取值为空的维度不限流
+
+        Returns:
+            Optional[float]: 放行时返回 None，被限流时返回建议的重试等待秒数
+        """
+        if not settings.rate_limit_enabled:
+            return None
+        checks = []
+        for dimension, limit, window in self._event_rules(event_name):
+            value = identities.get(dimension)
+            if isinstance(value, str) and value:
+                checks.append((dimension, f"{RATE_LIMIT_PREFIX}{event_name}:{dimension}:{value}:{window}", limit, window))
+        if not checks:
+            return None
+
+        # 本地短路：被 Redis 拒绝且仍在等待期内，或本地计数已达上限
+        now = time.time()
+        for dimension, key, limit, window in checks:
+            local = self._local_window(key)
+            if local.blocked_until > now:
+                RATE_LIMITED.inc(event_name, dimension, "local")
+                return local.blocked_until - now
+            if local.estimate(now, window) + 1 > limit:
+                RATE_LIMITED.inc(event_name, dimension, "local")
+                return float(window - (now - local.bucket * window))
+
+        if settings.stand_in_backends or redis_client.client is None:
+            # 内存替身不支持 Lua，未配置 Redis 时（单进程部署）本地计数即为全部计数
+            result = [0, "0"]
+        else:
+            try:
+                if self._script is None:
+                    self._script = redis_client.client.register_script(SLIDING_WINDOW_SCRIPT)
+                keys = [key for _, key, _, _ in checks]
+                args = [value for _, _, limit, window in checks for value in (limit, window)]
+                result = await self._script(keys=keys, args=args)
+            except Exception as e:
+                logger.warning("Rate limit check failed, allowing request: %s", e)
+                return None
+
+        index, retry_after = int(result[0]), float(result[1])
+        if index:
+            dimension, key, _, _ = checks[index - 1]
+            self._local_window(key).blocked_until = now + retry_after
+            RATE_LIMITED.inc(event_name, dimension, "redis")
+            return retry_after
+        for _, key, _, _ in checks:
+            self._local_window(key).current += 1
+        return None
+
+
+def client_ip(scope_client: Optional[Tuple[str, int]], headers) -> Optional[str]:
+    """获取客户端 IP，部署在反向代理之后时取 X-Forwarded-For 的第一个地址"""
+    if settings.trust_proxy_headers:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        real_ip = headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return scope_client[0] if scope_client else None
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
+register_cache("ratelimit.local_windows", lambda: len(rate_limiter._local))
@@ -1,17 +1,15 @@
 '''
 Redis 客户端模块
-用于管理 login_token 的存储和验证
+用于管理 login_token 的存储和验证，存储由 SESSION_BACKEND 选择的会话存储后端完成（见 session_store.py）
 '''
 import logging
 import redis.asyncio as redis
-from typing import Optional
+from typing import Iterable, List, Optional
 from config import settings
+from session_store import SessionStore, create_session_store
 
 logger = logging.getLogger(__name__)
 
-# Redis Key 前缀常量
-LOGIN_TOKEN_PREFIX = "login:token:"
-
 
 class RedisClient:
     """Redis 客户端管理类"""
@@ -21,21 +19,32 @@ class RedisClient:
 
     async def connect(self):
         """连接到 Redis"""
+        if settings.stand_in_backends:
+            from stand_ins import MemoryRedis
+            self.client = MemoryRedis()
+            logger.warning("Using in-memory Redis stand-in")
+            return
+        if not settings.redis_host:
+            # 只有会话存储使用进程内后端时才允许不配置 Redis
+            if settings.session_backend == "redis":
+                raise RuntimeError("REDIS_HOST is required when SESSION_BACKEND=redis")
+            logger.warning("Redis disabled, features backed by Redis are unavailable")
+            return
         try:
             self.client = redis.Redis(
                 host=settings.redis_host,
                 port=settings.redis_port,
                 db=settings.redis_db,
                 password=settings.redis_password if settings.redis_password else None,
-                socket_timeout=5,
-                socket_connect_timeout=5,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_connect_timeout,
                 decode_responses=True
             )
             # 测试连接
             await self.client.ping()
             logger.info("Redis connection established successfully")
         except Exception as e:
-            logger.error(f"Failed to connect to Redis: {str(e)}")
+            logger.error("Failed to connect to Redis: %s", e)
             raise
 
     async def close(self):
@@ -48,12 +57,25 @@ class RedisClient:
 # 全局 Redis 客户端实例
 redis_client = RedisClient()
 
+# 全局会话存储实例
+session_store: SessionStore = create_session_store(redis_client)
+
 
 async def init_redis():
     """初始化 Redis 连接"""
     await redis_client.connect()
 
 
+async def init_session_store():
+    """启动会话存储（进程内后端从快照恢复）"""
+    await session_store.start()
+
+
+async def close_session_store():
+    """关闭会话存储（进程内后端写出最终快照）"""
+    await session_store.stop()
+
+
 async def close_redis():
     """关闭 Redis 连接"""
     await redis_client.close()
@@ -73,24 +95,14 @@ async def set_login_token(login_token: str, user_id: str) -> bool:
         bool: 存储是否成功
     """
     try:
-        if not redis_client.client:
-            logger.error("Redis client not initialized")
-            return False
-
-        # 使用 login_token 作为 key，user_id 作为 value
         # 设置过期时间为配置的天数
         expire_seconds = settings.login_token_expire_days * 24 * 60 * 60
+        await session_store.set_login_token(login_token, user_id, expire_seconds)
 
-        await redis_client.client.setex(
-            name=f"{LOGIN_TOKEN_PREFIX}{login_token}",
-            time=expire_seconds,
-            value=user_id
-        )
-
-        logger.info(f"Login token stored: token={login_token[:8]}..., user_id={user_id}")
+        logger.info("Login token stored: token=%s..., user_id=%s", login_token[:8], user_id)
         return True
     except Exception as e:
-        logger.error(f"Failed to store login token: {str(e)}")
+        logger.error("Failed to store login token: %s", e)
         return False
 
 
@@ -105,17 +117,29 @@ async def get_user_id_by_token(login_token: str) -> Optional[str]:
         Optional[str]: 用户ID，如果 token 不存在或已过期则返回 None
     """
     try:
-        if not redis_client.client:
-            logger.error("Redis client not initialized")
-            return None
-
-        user_id = await redis_client.client.get(f"{LOGIN_TOKEN_PREFIX}{login_token}")
-        return user_id
+        return await session_store.get_user_id_by_token(login_token)
     except Exception as e:
-        logger.error(f"Failed to get user_id by token: {str(e)}")
+        logger.error("Failed to get user_id by token: %s", e)
         return None
 
 
+async def get_user_ids_by_tokens(login_tokens: List[str]) -> List[Optional[str]]:
+    """
+    批量获取 login_token 对应的 user_id
+
+    与 get_user_id_by_token 不同，存储出错时抛出异常，避免调用方把全部 token 当作无效
+
+    Args:
+        login_tokens: 登录令牌列表
+
+    Returns:
+        List[Optional[str]]: 与 login_tokens 一一对应的用户ID，token 不存在或已过期时为 None
+    """
+    if not login_tokens:
+        return []
+    return await session_store.get_user_ids_by_tokens(login_tokens)
+
+
 async def delete_login_token(login_token: str) -> bool:
     """
     删除 login_token（用于登出）
@@ -127,17 +151,12 @@ async def delete_login_token(login_token: str) -> bool:
         bool: 删除是否成功
     """
     try:
-        if not redis_client.client:
-            logger.error("Redis client not initialized")
-            return False
-
-        result = await redis_client.client.delete(f"{LOGIN_TOKEN_PREFIX}{login_token}")
-        if result > 0:
-            logger.info(f"Login token deleted: token={login_token[:8]}...")
+        if await session_store.delete_login_token(login_token):
+            logger.info("Login token deleted: token=%s...", login_token[:8])
             return True
         return False
     except Exception as e:
-        logger.error(f"Failed to delete login token: {str(e)}")
+        logger.error("Failed to delete login token: %s", e)
         return False
 
 
@@ -152,14 +171,9 @@ async def token_exists(login_token: str) -> bool:
         bool: token 是否存在
     """
     try:
-        if not redis_client.client:
-            logger.error("Redis client not initialized")
-            return False
-
-        result = await redis_client.client.exists(f"{LOGIN_TOKEN_PREFIX}{login_token}")
-        return result > 0
+        return await session_store.token_exists(login_token)
     except Exception as e:
-        logger.error(f"Failed to check token existence: {str(e)}")
+        logger.error("Failed to check token existence: %s", e)
         return False
 
 
@@ -174,19 +188,37 @@ async def refresh_token_expiry(login_token: str) -> bool:
         bool: 刷新是否成功
     """
     try:
-        if not redis_client.client:
-            logger.error("Redis client not initialized")
-            return False
-
         expire_seconds = settings.login_token_expire_days * 24 * 60 * 60
-        result = await redis_client.client.expire(
-            name=f"{LOGIN_TOKEN_PREFIX}{login_token}",
-            time=expire_seconds
-        )
+        result = await session_store.refresh_token_expiry(login_token, expire_seconds)
 
         if result:
-            logger.info(f"Token expiry refreshed: token={login_token[:8]}...")
+            logger.info("Token expiry refreshed: token=%s...", login_token[:8])
         return result
     except Exception as e:
-        logger.error(f"Failed to refresh token expiry: {str(e)}")
+        logger.error("Failed to refresh token expiry: %s", e)
         return False
+
+
+async def revoke_user_tokens(user_ids: Iterable[str]) -> int:
+    """
+    批量吊销用户的全部 login_token，Redis 后端通过两次流水线完成，与用户数无关
+
+    只能吊销通过反向索引记录过的 token，索引建立之前签发的 token 仍会按 TTL 自然过期
+
+    Args:
+        user_ids: 用户ID列表
+
+    Returns:
+        int: 删除的 token 数量
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    try:
+        revoked = await session_store.revoke_user_tokens(user_ids)
+        if revoked:
+            logger.info("Login tokens revoked: users=%s, tokens=%s", len(user_ids), revoked)
+        return revoked
+    except Exception as e:
+        logger.error("Failed to revoke user tokens: %s", e)
+        return 0
@@ -0,0 +1,225 @@
+'''
+重新分片工具
+把 tb_user 从旧布局（DB_SHARDS_PREVIOUS）迁移到新布局（DB_SHARDS），迁移期间服务正常运行：
+
+    python reshard.py run --dry-run      # 只统计需要迁移的用户数
+    python reshard.py run                # 执行迁移，中断后可以重新运行
+
+1. 按主键键集分页扫描旧布局的每个分片，对每个用户：
+   - 在新布局的手机号目录中登记（已登记的保持不变；手机号已属于其他用户时记为冲突，该用户不迁移）
+   - 新布局中用户行所在的分片与当前分片不同时迁移：先写入目标分片（已存在时覆盖），
+     再从源分片删除，删除条件包含全部列；删除不到说明期间被服务修改过，重新读取后再迁移一次
+2. 旧布局也是分片布局时，把不再属于所在分片的手机号目录项移到新布局对应的分片
+
+服务在迁移期间先读写旧布局，行从旧布局删除之前的修改都落在旧布局上，因此迁移不会丢失更新。
+迁移完成后清空 DB_SHARDS_PREVIOUS 并重启服务。新分片需要预先执行 deploy/create_tb_user.sql 建表。
+'''
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Set
+from config import settings
+from mysql_client import Database, init_db, close_db, router
+
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = "user_id, user_name, phone, created_at, updated_at, last_login_at, is_active"
+
+
+async def _fetch_users(db: Database, after_id: int, limit: int) -> List[Dict[str, Any]]:
+    async with db.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"SELECT id, {USER_COLUMNS} FROM tb_user WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit)
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+
+async def _reload_users(db: Database, user_ids: List[str]) -> List[Dict[str, Any]]:
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    async with db.get_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"SELECT {USER_COLUMNS} FROM tb_user WHERE user_id IN ({placeholders})", user_ids)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+
+async def register_phones(rows: List[Dict[str, Any]]) -> Set[str]:
+    """
+    在新布局的手机号目录中登记
+
+    Returns:
+        Set[str]: 手机号已登记为其他用户的 user_id
+    """
+    layout = router.current
+    groups: Dict[Database, List[Dict[str, Any]]] = {}
+    for row in rows:
+        if row["phone"] is not None:
+            groups.setdefault(layout.for_phone(row["phone"]), []).append(row)
+
+    conflicts = set()
+    for db, group in groups.items():
+        placeholders = ", ".join(["%s"] * len(group))
+        async with db.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(
+                    "INSERT IGNORE INTO tb_user_phone (phone, user_id, created_at) VALUES (%s, %s, %s)",
+                    [(row["phone"], row["user_id"], row["created_at"]) for row in group]
+                )
+                await cursor.execute(
+                    f"SELECT phone, user_id FROM tb_user_phone WHERE phone IN ({placeholders})",
+                    [row["phone"] for row in group]
+                )
+                owners = dict(await cursor.fetchall())
+        for row in group:
+            if owners.get(row["phone"]) != row["user_id"]:
+                conflicts.add(row["user_id"])
+                logger.warning("Phone already registered to another user: user_id=%s", row["user_id"])
+    return conflicts
+
+
+async def move_users(source: Database, target: Database, rows: List[Dict[str, Any]]):
+    """把用户行从 source 迁到 target；源行被并发修改时重新读取并再次迁移，直到全部从 source 删除"""
+    while rows:
+        async with target.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(f"""
+                    INSERT INTO tb_user ({USER_COLUMNS})
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        user_name = VALUES(user_name), phone = VALUES(phone), updated_at = VALUES(updated_at),
+                        last_login_at = VALUES(last_login_at), is_active = VALUES(is_active)
+                """, [
+                    (r["user_id"], r["user_name"], r["phone"], r["created_at"],
+                     r["updated_at"], r["last_login_at"], r["is_active"])
+                    for r in rows
+                ])
+        async with source.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                # 只删除与写入目标分片时完全相同的行
+                await cursor.executemany("""
+                    DELETE FROM tb_user
+                    WHERE user_id = %s AND user_name = %s AND phone <=> %s
+                        AND updated_at = %s AND last_login_at <=> %s AND is_active <=> %s
+                """, [
+                    (r["user_id"], r["user_name"], r["phone"], r["updated_at"], r["last_login_at"], r["is_active"])
+                    for r in rows
+                ])
+                if cursor.rowcount == len(rows):
+                    return
+        rows = await _reload_users(source, [r["user_id"] for r in rows])
+
+
+async def reshard_users(db: Database, batch_size: int, pause: float, dry_run: bool) -> Dict[str, int]:
+    """迁移旧布局中一个分片上的用户"""
+    stats = {"scanned": 0, "moved": 0, "conflicts": 0}
+    last_id = 0
+    while True:
+        rows = await _fetch_users(db, last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        stats["scanned"] += len(rows)
+
+        conflicts = set()
+        if router.current.sharded and not dry_run:
+            conflicts = await register_phones(rows)
+        stats["conflicts"] += len(conflicts)
+
+        targets: Dict[Database, List[Dict[str, Any]]] = {}
+        for row in rows:
+            target = router.current.for_user(row["user_id"])
+            if target is not db and row["user_id"] not in conflicts:
+                targets.setdefault(target, []).append(row)
+        for target, group in targets.items():
+            if not dry_run:
+                await move_users(db, target, group)
+            stats["moved"] += len(group)
+        await asyncio.sleep(pause)
+    return stats
+
+
+async def reshard_directory(db: Database, batch_size: int, dry_run: bool) -> int:
+    """把旧布局中一个分片上不再属于该分片的手机号目录项移到新布局，返回移动的目录项数"""
+    moved = 0
+    last_phone = ""
+    while True:
+        async with db.get_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT phone, user_id, created_at FROM tb_user_phone WHERE phone > %s ORDER BY phone LIMIT %s",
+                    (last_phone, batch_size)
+                )
+                entries = list(await cursor.fetchall())
+        if not entries:
+            break
+        last_phone = entries[-1][0]
+
+        targets: Dict[Database, List[tuple]] = {}
+        for entry in entries:
+            target = router.current.for_phone(entry[0])
+            if target is not db:
+                targets.setdefault(target, []).append(entry)
+        for target, group in targets.items():
+            moved += len(group)
+            if dry_run:
+                continue
+            async with target.get_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(
+                        "INSERT IGNORE INTO tb_user_phone (phone, user_id, created_at) VALUES (%s, %s, %s)", group
+                    )
+            async with db.get_connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(
+                        "DELETE FROM tb_user_phone WHERE phone = %s AND user_id = %s",
+                        [(phone, user_id) for phone, user_id, _ in group]
+                    )
+    return moved
+
+
+async def main(args: argparse.Namespace):
+    if not settings.db_shards_previous:
+        raise SystemExit("DB_SHARDS_PREVIOUS is not set, nothing to reshard")
+    await init_db(minsize=1, maxsize=1)
+    start_time = time.time()
+    try:
+        total = {"scanned": 0, "moved": 0, "conflicts": 0}
+        for db in router.previous.shards:
+            stats = await reshard_users(db, args.batch_size, args.pause, args.dry_run)
+            logger.info("Shard %s: scanned=%s, moved=%s, conflicts=%s", db.shard,
+                        stats["scanned"], stats["moved"], stats["conflicts"])
+            for key, value in stats.items():
+                total[key] += value
+        directory_moved = 0
+        if router.previous.sharded:
+            for db in router.previous.shards:
+                directory_moved += await reshard_directory(db, args.batch_size, args.dry_run)
+        logger.info(
+            "%s完成: 扫描 %s 个用户, 迁移 %s 个, 冲突 %s 个, 目录项迁移 %s 个, 耗时: %.2fs",
+            "统计" if args.dry_run else "迁移", total["scanned"], total["moved"], total["conflicts"],
+            directory_moved, time.time() - start_time
+        )
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tb_user 重新分片工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="把旧布局中的用户迁移到新布局")
+    run_parser.add_argument("--batch-size", type=int, default=500, help="每批扫描的用户数")
+    run_parser.add_argument("--pause", type=float, default=0.05, help="批间休眠（秒），降低对线上请求的影响")
+    run_parser.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr
+    )
+    asyncio.run(main(parser.parse_args()))
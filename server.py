@@ -0,0 +1,109 @@
+'''
+服务启动模块
+调试模式：单进程 + 自动重载
+生产模式：多 worker 进程，优先使用 uvloop 事件循环和 httptools 解析器，
+并按 worker 数量切分 MySQL 连接预算，避免 N 个 worker 的连接池总和超过 max_connections
+'''
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from config import settings, WORKERS_ENV
+from sharding import parse_shards
+
+
+def effective_workers() -> int:
+    """实际的 worker 进程数：调试模式和使用进程内会话存储时固定为 1，未配置时取 CPU 核数"""
+    if settings.debug or settings.session_backend == "embedded":
+        return 1
+    return settings.workers if settings.workers > 0 else (os.cpu_count() or 1)
+
+
+def db_pool_size() -> int:
+    """
+    当前 worker 的 MySQL 连接池上限
+
+    Returns:
+        int: 配置了 DB_MAX_CONNECTIONS 时为预算按 worker 均分后的值（不超过 DB_POOL_MAXSIZE），否则为 DB_POOL_MAXSIZE
+    """
+    if settings.db_max_connections <= 0:
+        return settings.db_pool_maxsize
+    workers = int(os.environ.get(WORKERS_ENV, "1"))
+    return max(1, min(settings.db_pool_maxsize, settings.db_max_connections // workers))
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _prepare_metrics_dir(workers: int):
+    """多 worker 时为指标快照准备共享目录，并清理上次运行遗留的快照"""
+    if workers <= 1:
+        return
+    if not settings.metrics_dir:
+        settings.metrics_dir = os.path.join(tempfile.gettempdir(), "jusi-metrics")
+        os.environ["METRICS_DIR"] = settings.metrics_dir
+    shutil.rmtree(settings.metrics_dir, ignore_errors=True)
+    os.makedirs(settings.metrics_dir, exist_ok=True)
+
+
+def run():
+    """按配置启动 uvicorn"""
+    import uvicorn
+
+    workers = effective_workers()
+    os.environ[WORKERS_ENV] = str(workers)
+    _prepare_metrics_dir(workers)
+
+    loop = "uvloop" if _available("uvloop") else "asyncio"
+    http = "httptools" if _available("httptools") else "h11"
+    # sans-I/O 实现不为每个连接创建 keepalive 任务，心跳由 ws_manager 的时间轮统一处理
+    ws = "websockets-sansio" if _available("websockets") else "auto"
+    log_level = logging.DEBUG if settings.debug else logging.WARNING
+
+    # 启动信息直接输出到标准错误，不受日志级别影响
+    banner = [
+        f"{settings.app_name} v{settings.app_version} ({'debug' if settings.debug else 'production'})",
+        f"  listen:      {settings.bind_addr}:{settings.bind_port}",
+        f"  workers:     {workers}",
+        f"  loop/http/ws: {loop}/{http}/{ws}",
+        f"  keep-alive:  {settings.server_keep_alive}s, backlog: {settings.server_backlog}, "
+        f"limit-concurrency: {settings.server_limit_concurrency or 'unlimited'}",
+        f"  mysql pool:  {settings.db_pool_minsize}-{db_pool_size()} per worker"
+        + (f" (budget {settings.db_max_connections})" if settings.db_max_connections > 0 else ""),
+        f"  mysql shards: {len(parse_shards(settings.db_shards)) or 1}"
+        + (f" (resharding from {len(parse_shards(settings.db_shards_previous))})" if settings.db_shards_previous else ""),
+        f"  metrics dir: {settings.metrics_dir or '-'}",
+        f"  sessions:    {settings.session_backend}",
+    ]
+    if settings.rate_limit_enabled and not settings.trust_proxy_headers and any(
+            "ip" in rules for rules in settings.rate_limit_rules.values()):
+        # 部署在反向代理之后时，ip 规则会按代理的地址作用于全部客户端
+        banner.append("  rate limit:  ip rules use the peer address, set TRUST_PROXY_HEADERS=True behind a proxy")
+    if settings.fault_injection_enabled:
+        banner.append(f"  faults:      {len(settings.fault_rules)} rules (FAULT INJECTION ENABLED)")
+    print("\n".join(banner), file=sys.stderr, flush=True)
+
+    uvicorn.run(
+        "main:app",
+        host=settings.bind_addr,
+        port=settings.bind_port,
+        reload=settings.debug,
+        reload_dirs=["."] if settings.debug else None,
+        workers=None if settings.debug else workers,
+        loop=loop,
+        http=http,
+        ws=ws,
+        ws_max_size=settings.ws_max_message_size,
+        ws_ping_interval=None,
+        ws_ping_timeout=None,
+        ws_per_message_deflate=False,  # 推送的消息很短，压缩上下文每个连接要占用数百 KB 内存
+        backlog=settings.server_backlog,
+        timeout_keep_alive=settings.server_keep_alive,
+        limit_concurrency=settings.server_limit_concurrency or None,
+        timeout_graceful_shutdown=int(settings.drain_timeout_seconds),
+        log_level=log_level,
+        log_config=None,  # 不使用 uvicorn 自带的日志配置，统一经由队列输出
+    )
@@ -0,0 +1,315 @@
+'''
+会话存储模块
+login_token -> user_id 的存储接口，redis_client 中的 login_token 操作函数委托给这里选中的后端：
+1. RedisSessionStore：默认后端，login:token:<token> 保存 user_id，login:user:<user_id> 集合作为反向索引
+2. EmbeddedSessionStore：进程内存储，适用于单进程部署和测试环境，省去每次校验 token 的网络往返，也不需要 Redis：
+   - 按过期时间排序的小顶堆淘汰过期会话，每个会话的插入和淘汰都是 O(log n)；
+     刷新过期时间时直接压入新条目，旧条目在出堆时按过期时间不一致识别并跳过，堆中无效条目过多时重建
+   - 每隔 SESSION_SNAPSHOT_INTERVAL 秒（有变化时）把全部会话写入 SESSION_SNAPSHOT_PATH，启动时从快照恢复；
+     进程崩溃时最多丢失一个快照间隔内签发的会话，对应用户需要重新登录
+   - 会话只存在于当前进程，使用该后端时服务固定以单个 worker 运行
+
+过期时间使用墙上时钟（unix 秒），以便快照跨进程重启后仍然有效。
+'''
+import asyncio
+import heapq
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import settings
+from instrumentation import instrumented
+from memprof import register_cache
+
+logger = logging.getLogger(__name__)
+
+# Redis Key 前缀常量
+LOGIN_TOKEN_PREFIX = "login:token:"
+USER_TOKENS_PREFIX = "login:user:"  # user_id -> login_token 集合，用于按用户吊销会话
+
+
+class SessionStore(ABC):
+    """会话存储接口，后端未实现全部抽象方法时在实例化时报错"""
+
+    @abstractmethod
+    async def set_login_token(self, login_token: str, user_id: str, ttl: int):
+        ...
+
+    @abstractmethod
+    async def get_user_id_by_token(self, login_token: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def get_user_ids_by_tokens(self, login_tokens: List[str]) -> List[Optional[str]]:
+        ...
+
+    @abstractmethod
+    async def delete_login_token(self, login_token: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def token_exists(self, login_token: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def refresh_token_expiry(self, login_token: str, ttl: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def revoke_user_tokens(self, user_ids: List[str]) -> int:
+        ...
+
+    async def start(self):
+        """服务启动时调用"""
+
+    async def stop(self):
+        """服务关闭时调用"""
+
+
+class RedisSessionStore(SessionStore):
+    """基于 Redis 的会话存储"""
+
+    def __init__(self, redis_client):
+        self._redis = redis_client
+
+    @property
+    def _client(self):
+        if self._redis.client is None:
+            raise RuntimeError("Redis client not initialized")
+        return self._redis.client
+
+    @instrumented("redis")
+    async def set_login_token(self, login_token: str, user_id: str, ttl: int):
+        # 同时维护 user_id -> token 反向索引，集合的过期时间随最新的 token 刷新
+        user_tokens_key = f"{USER_TOKENS_PREFIX}{user_id}"
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.setex(name=f"{LOGIN_TOKEN_PREFIX}{login_token}", time=ttl, value=user_id)
+            pipe.sadd(user_tokens_key, login_token)
+            pipe.expire(user_tokens_key, ttl)
+            await pipe.execute()
+
+    @instrumented("redis")
+    async def get_user_id_by_token(self, login_token: str) -> Optional[str]:
+        return await self._client.get(f"{LOGIN_TOKEN_PREFIX}{login_token}")
+
+    @instrumented("redis")
+    async def get_user_ids_by_tokens(self, login_tokens: List[str]) -> List[Optional[str]]:
+        # 一次 MGET 完成，与 token 数无关
+        return await self._client.mget([f"{LOGIN_TOKEN_PREFIX}{login_token}" for login_token in login_tokens])
+
+    @instrumented("redis")
+    async def delete_login_token(self, login_token: str) -> bool:
+        return await self._client.delete(f"{LOGIN_TOKEN_PREFIX}{login_token}") > 0
+
+    @instrumented("redis")
+    async def token_exists(self, login_token: str) -> bool:
+        return await self._client.exists(f"{LOGIN_TOKEN_PREFIX}{login_token}") > 0
+
+    @instrumented("redis")
+    async def refresh_token_expiry(self, login_token: str, ttl: int) -> bool:
+        return bool(await self._client.expire(name=f"{LOGIN_TOKEN_PREFIX}{login_token}", time=ttl))
+
+    @instrumented("redis")
+    async def revoke_user_tokens(self, user_ids: List[str]) -> int:
+        # 两次流水线完成，与用户数无关
+        async with self._client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.smembers(f"{USER_TOKENS_PREFIX}{user_id}")
+            token_sets = await pipe.execute()
+
+        keys = [f"{USER_TOKENS_PREFIX}{user_id}" for user_id in user_ids]
+        for tokens in token_sets:
+            keys.extend(f"{LOGIN_TOKEN_PREFIX}{token}" for token in tokens)
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            await pipe.execute()
+        return sum(len(tokens) for tokens in token_sets)
+
+
+class EmbeddedSessionStore(SessionStore):
+    """进程内会话存储，只在事件循环线程中使用"""
+
+    # 每轮最多淘汰的会话数，避免大量会话同时过期时长时间占用事件循环
+    EVICT_BUDGET = 10000
+
+    def __init__(self, snapshot_path: str = "", snapshot_interval: float = 60.0):
+        self._tokens: Dict[str, Tuple[str, float]] = {}  # login_token -> (user_id, 过期时间)
+        self._user_tokens: Dict[str, Set[str]] = {}  # user_id -> login_token 集合
+        self._heap: List[Tuple[float, str]] = []  # (过期时间, login_token)，可能包含已失效的条目
+        self._snapshot_path = snapshot_path
+        self._snapshot_interval = snapshot_interval
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _push(self, expires_at: float, login_token: str):
+        heapq.heappush(self._heap, (expires_at, login_token))
+        # 无效条目超过一半时重建，堆的大小保持在会话数的常数倍以内
+        if len(self._heap) > 2 * len(self._tokens) + 1024:
+            self._heap = [(expires_at, token) for token, (_, expires_at) in self._tokens.items()]
+            heapq.heapify(self._heap)
+
+    def _remove(self, login_token: str) -> bool:
+        entry = self._tokens.pop(login_token, None)
+        if entry is None:
+            return False
+        tokens = self._user_tokens.get(entry[0])
+        if tokens is not None:
+            tokens.discard(login_token)
+            if not tokens:
+                del self._user_tokens[entry[0]]
+        self._dirty = True
+        return True
+
+    def _alive(self, login_token: str, now: float) -> Optional[Tuple[str, float]]:
+        entry = self._tokens.get(login_token)
+        if entry is not None and entry[1] <= now:
+            # 已过期但尚未被淘汰
+            self._remove(login_token)
+            return None
+        return entry
+
+    def evict_expired(self, now: Optional[float] = None, budget: int = 0) -> int:
+        """
+        淘汰已过期的会话
+
+        Args:
+            now: 当前时间，默认取 time.time()
+            budget: 最多处理的堆条目数，0 表示不限制
+
+        Returns:
+            int: 淘汰的会话数
+        """
+        now = time.time() if now is None else now
+        heap = self._heap
+        evicted = popped = 0
+        while heap and heap[0][0] <= now and (not budget or popped < budget):
+            expires_at, login_token = heapq.heappop(heap)
+            popped += 1
+            entry = self._tokens.get(login_token)
+            # 过期时间不一致说明会话已被刷新或删除，这是一个失效条目
+            if entry is not None and entry[1] == expires_at:
+                self._remove(login_token)
+                evicted += 1
+        return evicted
+
+    async def set_login_token(self, login_token: str, user_id: str, ttl: int):
+        self._remove(login_token)
+        expires_at = time.time() + ttl
+        self._tokens[login_token] = (user_id, expires_at)
+        self._user_tokens.setdefault(user_id, set()).add(login_token)
+        self._push(expires_at, login_token)
+        self._dirty = True
+
+    async def get_user_id_by_token(self, login_token: str) -> Optional[str]:
+        entry = self._alive(login_token, time.time())
+        return entry[0] if entry is not None else None
+
+    async def get_user_ids_by_tokens(self, login_tokens: List[str]) -> List[Optional[str]]:
+        now = time.time()
+        return [entry[0] if entry is not None else None
+                for entry in (self._alive(login_token, now) for login_token in login_tokens)]
+
+    async def delete_login_token(self, login_token: str) -> bool:
+        return self._remove(login_token)
+
+    async def token_exists(self, login_token: str) -> bool:
+        return self._alive(login_token, time.time()) is not None
+
+    async def refresh_token_expiry(self, login_token: str, ttl: int) -> bool:
+        now = time.time()
+        entry = self._alive(login_token, now)
+        if entry is None:
+            return False
+        self._tokens[login_token] = (entry[0], now + ttl)
+        self._push(now + ttl, login_token)
+        self._dirty = True
+        return True
+
+    async def revoke_user_tokens(self, user_ids: List[str]) -> int:
+        revoked = 0
+        for user_id in user_ids:
+            for login_token in list(self._user_tokens.get(user_id, ())):
+                revoked += self._remove(login_token)
+        return revoked
+
+    def load_snapshot(self) -> int:
+        """从快照文件恢复未过期的会话，返回恢复的会话数"""
+        try:
+            f = open(self._snapshot_path, encoding="utf-8")
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        with f:
+            for line in f:
+                login_token, _, rest = line.rstrip("\n").partition("\t")
+                user_id, _, expires_at = rest.partition("\t")
+                if not expires_at or float(expires_at) <= now:
+                    continue
+                self._tokens[login_token] = (user_id, float(expires_at))
+                self._user_tokens.setdefault(user_id, set()).add(login_token)
+        self._heap = [(expires_at, token) for token, (_, expires_at) in self._tokens.items()]
+        heapq.heapify(self._heap)
+        return len(self._tokens)
+
+    @staticmethod
+    def _write_snapshot(path: str, items: Iterable[Tuple[str, Tuple[str, float]]]):
+        """在线程中执行：写入临时文件后原子替换，崩溃时不会留下半个快照"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{token}\t{user_id}\t{expires_at:.3f}\n" for token, (user_id, expires_at) in items)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    async def save_snapshot(self):
+        """有变化时写出快照；在事件循环中只复制一份条目列表，序列化和写文件在线程中完成"""
+        if not self._snapshot_path or not self._dirty:
+            return
+        self._dirty = False
+        items = list(self._tokens.items())
+        try:
+            await asyncio.to_thread(self._write_snapshot, self._snapshot_path, items)
+        except OSError as e:
+            self._dirty = True
+            logger.warning("Failed to write session snapshot: %s", e)
+
+    async def _run(self):
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            self.evict_expired(budget=self.EVICT_BUDGET)
+            if time.monotonic() - last_snapshot >= self._snapshot_interval:
+                last_snapshot = time.monotonic()
+                await self.save_snapshot()
+
+    async def start(self):
+        if self._snapshot_path:
+            restored = await asyncio.to_thread(self.load_snapshot)
+            logger.info("Session snapshot loaded: sessions=%s", restored)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save_snapshot()
+
+
+def create_session_store(redis_client) -> SessionStore:
+    """按 SESSION_BACKEND 创建会话存储"""
+    if settings.session_backend == "embedded":
+        store = EmbeddedSessionStore(settings.session_snapshot_path, settings.session_snapshot_interval)
+        register_cache("session_store.tokens", lambda: len(store))
+        register_cache("session_store.heap", lambda: len(store._heap))
+        return store
+    return RedisSessionStore(redis_client)
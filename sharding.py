@@ -0,0 +1,128 @@
+'''
+分片路由模块
+tb_user 可以水平拆分到多个 MySQL 实例（DB_SHARDS），本模块只负责路由，不做 I/O：
+1. 用户行按 user_id 的稳定哈希路由到分片；分片部署时另有手机号目录 tb_user_phone（phone -> user_id），
+   按 phone 的哈希路由。按手机号登录先查目录再查用户行，两种访问方式都只访问单个分片
+2. 哈希使用 blake2b + 跳跃一致性哈希（jump consistent hash），与进程和 Python 版本无关；
+   在列表末尾追加分片时，只有约 新增分片数 / 新分片总数 的用户需要迁移，且只会迁往新增的分片
+3. 重新分片期间 DB_SHARDS_PREVIOUS 为旧布局：读写先访问旧布局（迁移完成前旧布局中的行是权威数据），
+   找不到时再访问新布局；新用户只写入新布局。reshard.py 把旧布局中的行迁到新布局
+
+只有一个分片的布局视为未分片：不使用手机号目录，直接按 phone 查询 tb_user，与不配置 DB_SHARDS 完全相同。
+'''
+import hashlib
+from typing import Generic, List, Optional, TypeVar
+from config import settings
+
+T = TypeVar("T")
+
+
+class ShardConfig:
+    """一个分片（某个 MySQL 实例上的一个库）的连接参数，未指定的部分取 DB_* 配置"""
+
+    __slots__ = ("host", "port", "user", "password", "db")
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, user: Optional[str] = None,
+                 password: Optional[str] = None, db: Optional[str] = None):
+        self.host = host or settings.db_host
+        self.port = port or settings.db_port
+        self.user = user or settings.db_user
+        self.password = settings.db_password if password is None else password
+        self.db = db or settings.db_name
+
+    @property
+    def key(self) -> str:
+        """分片标识，同一个库在新旧布局中出现时共用一个连接池"""
+        return f"{self.user}@{self.host}:{self.port}/{self.db}"
+
+    def __str__(self) -> str:
+        return self.key
+
+
+def parse_shards(spec: str) -> List[ShardConfig]:
+    """
+    解析分片列表
+
+    Args:
+        spec: 逗号分隔的 [user[:password]@]host[:port][/db]，例如 "10.0.0.1,10.0.0.2:3307/jusi_db"
+
+    Returns:
+        List[ShardConfig]: 分片列表，顺序即分片编号；spec 为空时返回空列表
+    """
+    shards = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        credentials, _, address = item.rpartition("@")
+        user, _, password = credentials.partition(":")
+        address, _, db = address.partition("/")
+        host, _, port = address.partition(":")
+        shards.append(ShardConfig(host, int(port) if port else None, user or None,
+                                  password if credentials and ":" in credentials else None, db or None))
+    keys = [shard.key for shard in shards]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"Duplicate shard in list: {spec}")
+    return shards
+
+
+def jump_hash(key: str, buckets: int) -> int:
+    """跳跃一致性哈希（Lamping & Veach, 2014），返回 [0, buckets) 中的分片编号"""
+    value = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        value = (value * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * (float(1 << 31) / float((value >> 33) + 1)))
+    return bucket
+
+
+class ShardLayout(Generic[T]):
+    """一组分片及其路由规则"""
+
+    def __init__(self, shards: List[T]):
+        self.shards = shards
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def _route(self, key: str) -> T:
+        return self.shards[jump_hash(key, len(self.shards))] if self.sharded else self.shards[0]
+
+    def for_user(self, user_id: str) -> T:
+        """用户行所在的分片"""
+        return self._route(f"u:{user_id}")
+
+    def for_phone(self, phone: str) -> T:
+        """手机号目录项所在的分片"""
+        return self._route(f"p:{phone}")
+
+
+class ShardRouter(Generic[T]):
+    """当前布局与重新分片期间的旧布局"""
+
+    def __init__(self, default: T):
+        self.current: ShardLayout[T] = ShardLayout([default])
+        self.previous: Optional[ShardLayout[T]] = None
+
+    @property
+    def layouts(self) -> List[ShardLayout[T]]:
+        """按访问顺序排列的布局：重新分片期间旧布局在前"""
+        return [self.current] if self.previous is None else [self.previous, self.current]
+
+    @property
+    def shards(self) -> List[T]:
+        """两个布局中的全部分片（去重）"""
+        shards: List[T] = []
+        for layout in (self.current, self.previous):
+            for shard in layout.shards if layout else ():
+                if shard not in shards:
+                    shards.append(shard)
+        return shards
+
+    def user_shards(self, user_id: str) -> List[T]:
+        """按访问顺序排列的用户行可能所在的分片（去重）"""
+        shards: List[T] = []
+        for layout in self.layouts:
+            shard = layout.for_user(user_id)
+            if shard not in shards:
+                shards.append(shard)
+        return shards
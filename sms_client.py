@@ -0,0 +1,379 @@
+'''
+短信服务客户端模块
+SMS_PROVIDER 可以配置多个短信服务商（逗号分隔），发送验证码时按各服务商近期的延迟和成功率选择：
+1. 每个服务商维护调用耗时和成功率的指数加权移动平均（EWMA），得分为 平均耗时 / 成功率，得分最低者优先；
+   尚无样本的服务商得分为 0，会先被尝试
+2. 以 SMS_EXPLORE_RATE 的概率改用其他服务商，使非首选服务商的统计保持更新
+3. 服务商不可用（超过 SMS_TIMEOUT、网络错误或服务端 5xx）时依次改用下一个服务商；超时的请求可能已经送达，
+   用户此时会收到两条验证码，以最后一次成功发送的服务商为准。服务商拒绝请求（如手机号格式错误）时直接返回错误，
+   不再经其他服务商重复发送，也不计入该服务商的失败率
+4. 验证码只能由发送它的服务商校验：发送成功后在 Redis 中记录 手机号 -> 服务商（有效期 SMS_EXPIRE_TIME），
+   校验时按记录路由，没有记录时使用列表中的第一个服务商；Redis 不可用时记录在进程内
+5. SDK 调用在每个服务商独立的有界线程池（SMS_MAX_WORKERS）中执行，SDK 和 HTTP 客户端本身也设置了超时：
+   服务商卡住时最多占满自己的线程池，不影响改用其他服务商，也不占用事件循环的默认线程池
+
+只配置一个服务商时不做路由，也不记录手机号。EWMA 在各 worker 进程内独立统计。
+
+服务商：
+    volcengine  火山引擎短信服务。SDK 导入较慢（会连带导入 requests、protobuf 等依赖），
+                在首次使用或启动预热时导入，进程内复用同一个 SmsService 实例
+    http        通用 HTTP 服务商：
+                POST SMS_HTTP_SEND_URL  {"phone", "scene", "expire_time", "try_count"}，2xx 表示发送成功
+                POST SMS_HTTP_CHECK_URL {"phone", "scene", "code"}，响应 {"result": "ok" | "wrong" | "expired"}
+                SMS_HTTP_TOKEN 非空时以 Authorization: Bearer 发送
+    fake        不发送短信，验证码固定为 SMS_FAKE_CODE，供压测使用
+
+各服务商的调用耗时记录在依赖耗时直方图中（operation 为 "<服务商>.send_code" / "<服务商>.check_code"），
+路由决策和各进程的首选服务商见 jusi_sms_routed_total、jusi_sms_preferred_provider。
+'''
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from faults import InjectedFault
+from instrumentation import instrument
+from memprof import register_cache
+from metrics import SMS_ROUTED, SMS_PREFERRED
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 校验结果
+CHECK_OK = "ok"
+CHECK_WRONG = "wrong"
+CHECK_EXPIRED = "expired"
+
+STICKY_KEY_PREFIX = "sms:provider:"
+
+
+class SmsError(Exception):
+    """服务商拒绝请求，改用其他服务商也不会成功"""
+
+
+class SmsUnavailable(SmsError):
+    """服务商不可用（超时、网络错误、服务端错误），可以改用下一个服务商"""
+
+
+# 火山引擎表示服务端故障的错误码，其余错误码视为请求被拒绝
+VOLC_UNAVAILABLE_CODES = frozenset({"InternalError", "InternalServiceError", "InternalServiceTimeout", "ServiceUnavailable"})
+
+
+class VolcengineSmsProvider:
+    """火山引擎短信服务"""
+
+    name = "volcengine"
+
+    def __init__(self):
+        self._service = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """导入 SDK 并完成初始化"""
+        if self._service is None:
+            # 预热线程与请求可能同时触发初始化，加锁保证只初始化一次
+            with self._lock:
+                if self._service is None:
+                    from volcengine.sms.SmsService import SmsService
+                    service = SmsService()
+                    service.set_ak(settings.volc_ak)
+                    service.set_sk(settings.volc_sk)
+                    # SDK 默认连接和读取超时各 5 秒，与 SMS_TIMEOUT 保持一致
+                    service.set_connection_timeout(settings.sms_timeout)
+                    service.set_socket_timeout(settings.sms_timeout)
+                    self._service = service
+        return self._service
+
+    def _request(self, action: str, params: dict) -> dict:
+        """
+        调用 SDK 的底层接口并按错误类型抛出异常
+        不使用 send_sms_verify_code 等封装方法：它们出错时会自动重试，重试由 SmsClient 的故障转移决定
+        """
+        import requests
+        try:
+            response = json.loads(self.warm_up().json(action, {}, json.dumps(params)))
+        except requests.RequestException as e:
+            raise SmsUnavailable(f"SMS {action} failed: {e!r}") from e
+        except Exception as e:
+            # 非 200 响应，SDK 以响应体作为异常消息
+            try:
+                response = json.loads(e.args[0])
+            except (IndexError, TypeError, ValueError):
+                raise SmsUnavailable(f"SMS {action} failed: {e}") from e
+        error = response.get("ResponseMetadata", {}).get("Error") if isinstance(response, dict) else None
+        if error:
+            code = error.get("Code", "未知错误")
+            error_class = SmsUnavailable if code in VOLC_UNAVAILABLE_CODES else SmsError
+            raise error_class(f"SMS {action} failed: {code}: {error.get('Message', '')}")
+        if not isinstance(response, dict):
+            raise SmsUnavailable(f"SMS {action} failed: unexpected response")
+        return response
+
+    def send_code(self, phone: str):
+        params = {
+            "SmsAccount": settings.sms_account,       # 消息组ID（验码主键之一）
+            "Sign": settings.sms_signature,           # 短信签名，巨思人工智能
+            "TemplateID": settings.sms_template_id,   # 验证码模板ID
+            "PhoneNumber": phone,                     # 接收手机号，不支持批量发送（验码主键之一）
+            "Scene": settings.sms_scene,              # 验证码使用场景（验码主键之一）
+            "ExpireTime": settings.sms_expire_time,   # 验证码有效时间，单位秒
+            "TryCount": settings.sms_try_count,       # 验证码可以尝试验证次数
+            "Tag": ""                                 # 透传字段
+        }
+        self._request("SendSmsVerifyCode", params)
+
+    def check_code(self, phone: str, code: str) -> str:
+        params = {
+            "SmsAccount": settings.sms_account,   # 消息组ID（验码主键之一）
+            "PhoneNumber": phone,                 # 接收手机号（验码主键之一）
+            "Scene": settings.sms_scene,          # 验证码使用场景（验码主键之一）
+            "Code": code                          # 待校验验证码
+        }
+        response = self._request("CheckSmsVerifyCode", params)
+        # Result："0" 校验通过，"1" 验证码不正确，"2" 验证码过期
+        return {"1": CHECK_WRONG, "2": CHECK_EXPIRED}.get(response.get("Result"), CHECK_OK)
+
+
+class HttpSmsProvider:
+    """通用 HTTP 短信服务商"""
+
+    name = "http"
+
+    def __init__(self):
+        if not settings.sms_http_send_url or not settings.sms_http_check_url:
+            raise ValueError("SMS_HTTP_SEND_URL and SMS_HTTP_CHECK_URL are required for the http SMS provider")
+        self._session = None
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """创建复用连接的 Session"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    if settings.sms_http_token:
+                        session.headers["Authorization"] = f"Bearer {settings.sms_http_token}"
+                    self._session = session
+        return self._session
+
+    def _post(self, url: str, body: dict):
+        import requests
+        try:
+            response = self.warm_up().post(url, json=body, timeout=settings.sms_timeout)
+        except requests.RequestException as e:
+            raise SmsUnavailable(f"HTTP request failed: {e!r}") from e
+        if not 200 <= response.status_code < 300:
+            # 5xx 为服务商故障，4xx 为请求被拒绝
+            error_class = SmsUnavailable if response.status_code >= 500 else SmsError
+            raise error_class(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    def send_code(self, phone: str):
+        self._post(settings.sms_http_send_url, {
+            "phone": phone,
+            "scene": settings.sms_scene,
+            "expire_time": settings.sms_expire_time,
+            "try_count": settings.sms_try_count,
+        })
+
+    def check_code(self, phone: str, code: str) -> str:
+        response = self._post(settings.sms_http_check_url, {"phone": phone, "scene": settings.sms_scene, "code": code})
+        result = response.json().get("result")
+        if result not in (CHECK_OK, CHECK_WRONG, CHECK_EXPIRED):
+            raise SmsError(f"Unexpected check result: {result}")
+        return result
+
+
+class FakeSmsProvider:
+    """假短信服务：发送总是成功，验证码固定为 SMS_FAKE_CODE"""
+
+    name = "fake"
+
+    def warm_up(self):
+        pass
+
+    def send_code(self, phone: str):
+        pass
+
+    def check_code(self, phone: str, code: str) -> str:
+        return CHECK_OK if code == settings.sms_fake_code else CHECK_WRONG
+
+
+PROVIDERS = {provider.name: provider for provider in (VolcengineSmsProvider, HttpSmsProvider, FakeSmsProvider)}
+
+
+class ProviderStats:
+    """服务商近期调用耗时与成功率的 EWMA"""
+
+    __slots__ = ("latency", "success")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.success = 1.0
+
+    def observe(self, seconds: float, ok: bool):
+        alpha = settings.sms_ewma_alpha
+        self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+        self.success += alpha * ((1.0 if ok else 0.0) - self.success)
+
+    @property
+    def score(self) -> float:
+        """越低越好"""
+        return 0.0 if self.latency is None else self.latency / max(self.success, 0.01)
+
+
+class SmsClient:
+    """按延迟和成功率在多个服务商之间路由的短信客户端"""
+
+    def __init__(self, names: List[str]):
+        unknown = [name for name in names if name not in PROVIDERS]
+        if unknown or not names or len(set(names)) != len(names):
+            raise ValueError(f"Invalid SMS_PROVIDER: {','.join(names)} (available: {', '.join(PROVIDERS)})")
+        self.providers = [PROVIDERS[name]() for name in names]
+        self._by_name = {provider.name: provider for provider in self.providers}
+        self.stats: Dict[str, ProviderStats] = {name: ProviderStats() for name in names}
+        # 每个服务商独立的线程池，卡住的服务商不会占满其他服务商和事件循环默认线程池的线程
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=settings.sms_max_workers, thread_name_prefix=f"sms-{name}")
+            for name in names
+        }
+        self.preferred = self.providers[0].name
+        # Redis 不可用时的 手机号 -> (服务商, 过期时间)，按写入顺序即过期顺序排列
+        self._local: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        SMS_PREFERRED.set(self.preferred, value=1)
+
+    @property
+    def routed(self) -> bool:
+        return len(self.providers) > 1
+
+    def warm_up(self):
+        """初始化各服务商的 SDK 或连接（同步，在线程中调用）"""
+        for provider in self.providers:
+            provider.warm_up()
+
+    def _ranked(self) -> list:
+        return sorted(self.providers, key=lambda provider: self.stats[provider.name].score)
+
+    def _observe(self, name: str, seconds: float, ok: bool):
+        self.stats[name].observe(seconds, ok)
+        preferred = self._ranked()[0].name
+        if preferred != self.preferred:
+            logger.info("SMS preferred provider changed: %s -> %s (%s)", self.preferred, preferred, {
+                name: {"latency_ms": round((stats.latency or 0) * 1000, 1), "success": round(stats.success, 3)}
+                for name, stats in self.stats.items()
+            })
+            SMS_PREFERRED.set(self.preferred, value=0)
+            SMS_PREFERRED.set(preferred, value=1)
+            self.preferred = preferred
+
+    async def _call(self, provider, operation: str, *args):
+        start = time.perf_counter()
+        ok = False
+        try:
+            async with instrument("sms", f"{provider.name}.{operation}"):
+                # 超时后尚未开始执行的调用会被取消，已在执行的调用由 SDK / HTTP 客户端的超时结束
+                call = asyncio.get_running_loop().run_in_executor(
+                    self._executors[provider.name], getattr(provider, operation), *args
+                )
+                try:
+                    result = await asyncio.wait_for(call, timeout=settings.sms_timeout)
+                except asyncio.TimeoutError:
+                    raise SmsUnavailable(f"{provider.name} did not respond within {settings.sms_timeout}s") from None
+            ok = True
+            return result
+        except SmsError as e:
+            # 请求被拒绝说明服务商可用，不计入失败率
+            ok = not isinstance(e, SmsUnavailable)
+            raise
+        finally:
+            self._observe(provider.name, time.perf_counter() - start, ok)
+
+    async def _remember(self, phone: str, name: str):
+        """记录发送验证码的服务商"""
+        if redis_client.client is not None:
+            try:
+                await redis_client.client.set(STICKY_KEY_PREFIX + phone, name, ex=settings.sms_expire_time)
+                return
+            except Exception as e:
+                logger.warning("Failed to record SMS provider in Redis: %s", e)
+        now = time.monotonic()
+        self._local.pop(phone, None)
+        self._local[phone] = (name, now + settings.sms_expire_time)
+        while self._local:
+            _, (_, expires_at) = next(iter(self._local.items()))
+            if expires_at > now:
+                break
+            self._local.popitem(last=False)
+
+    async def _sticky(self, phone: str) -> Optional[str]:
+        """发送验证码的服务商，没有记录时返回 None"""
+        if redis_client.client is not None:
+            try:
+                name = await redis_client.client.get(STICKY_KEY_PREFIX + phone)
+                if name:
+                    return name
+            except Exception as e:
+                logger.warning("Failed to look up SMS provider in Redis: %s", e)
+        entry = self._local.get(phone)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    async def send_code(self, phone: str) -> str:
+        """
+        发送验证码
+
+        Returns:
+            str: 发送成功的服务商
+
+        Raises:
+            SmsError: 服务商拒绝请求，或全部服务商都不可用（最后一个服务商的异常）
+        """
+        order = self._ranked()
+        reason = "best"
+        if self.routed and random.random() < settings.sms_explore_rate:
+            order.insert(0, order.pop(random.randrange(1, len(order))))
+            reason = "explore"
+
+        error: Optional[Exception] = None
+        for provider in order:
+            SMS_ROUTED.inc(provider.name, "send_code", reason)
+            try:
+                await self._call(provider, "send_code", phone)
+            except (SmsUnavailable, InjectedFault) as e:
+                # 只在服务商不可用时改用下一个服务商；请求被拒绝时改用其他服务商会重复发送
+                logger.warning("SMS send via %s failed: %r", provider.name, e)
+                error = e
+                reason = "failover"
+                continue
+            if self.routed:
+                await self._remember(phone, provider.name)
+            return provider.name
+        raise error
+
+    async def check_code(self, phone: str, code: str) -> str:
+        """
+        校验验证码，由发送该验证码的服务商完成
+
+        Returns:
+            str: CHECK_OK、CHECK_WRONG 或 CHECK_EXPIRED
+        """
+        provider = self._by_name.get(await self._sticky(phone)) if self.routed else None
+        reason = "sticky"
+        if provider is None:
+            provider = self.providers[0]
+            reason = "default"
+        SMS_ROUTED.inc(provider.name, "check_code", reason)
+        return await self._call(provider, "check_code", phone, code)
+
+
+# 全局短信客户端实例
+sms_client = SmsClient([name.strip() for name in settings.sms_provider.split(",") if name.strip()])
+
+register_cache("sms.local_providers", lambda: len(sms_client._local))
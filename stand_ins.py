@@ -0,0 +1,322 @@
+'''
+内存替身模块（仅用于本地压测）
+STAND_IN_BACKENDS=True 时，mysql_client / redis_client 使用这里的内存实现代替真实的 MySQL 和 Redis，
+以便在没有外部依赖的机器上压测服务本身的开销。
+
+注意：
+1. 数据只保存在当前进程内，多 worker 之间不共享，压测时应使用单 worker
+2. MemoryPool 只支持登录流程用到的 SQL 语句（包括分片部署时的手机号目录），遇到其他语句会抛出 NotImplementedError；
+   配置 DB_SHARDS 时每个分片各有一个 MemoryPool
+3. MemoryRedis 只实现了本服务用到的命令子集
+'''
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+from pymysql.err import IntegrityError
+
+
+# ========== MySQL 替身 ==========
+
+def _normalize(sql: str) -> str:
+    # 参数个数可变的 IN (%s, %s, ...) 统一为 IN (%s...)，对应的处理函数接收可变参数
+    return re.sub(r"IN \((?:%s, )*%s\)", "IN (%s...)", re.sub(r"\s+", " ", sql).strip())
+
+
+class MemoryCursor:
+    """模拟 aiomysql 游标，按语句文本分发到对应的处理函数"""
+
+    def __init__(self, table: "MemoryUserTable", as_dict: bool):
+        self._table = table
+        self._as_dict = as_dict
+        self._rows: List[Dict[str, Any]] = []
+        self.rowcount = 0
+
+    async def execute(self, sql: str, args: Tuple = ()):
+        handler = self._table.handlers.get(_normalize(sql))
+        if handler is None:
+            raise NotImplementedError(f"stand-in does not support SQL: {_normalize(sql)}")
+        self._rows, self.rowcount = handler(*args)
+        return self.rowcount
+
+    async def fetchone(self):
+        if not self._rows:
+            return None
+        row = self._rows.pop(0)
+        return row if self._as_dict else tuple(row.values())
+
+    async def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows if self._as_dict else [tuple(row.values()) for row in rows]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class MemoryConnection:
+    """模拟 aiomysql 连接"""
+
+    def __init__(self, table: "MemoryUserTable"):
+        self._table = table
+
+    def cursor(self, cursor_class=None) -> MemoryCursor:
+        # DictCursor / SSDictCursor 返回字典行，默认游标返回元组行
+        as_dict = cursor_class is not None and "Dict" in cursor_class.__name__
+        return MemoryCursor(self._table, as_dict)
+
+    async def ping(self, reconnect: bool = True):
+        return True
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+class MemoryUserTable:
+    """内存中的 tb_user 表"""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}  # user_id -> 行
+        self.phones: Dict[str, str] = {}  # phone -> user_id
+        self.directory: Dict[str, Tuple[str, int]] = {}  # tb_user_phone：phone -> (user_id, created_at)
+        self.handlers = {
+            _normalize("""
+                INSERT INTO tb_user (user_id, user_name, phone, created_at, updated_at, last_login_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """): self._insert,
+            _normalize("""
+                SELECT user_id, user_name, phone, created_at
+                FROM tb_user
+                WHERE user_id = %s AND is_active = 1
+            """): self._select_by_user_id,
+            _normalize("""
+                SELECT user_id, user_name, phone, created_at
+                FROM tb_user
+                WHERE phone = %s AND is_active = 1
+            """): self._select_by_phone,
+            _normalize("""
+                UPDATE tb_user
+                SET user_name = %s, updated_at = %s
+                WHERE user_id = %s AND is_active = 1
+            """): self._update_user_name,
+            _normalize("""
+                UPDATE tb_user
+                SET last_login_at = %s, updated_at = %s
+                WHERE user_id = %s AND is_active = 1
+            """): self._update_login_time,
+            "SELECT 1 FROM tb_user WHERE user_id = %s": self._exists,
+            _normalize("""
+                SELECT user_id, user_name, phone, created_at
+                FROM tb_user
+                WHERE user_id IN (%s) AND is_active = 1
+            """): self._select_by_user_ids,
+            "SELECT user_id FROM tb_user_phone WHERE phone = %s": self._directory_get,
+            "INSERT IGNORE INTO tb_user_phone (phone, user_id, created_at) VALUES (%s, %s, %s)": self._directory_insert,
+            "UPDATE tb_user_phone SET user_id = %s, created_at = %s "
+            "WHERE phone = %s AND user_id = %s AND created_at < %s": self._directory_replace,
+            "DELETE FROM tb_user_phone WHERE phone = %s AND user_id = %s": self._directory_delete,
+        }
+
+    @staticmethod
+    def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: row[key] for key in ("user_id", "user_name", "phone", "created_at")}
+
+    def _insert(self, user_id, user_name, phone, created_at, updated_at, last_login_at):
+        if user_id in self.rows or (phone is not None and phone in self.phones):
+            raise IntegrityError(1062, "Duplicate entry")
+        self.rows[user_id] = {
+            "user_id": user_id, "user_name": user_name, "phone": phone, "created_at": created_at,
+            "updated_at": updated_at, "last_login_at": last_login_at, "is_active": 1,
+        }
+        if phone is not None:
+            self.phones[phone] = user_id
+        return [], 1
+
+    def _select_by_user_id(self, user_id):
+        row = self.rows.get(user_id)
+        return ([self._public(row)], 1) if row and row["is_active"] else ([], 0)
+
+    def _select_by_user_ids(self, *user_ids):
+        rows = [self._public(self.rows[u]) for u in user_ids if u in self.rows and self.rows[u]["is_active"]]
+        return rows, len(rows)
+
+    def _select_by_phone(self, phone):
+        return self._select_by_user_id(self.phones.get(phone))
+
+    def _update_user_name(self, user_name, updated_at, user_id):
+        row = self.rows.get(user_id)
+        if not row or not row["is_active"]:
+            return [], 0
+        row.update(user_name=user_name, updated_at=updated_at)
+        return [], 1
+
+    def _update_login_time(self, last_login_at, updated_at, user_id):
+        row = self.rows.get(user_id)
+        if not row or not row["is_active"]:
+            return [], 0
+        row.update(last_login_at=last_login_at, updated_at=updated_at)
+        return [], 1
+
+    def _exists(self, user_id):
+        return ([{"1": 1}], 1) if user_id in self.rows else ([], 0)
+
+    def _directory_get(self, phone):
+        entry = self.directory.get(phone)
+        return ([{"user_id": entry[0]}], 1) if entry else ([], 0)
+
+    def _directory_insert(self, phone, user_id, created_at):
+        if phone in self.directory:
+            return [], 0
+        self.directory[phone] = (user_id, created_at)
+        return [], 1
+
+    def _directory_replace(self, user_id, created_at, phone, owner, cutoff):
+        entry = self.directory.get(phone)
+        if not entry or entry[0] != owner or entry[1] >= cutoff:
+            return [], 0
+        self.directory[phone] = (user_id, created_at)
+        return [], 1
+
+    def _directory_delete(self, phone, user_id):
+        entry = self.directory.get(phone)
+        if not entry or entry[0] != user_id:
+            return [], 0
+        del self.directory[phone]
+        return [], 1
+
+
+class MemoryPool:
+    """模拟 aiomysql 连接池，连接数只用于统计，不限制并发"""
+
+    def __init__(self, maxsize: int = 10):
+        self.maxsize = maxsize
+        self.table = MemoryUserTable()
+
+    @property
+    def size(self) -> int:
+        return self.maxsize
+
+    @property
+    def freesize(self) -> int:
+        return self.maxsize
+
+    @asynccontextmanager
+    async def acquire(self):
+        # 让出一次事件循环，模拟网络往返的调度点
+        await asyncio.sleep(0)
+        yield MemoryConnection(self.table)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+# ========== Redis 替身 ==========
+
+class MemoryRedis:
+    """模拟 redis.asyncio.Redis（decode_responses=True）的命令子集"""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expire_at: Dict[str, float] = {}
+
+    def _alive(self, name: str) -> bool:
+        expire_at = self._expire_at.get(name)
+        if expire_at is not None and expire_at <= monotonic():
+            self._data.pop(name, None)
+            self._expire_at.pop(name, None)
+        return name in self._data
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, name: str) -> Optional[str]:
+        return self._data[name] if self._alive(name) else None
+
+    async def mget(self, names: List[str]) -> List[Optional[str]]:
+        return [self._data[name] if self._alive(name) else None for name in names]
+
+    async def set(self, name: str, value, ex: Optional[int] = None, nx: bool = False):
+        if nx and self._alive(name):
+            return None
+        self._data[name] = str(value)
+        self._expire_at.pop(name, None)
+        if ex:
+            self._expire_at[name] = monotonic() + ex
+        return True
+
+    async def setex(self, name: str, time: int, value):
+        return await self.set(name, value, ex=time)
+
+    async def delete(self, *names: str) -> int:
+        deleted = 0
+        for name in names:
+            if self._alive(name):
+                del self._data[name]
+                self._expire_at.pop(name, None)
+                deleted += 1
+        return deleted
+
+    async def exists(self, *names: str) -> int:
+        return sum(1 for name in names if self._alive(name))
+
+    async def expire(self, name: str, time: int) -> bool:  # 参数名与 redis-py 保持一致
+        if not self._alive(name):
+            return False
+        self._expire_at[name] = monotonic() + time
+        return True
+
+    async def sadd(self, name: str, *values: str) -> int:
+        members = self._data.get(name) if self._alive(name) else None
+        if members is None:
+            members = self._data[name] = set()
+        before = len(members)
+        members.update(values)
+        return len(members) - before
+
+    async def smembers(self, name: str) -> set:
+        return set(self._data[name]) if self._alive(name) else set()
+
+    def pipeline(self, transaction: bool = True) -> "MemoryPipeline":
+        return MemoryPipeline(self)
+
+    async def close(self):
+        pass
+
+
+class MemoryPipeline:
+    """模拟流水线：记录命令，execute 时依次执行"""
+
+    def __init__(self, client: MemoryRedis):
+        self._client = client
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, command: str):
+        if not hasattr(self._client, command):
+            raise AttributeError(command)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [await getattr(self._client, command)(*args, **kwargs) for command, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
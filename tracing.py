@@ -0,0 +1,231 @@
+'''
+轻量级链路追踪模块
+1. TracingMiddleware 为每个请求创建根 span，兼容 W3C traceparent 请求头
+2. 子 span 通过 contextvars 自动挂到当前 span 下
+3. 请求入口按 TRACE_SAMPLE_RATE 做头部采样，未采样的请求不创建任何 span 对象
+4. 结束的 span 进入内存队列，由后台线程按 OTLP/JSON 格式批量写入本地文件或发送到采集器
+'''
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import settings, WORKERS_ENV
+from log_config import bind_log_context
+from memprof import register_cache
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = b"traceparent"
+
+# 当前 span，未采样时为 None
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一次操作的耗时记录"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, kind: int = 3):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind  # OTLP SpanKind：2 SERVER，3 CLIENT
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.error = False
+
+    def to_otlp(self) -> dict:
+        """转换为 OTLP/JSON 格式的 span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2 if self.error else 1},  # ERROR / OK
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def start_span(name: str) -> Optional[contextvars.Token]:
+    """在当前 span 下开启子 span；当前请求未被采样时直接返回 None"""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return _current_span.set(Span(name, parent.trace_id, parent.span_id))
+
+
+def end_span(token: Optional[contextvars.Token], error: bool = False):
+    """结束由 start_span 开启的 span 并提交导出"""
+    if token is None:
+        return
+    span = _current_span.get()
+    _current_span.reset(token)
+    span.end_ns = time.time_ns()
+    span.error = error
+    exporter.submit(span)
+
+
+def set_span_attributes(**attributes):
+    """为当前 span 设置属性"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def _parse_traceparent(value: bytes):
+    """解析 W3C traceparent 请求头，返回 (trace_id, parent_id, sampled)"""
+    try:
+        _, trace_id, parent_id, flags = value.decode("latin-1").split("-")
+        if len(trace_id) == 32 and len(parent_id) == 16:
+            return trace_id, parent_id, int(flags, 16) & 1 == 1
+    except ValueError:
+        pass
+    return None
+
+
+class TracingMiddleware:
+    """为每个被采样的请求创建根 span（纯 ASGI 实现）"""
+
+    def __init__(self, app: ASGIApp, sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = None, None, False
+        for key, value in scope.get("headers", []):
+            if key == TRACEPARENT_HEADER:
+                parsed = _parse_traceparent(value)
+                if parsed:
+                    trace_id, parent_id, sampled = parsed
+                break
+        if trace_id is None:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        root = Span(f"{scope['method']} {scope['path']}", trace_id or f"{random.getrandbits(128):032x}", parent_id, kind=2)
+        token = _current_span.set(root)
+        bind_log_context(trace_id=root.trace_id)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            root.error = True
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end_ns = time.time_ns()
+            exporter.submit(root)
+
+
+class SpanExporter:
+    """后台线程批量导出 span，队列满时直接丢弃，不阻塞请求"""
+
+    def __init__(self, max_queue_size: int = 10000, batch_size: int = 512, flush_interval: float = 1.0):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._path = ""
+        self.dropped = 0
+
+    def submit(self, span: Span):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None and (settings.trace_export_path or settings.trace_otlp_endpoint):
+            self._path = settings.trace_export_path
+            # 多 worker 时每个进程写入独立的文件，避免并发追加导致行交错
+            if self._path and int(os.environ.get(WORKERS_ENV, "1")) > 1:
+                self._path = f"{self._path}.{os.getpid()}"
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """停止导出线程并写出剩余的 span"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            batch: List[Span] = []
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        payload = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": settings.app_name}},
+                    {"key": "service.version", "value": {"stringValue": settings.app_version}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "jusi.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+            }]
+        }, ensure_ascii=False, separators=(",", ":"))
+        try:
+            if self._path:
+                with open(self._path, "a", encoding="utf-8") as f:
+                    f.write(payload + "\n")
+            if settings.trace_otlp_endpoint:
+                request = urllib.request.Request(
+                    settings.trace_otlp_endpoint,
+                    data=payload.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST"
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning("Failed to export %s spans: %s", len(batch), e)
+
+
+# 全局导出器实例
+exporter = SpanExporter()
+register_cache("tracing.span_queue", lambda: exporter._queue.qsize())
@@ -0,0 +1,179 @@
+'''
+用户数据批量导出/导入工具
+用于数据迁移以及压测环境的用户数据灌入
+
+用法示例：
+    python user_tool.py export --format ndjson --output users.ndjson
+    python user_tool.py export --format csv > users.csv
+    python user_tool.py import --input users.ndjson --batch-size 5000 --concurrency 4
+'''
+import argparse
+import asyncio
+import csv
+import logging
+import sys
+import time
+from typing import Iterator, List, TextIO
+from models import UserRecord
+from mysql_client import init_db, close_db, iter_users, bulk_create_users
+
+logger = logging.getLogger(__name__)
+
+# 导出/导入的字段，与 UserRecord 保持一致（login_token 存储在 Redis 中，不参与导出）
+USER_FIELDS = ["user_id", "user_name", "phone", "created_at", "updated_at", "last_login_at", "is_active"]
+# CSV 中以空字符串表示 None 的字段
+NULLABLE_FIELDS = ("phone", "updated_at", "last_login_at")
+
+
+def _open_output(path: str) -> TextIO:
+    """打开输出文件，"-" 表示标准输出"""
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def _open_input(path: str) -> TextIO:
+    """打开输入文件，"-" 表示标准输入"""
+    if path == "-":
+        return sys.stdin
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _read_users(stream: TextIO, fmt: str) -> Iterator[UserRecord]:
+    """逐行解析输入流为 UserRecord 对象，旧版本导出的文件（只有前四个字段）同样可以导入"""
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            # CSV 中的空值还原为 None，缺少的列取默认值
+            for field in NULLABLE_FIELDS:
+                row[field] = row.get(field) or None
+            if not row.get("is_active"):
+                row.pop("is_active", None)
+            yield UserRecord(**row)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield UserRecord.model_validate_json(line)
+
+
+async def export_users(output: str, fmt: str, fetch_size: int) -> int:
+    """
+    流式导出用户表（包括已停用的用户和全部业务列，导入后与原表一致）
+
+    Args:
+        output: 输出文件路径
+        fmt: 输出格式，ndjson 或 csv
+        fetch_size: 每次从服务端拉取的行数
+
+    Returns:
+        int: 导出的用户数
+    """
+    count = 0
+    stream = _open_output(output)
+    try:
+        if fmt == "csv":
+            writer = csv.writer(stream)
+            writer.writerow(USER_FIELDS)
+            async for user in iter_users(fetch_size):
+                # None 写为空字符串
+                writer.writerow([getattr(user, field) for field in USER_FIELDS])
+                count += 1
+        else:
+            async for user in iter_users(fetch_size):
+                stream.write(user.model_dump_json(include=set(USER_FIELDS)))
+                stream.write("\n")
+                count += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        else:
+            stream.flush()
+    return count
+
+
+async def import_users(input_path: str, fmt: str, batch_size: int, concurrency: int) -> int:
+    """
+    批量导入用户，读取与写入并发进行，内存中最多同时保留 2 * concurrency 个批次
+    任一写入任务出错时取消读取和其余写入任务并抛出错误，不会因队列已满而一直等待
+
+    Args:
+        input_path: 输入文件路径
+        fmt: 输入格式，ndjson 或 csv
+        batch_size: 每条多行 INSERT 语句包含的用户数
+        concurrency: 并发写入的连接数
+
+    Returns:
+        int: 实际插入的用户数
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    inserted = 0
+
+    async def writer():
+        nonlocal inserted
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            inserted += await bulk_create_users(batch)
+
+    stream = _open_input(input_path)
+    try:
+        # 写入任务出错时 TaskGroup 取消当前任务（阻塞在 queue.put 上的读取）和其余写入任务
+        async with asyncio.TaskGroup() as group:
+            for _ in range(concurrency):
+                group.create_task(writer())
+            batch: List[UserRecord] = []
+            for user in _read_users(stream, fmt):
+                batch.append(user)
+                if len(batch) >= batch_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            for _ in range(concurrency):
+                await queue.put(None)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return inserted
+
+
+async def main(args: argparse.Namespace):
+    # 导入时每个并发写入任务占用一个连接
+    pool_size = args.concurrency if args.command == "import" else 1
+    await init_db(minsize=1, maxsize=pool_size)
+    start_time = time.time()
+    try:
+        if args.command == "export":
+            count = await export_users(args.output, args.format, args.fetch_size)
+            logger.info("导出完成: %s 个用户, 耗时: %.2fs", count, time.time() - start_time)
+        else:
+            count = await import_users(args.input, args.format, args.batch_size, args.concurrency)
+            logger.info("导入完成: %s 个用户, 耗时: %.2fs", count, time.time() - start_time)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tb_user 批量导出/导入工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="流式导出用户表")
+    export_parser.add_argument("--output", default="-", help="输出文件路径，默认标准输出")
+    export_parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export_parser.add_argument("--fetch-size", type=int, default=1000, help="每次从服务端拉取的行数")
+
+    import_parser = subparsers.add_parser("import", help="批量导入用户")
+    import_parser.add_argument("--input", default="-", help="输入文件路径，默认标准输入")
+    import_parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="每条多行 INSERT 语句包含的用户数")
+    import_parser.add_argument("--concurrency", type=int, default=4, help="并发写入的连接数")
+
+    # 日志输出到 stderr，避免与导出到标准输出的数据混在一起
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+'''
+启动预热模块
+在就绪探针返回可用之前完成首个请求才会触发的初始化，避免冷启动后的前几个请求变慢：
+1. 在后台线程中导入火山引擎短信 SDK 并创建客户端
+2. 对请求/响应模型各执行一次校验和序列化，并生成 OpenAPI 文档
+3. 预先建立 MySQL / Redis 连接
+4. 生成一次 RTS 令牌，预热 hmac / base64 等路径
+'''
+import asyncio
+import logging
+import time
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from config import settings
+from models import (
+    RequestModel,
+    ResponseModel,
+    LoginReturn,
+    SetAppInfoReturn,
+    SetAppInfoRequest,
+    ChangeUserNameRequest,
+    SendSmsVerifyCodeRequest,
+    SmsVerifyCodeLoginRequest,
+    EventName
+)
+from utils import generate_wildcard_token, parse_content
+from sms_client import sms_client
+from mysql_client import Database, router
+from redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_models():
+    """对每个模型执行一次校验和序列化"""
+    request = RequestModel.model_validate_json(
+        '{"event_name": "changeUserName", "content": "{\\"user_name\\": \\"warmup\\", \\"login_token\\": \\"warmup\\"}"}'
+    )
+    content = parse_content(request.content)
+    ChangeUserNameRequest(**content)
+    SendSmsVerifyCodeRequest(phone="13800000000")
+    SmsVerifyCodeLoginRequest(phone="13800000000", code="000000")
+    SetAppInfoRequest(login_token="warmup", app_id="warmup", app_key="", volc_ak="", volc_sk="")
+    for event_name in EventName:
+        RequestModel(event_name=event_name, content="{}")
+
+    responses = [
+        ResponseModel(),
+        LoginReturn(response={"user_id": "warmup", "user_name": "warmup", "created_at": 0}),
+        SetAppInfoReturn(response={"app_id": "warmup"}),
+    ]
+    for response in responses:
+        jsonable_encoder(response)
+        response.model_dump_json()
+
+
+async def _warm_pool(db: Database, count: int):
+    """并发借出 count 个连接，使连接池预先建立连接"""
+    if db.pool is None:
+        return
+    count = min(count, db.pool.maxsize)
+
+    async def hold(release: asyncio.Event):
+        async with db.get_connection():
+            await release.wait()
+
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(release)) for _ in range(count)]
+    try:
+        # 等所有连接都借出后再统一归还，否则会反复复用同一个连接
+        while db.pool.size < count and not any(task.done() for task in tasks):
+            await asyncio.sleep(0.01)
+    finally:
+        release.set()
+    await asyncio.gather(*tasks)
+
+
+async def _warm_mysql(count: int):
+    """为每个分片的连接池预先建立 count 个连接"""
+    await asyncio.gather(*(_warm_pool(db, count) for db in router.shards))
+
+
+async def _warm_redis(count: int):
+    """并发执行 count 个 PING，使连接池预先建立连接"""
+    if redis_client.client is None:
+        return
+    await asyncio.gather(*(redis_client.client.ping() for _ in range(count)))
+
+
+async def warm_up(app: FastAPI):
+    """执行启动预热，失败只记录警告，不阻止服务启动"""
+    start = time.perf_counter()
+    # 短信 SDK 导入是同步的，放到线程中与其余预热并行
+    sms_task = asyncio.create_task(asyncio.to_thread(sms_client.warm_up))
+
+    steps = [
+        ("models", _warm_models),
+        ("openapi", app.openapi),
+        ("rts_token", lambda: generate_wildcard_token("warmup")),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+
+    for name, step in (("mysql", _warm_mysql), ("redis", _warm_redis)):
+        try:
+            await asyncio.wait_for(step(settings.warmup_connections), timeout=settings.health_check_timeout)
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+
+    try:
+        await sms_task
+    except Exception as e:
+        logger.warning("Warm-up step sms failed: %s", e)
+
+    logger.info("启动预热完成，耗时 %.3fs", time.perf_counter() - start)
@@ -0,0 +1,275 @@
+'''
+WebSocket 连接管理模块
+客户端通过 /api/v1/ws?login_token=... 建立长连接，服务端向其推送会话事件：
+    {"event": "forcedLogout", "reason": ...}       会话已被吊销，推送后服务端关闭连接
+    {"event": "userNameChanged", "user_name": ...}  用户名已修改
+    {"event": "ping"}                               心跳，客户端收到后需回复任意消息（如 {"event": "pong"}）
+
+为了让单个 worker 承载大量空闲连接：
+1. 连接状态保存在带 __slots__ 的 Connection 对象中，收到客户端消息时只更新 last_seen
+2. 心跳与超时由一个哈希时间轮统一驱动，每个连接在时间轮上只占一个槽位；
+   后台任务每 WS_WHEEL_TICK 秒处理一个槽，按 last_seen 决定顺延、发送心跳或断开，
+   不为每个连接创建定时任务或 sleep
+3. 推送的消息只编码一次，再逐个连接写出；写出阻塞超过 WS_SEND_TIMEOUT 的连接直接断开
+'''
+import asyncio
+import itertools
+import json
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from fastapi import APIRouter, WebSocket
+from config import settings
+from health import health
+from metrics import WS_CONNECTIONS, WS_PUSHED, WS_DISCONNECTS
+from memprof import register_cache
+from redis_client import get_user_id_by_token
+
+logger = logging.getLogger(__name__)
+
+PING_MESSAGE = json.dumps({"event": "ping"})
+
+# 时间轮每格最多同时进行的心跳写出和关闭数
+HEARTBEAT_CONCURRENCY = 256
+
+# 应用自定义的关闭码
+CLOSE_UNAUTHORIZED = 4401  # login_token 无效
+CLOSE_HEARTBEAT_TIMEOUT = 4408  # 心跳超时
+CLOSE_FORCED_LOGOUT = 4409  # 会话被吊销
+CLOSE_SEND_TIMEOUT = 4429  # 客户端接收过慢
+
+
+class Connection:
+    """单个 WebSocket 连接的状态"""
+
+    __slots__ = ("connection_id", "user_id", "websocket", "last_seen", "slot")
+
+    def __init__(self, connection_id: int, user_id: str, websocket: WebSocket):
+        self.connection_id = connection_id
+        self.user_id = user_id
+        self.websocket = websocket
+        self.last_seen = time.monotonic()  # 最近一次收到客户端消息的时间
+        self.slot = -1  # 在时间轮中的槽位，-1 表示不在时间轮中
+
+
+class TimingWheel:
+    """哈希时间轮，槽数覆盖最长的延迟，因此不需要记录圈数"""
+
+    def __init__(self, tick: float, max_delay: float):
+        self.tick = tick
+        self.slots: List[Set[Connection]] = [set() for _ in range(math.ceil(max_delay / tick) + 2)]
+        self.cursor = 0
+
+    def schedule(self, connection: Connection, delay: float):
+        """把连接放到 delay 秒之后（向上取整到 tick）的槽中"""
+        ticks = min(len(self.slots) - 1, max(1, math.ceil(delay / self.tick)))
+        connection.slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[connection.slot].add(connection)
+
+    def cancel(self, connection: Connection):
+        if connection.slot >= 0:
+            self.slots[connection.slot].discard(connection)
+            connection.slot = -1
+
+    def advance(self) -> Set[Connection]:
+        """前进一格，返回到期的连接"""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due = self.slots[self.cursor]
+        self.slots[self.cursor] = set()
+        for connection in due:
+            connection.slot = -1
+        return due
+
+
+class ConnectionManager:
+    """WebSocket 连接管理，只在事件循环线程中使用"""
+
+    def __init__(self):
+        self.active_connections: Dict[int, Connection] = {}
+        self._users: Dict[str, Set[Connection]] = {}  # user_id -> 该用户的连接
+        self._ids = itertools.count(1)
+        self._wheel = TimingWheel(
+            settings.ws_wheel_tick, max(settings.ws_heartbeat_interval, settings.ws_heartbeat_timeout)
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        # 用户在本进程的第一个连接建立 / 最后一个连接断开时回调 (user_id, online)，供 fanout 维护在线状态
+        self.presence_listener: Optional[Callable[[str, bool], None]] = None
+
+    def connect(self, websocket: WebSocket, user_id: str) -> Connection:
+        """登记已接受的连接"""
+        connection = Connection(next(self._ids), user_id, websocket)
+        self.active_connections[connection.connection_id] = connection
+        connections = self._users.get(user_id)
+        if connections is None:
+            connections = self._users[user_id] = set()
+            if self.presence_listener is not None:
+                self.presence_listener(user_id, True)
+        connections.add(connection)
+        self._wheel.schedule(connection, settings.ws_heartbeat_interval)
+        WS_CONNECTIONS.set(value=len(self.active_connections))
+        return connection
+
+    def remove(self, connection: Connection) -> bool:
+        """注销连接，返回连接此前是否仍处于登记状态"""
+        if self.active_connections.pop(connection.connection_id, None) is None:
+            return False
+        connections = self._users.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._users[connection.user_id]
+                if self.presence_listener is not None:
+                    self.presence_listener(connection.user_id, False)
+        self._wheel.cancel(connection)
+        WS_CONNECTIONS.set(value=len(self.active_connections))
+        return True
+
+    async def disconnect(self, connection_id: int, reason: str = "", code: int = 1001):
+        """注销并关闭连接"""
+        connection = self.active_connections.get(connection_id)
+        if connection is None or not self.remove(connection):
+            return
+        WS_DISCONNECTS.inc(str(code))
+        try:
+            async with asyncio.timeout(settings.ws_send_timeout):
+                await connection.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            logger.debug("Failed to close websocket %s: %s", connection_id, e)
+
+    async def _send(self, connection: Connection, text: str) -> bool:
+        try:
+            async with asyncio.timeout(settings.ws_send_timeout):
+                await connection.websocket.send_text(text)
+            return True
+        except TimeoutError:
+            await self.disconnect(connection.connection_id, "send timeout", CLOSE_SEND_TIMEOUT)
+        except Exception:
+            # 客户端已断开，接收循环会负责注销
+            self.remove(connection)
+        return False
+
+    def online_users(self) -> List[str]:
+        """在本进程中有连接的用户"""
+        return list(self._users)
+
+    def connections_of(self, user_ids: Iterable[str]) -> List[Connection]:
+        """指定用户在本进程中的全部连接"""
+        return [
+            connection
+            for user_id in user_ids
+            for connection in self._users.get(user_id, ())
+        ]
+
+    def deliver(self, user_ids: Iterable[str], message: dict, close_code: Optional[int] = None) -> int:
+        """
+        向用户在本进程中的全部连接推送消息，在后台写出，不阻塞调用方
+
+        Args:
+            user_ids: 用户ID列表
+            message: 消息，event 字段为事件名
+            close_code: 推送后以该关闭码关闭连接，None 表示保持连接
+
+        Returns:
+            int: 推送的连接数
+        """
+        connections = self.connections_of(user_ids)
+        if not connections:
+            return 0
+        text = json.dumps(message, ensure_ascii=False)
+        WS_PUSHED.inc(message["event"], value=len(connections))
+        self._spawn(self._deliver(connections, text, close_code))
+        return len(connections)
+
+    def _spawn(self, coro):
+        """在后台运行写出任务，保留引用直到完成"""
+        task = asyncio.create_task(coro)
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, connections: List[Connection], text: str, close_code: Optional[int]):
+        for connection in connections:
+            if await self._send(connection, text) and close_code is not None:
+                await self.disconnect(connection.connection_id, "", close_code)
+
+    async def _heartbeat(self, ping: List[Connection], expired: List[Connection]):
+        """并发发送心跳并关闭超时的连接，单个客户端接收过慢不影响其他连接"""
+        semaphore = asyncio.Semaphore(HEARTBEAT_CONCURRENCY)
+
+        async def bounded(coro):
+            async with semaphore:
+                await coro
+
+        await asyncio.gather(
+            *(bounded(self._send(connection, PING_MESSAGE)) for connection in ping),
+            *(bounded(self.disconnect(connection.connection_id, "heartbeat timeout", CLOSE_HEARTBEAT_TIMEOUT))
+              for connection in expired),
+            return_exceptions=True
+        )
+
+    async def _run(self):
+        interval = settings.ws_heartbeat_interval
+        timeout = settings.ws_heartbeat_timeout
+        next_tick = time.monotonic() + self._wheel.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            next_tick += self._wheel.tick
+            now = time.monotonic()
+            ping, expired = [], []
+            for connection in self._wheel.advance():
+                idle = now - connection.last_seen
+                if idle >= timeout:
+                    expired.append(connection)
+                elif idle >= interval:
+                    # 空闲时间达到心跳间隔：发送心跳，在超时时刻再检查一次
+                    ping.append(connection)
+                    self._wheel.schedule(connection, connection.last_seen + timeout - now)
+                else:
+                    # 期间收到过消息：顺延到下一个心跳时刻
+                    self._wheel.schedule(connection, connection.last_seen + interval - now)
+            # 写出在后台进行，每次写出最多等待 ws_send_timeout，不能推迟时间轮的下一格
+            if ping or expired:
+                self._spawn(self._heartbeat(ping, expired))
+
+    async def start_heartbeat_monitor(self):
+        """启动时间轮任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop_heartbeat_monitor(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局连接管理实例
+manager = ConnectionManager()
+register_cache("ws.connections", lambda: len(manager.active_connections))
+register_cache("ws.users", lambda: len(manager._users))
+
+ws_router = APIRouter()
+
+
+@ws_router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, login_token: str = ""):
+    user_id = await get_user_id_by_token(login_token) if login_token else None
+    if user_id is None or health.draining:
+        # 在握手完成前关闭，客户端收到 HTTP 403
+        await websocket.close(code=CLOSE_UNAUTHORIZED if user_id is None else 1013)
+        return
+    await websocket.accept()
+    connection = manager.connect(websocket, user_id)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            # 任意客户端消息都视为心跳回复，消息内容不做处理
+            connection.last_seen = time.monotonic()
+    finally:
+        manager.remove(connection)